@@ -1,15 +1,16 @@
 from __future__ import annotations
 
+import os
 from datetime import date, timedelta
 
 import numpy as np
 import streamlit as st
 from PIL import Image
 
-from disease_model import predict_leaf_disease
+from disease_model import predict_leaf_disease, preload_models
 from fertilizer_logic import SoilCard, recommend_fertilizer
 from weather import fetch_open_meteo_daily, get_location_from_ip
-from yield_model import predict_yield
+from yield_model import predict_yield, preload_yield_model, yield_model_report
 from ocr_utils import extract_soil_values
 
 
@@ -36,6 +37,17 @@ def _season_one_hot(season: str) -> dict[str, float]:
 
 st.set_page_config(page_title="Tomato AI Guidance System", layout="wide")
 
+
+@st.cache_resource
+def _preload_models() -> None:
+    # Runs once per process, so the first click doesn't pay for model loading
+    preload_models()
+    preload_yield_model()
+
+
+if os.getenv("PRELOAD_MODELS", "false").lower() == "true":
+    _preload_models()
+
 # Enhanced Green Theme for Agritech
 st.markdown("""
 <style>
@@ -441,6 +453,13 @@ def show_yield_prediction():
             st.caption(f"Underlying value: {pred.value:.2f} {pred.units or ''}".strip())
         if pred.note:
             st.info(pred.note)
+        report = yield_model_report()
+        if report:
+            st.caption(
+                f"Model loaded in {report['load_seconds']:.2f}s"
+                + (f", {report['size_mb']:.1f} MB" if report["size_mb"] is not None else "")
+                + (" (memory-mapped, shared between processes)" if report["memory_mapped"] else "")
+            )
 
 def show_fertilizer_recommendation():
     st.subheader("Fertilizer & Bio-fertilizer Recommendation")
@@ -7,6 +7,7 @@ from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from .database import get_db
 from .models import User
+from .metrics import stage
 import os
 
 # Security configuration
@@ -57,17 +58,12 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token = credentials.credentials
-    payload = decode_token(token)
+    with stage("auth"):
+        token = credentials.credentials
+        payload = decode_token(token)
+        username: str = payload.get("sub") if payload is not None else None
+        user = db.query(User).filter(User.username == username).first() if username is not None else None
     
-    if payload is None:
-        raise credentials_exception
-    
-    username: str = payload.get("sub")
-    if username is None:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
     if user is None:
         raise credentials_exception
     
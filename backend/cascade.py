@@ -0,0 +1,259 @@
+"""
+Confidence-gated cascade for the disease CNN.
+
+A small student model classifies every image first. Its answer is kept
+unless its top probability is below `DISEASE_CASCADE_THRESHOLD` or it
+predicts a class on `DISEASE_CASCADE_WATCHLIST` (diseases where a wrong
+"all clear" is costly); those images are escalated to the full model.
+
+Run as a script to see the accuracy/latency trade-off on a labelled
+validation directory (one sub-folder per class) before picking a threshold:
+
+    python -m backend.cascade --samples path/to/val --thresholds 0.6 0.8 0.9 0.95
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import logging
+import numpy as np
+from typing import Any, Dict, Sequence, Tuple
+
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Cascade settings
+DISEASE_CASCADE = os.getenv("DISEASE_CASCADE", "false").lower() == "true"
+DISEASE_CASCADE_THRESHOLD = float(os.getenv("DISEASE_CASCADE_THRESHOLD", "0.9"))
+DISEASE_CASCADE_WATCHLIST = [
+    name.strip() for name in os.getenv("DISEASE_CASCADE_WATCHLIST", "Late_blight,Spotted Wilt Virus").split(",")
+    if name.strip()
+]
+DISEASE_CASCADE_LOG_EVERY = int(os.getenv("DISEASE_CASCADE_LOG_EVERY", "500"))  # images between rate logs
+
+CASCADE_DECISIONS = REGISTRY.counter(
+    "tomato_disease_cascade_total", "Cascade decisions per image (accepted or escalated, and why)", ("outcome",)
+)
+
+
+class DiseaseCascade:
+    """Escalation policy plus running escalation-rate statistics."""
+
+    def __init__(
+        self,
+        class_names: Sequence[str],
+        threshold: float = DISEASE_CASCADE_THRESHOLD,
+        watchlist: Sequence[str] = DISEASE_CASCADE_WATCHLIST,
+        log_every: int = DISEASE_CASCADE_LOG_EVERY,
+    ):
+        unknown = set(watchlist) - set(class_names)
+        if unknown:
+            raise ValueError(f"Unknown watchlist classes {sorted(unknown)} (expected some of {list(class_names)})")
+        self.threshold = threshold
+        self.watchlist = list(watchlist)
+        self._watch = np.isin(np.arange(len(class_names)), [list(class_names).index(n) for n in watchlist])
+        self.log_every = max(1, log_every)
+        self._lock = threading.Lock()
+        self.images = 0
+        self.low_confidence = 0
+        self.watchlisted = 0
+
+    def escalate(self, probs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Which student predictions go to the full model.
+
+        Returns (escalate mask, watchlist mask); an image can be both
+        below the threshold and on the watchlist.
+        """
+        probs = np.asarray(probs)
+        low = probs.max(axis=1) < self.threshold
+        watched = self._watch[probs.argmax(axis=1)]
+        return low | watched, watched
+
+    def record(self, escalated: np.ndarray, watched: np.ndarray):
+        """Count one batch's decisions and log the running rate now and then."""
+        n = len(escalated)
+        n_watched = int(watched.sum())
+        n_low = int((escalated & ~watched).sum())
+        CASCADE_DECISIONS.inc(n - n_low - n_watched, outcome="accepted")
+        CASCADE_DECISIONS.inc(n_low, outcome="escalated_low_confidence")
+        CASCADE_DECISIONS.inc(n_watched, outcome="escalated_watchlist")
+
+        with self._lock:
+            before = self.images
+            self.images += n
+            self.low_confidence += n_low
+            self.watchlisted += n_watched
+            should_log = before // self.log_every != self.images // self.log_every
+        if should_log:
+            stats = self.stats()
+            logger.info(
+                f"Disease cascade: {stats['escalation_rate']:.1%} of {stats['images']} images escalated "
+                f"({stats['low_confidence']} low confidence, {stats['watchlisted']} watchlist)"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        escalated = self.low_confidence + self.watchlisted
+        return {
+            "threshold": self.threshold,
+            "watchlist": self.watchlist,
+            "images": self.images,
+            "escalated": escalated,
+            "low_confidence": self.low_confidence,
+            "watchlisted": self.watchlisted,
+            "escalation_rate": escalated / self.images if self.images else 0.0,
+        }
+
+
+# -- Offline evaluation ----------------------------------------------------------
+
+def load_labelled_samples(sample_dir: str, class_names: Sequence[str], limit: int, size=(224, 224)) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Images and labels from a directory with one sub-folder per class.
+
+    Folders are matched to `class_names` by name; others are skipped.
+    """
+    from .parity import IMAGE_EXTENSIONS
+    from .preprocessing import preprocess_image
+
+    paths, labels = [], []
+    for name in sorted(os.listdir(sample_dir)):
+        if not os.path.isdir(os.path.join(sample_dir, name)):
+            continue
+        if name not in class_names:
+            print(f"Skipping {name}/: not one of the model's classes")
+            continue
+        label = list(class_names).index(name)
+        for root, _, files in os.walk(os.path.join(sample_dir, name)):
+            for f in sorted(files):
+                if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS:
+                    paths.append(os.path.join(root, f))
+                    labels.append(label)
+
+    # Spread the sample across class folders rather than taking the first one
+    if len(paths) > limit:
+        keep = np.linspace(0, len(paths) - 1, limit).astype(int)
+        paths, labels = [paths[i] for i in keep], [labels[i] for i in keep]
+
+    batch = np.empty((len(paths), *size, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        preprocess_image(path, size, out=batch[i])
+    return batch, np.asarray(labels, dtype=np.int64)
+
+
+def _per_image_ms(model, samples: np.ndarray, repeats: int) -> float:
+    """Median single-image latency, as interactive requests see it."""
+    model.predict(samples[:1])  # warm-up
+    timings = []
+    for i in range(repeats):
+        image = samples[i % len(samples)][None]
+        start = time.perf_counter()
+        model.predict(image)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+def evaluate(
+    teacher_probs: np.ndarray,
+    student_probs: np.ndarray,
+    labels: np.ndarray,
+    class_names: Sequence[str],
+    thresholds: Sequence[float],
+    watchlist: Sequence[str],
+    teacher_ms: float,
+    student_ms: float,
+) -> Dict[str, Any]:
+    """Accuracy, escalation rate and expected latency of the cascade at each threshold."""
+    teacher_pred = teacher_probs.argmax(1)
+    student_pred = student_probs.argmax(1)
+    rows = []
+    for threshold in thresholds:
+        cascade = DiseaseCascade(class_names, threshold, watchlist)
+        escalated, _ = cascade.escalate(student_probs)
+        pred = np.where(escalated, teacher_pred, student_pred)
+        rate = float(escalated.mean())
+        latency = student_ms + rate * teacher_ms
+        rows.append({
+            "threshold": threshold,
+            "accuracy": float(np.mean(pred == labels)),
+            "agreement_with_full_model": float(np.mean(pred == teacher_pred)),
+            "escalation_rate": rate,
+            "expected_ms_per_image": latency,
+            "speedup": teacher_ms / latency if latency else None,
+        })
+    return {
+        "samples": int(len(labels)),
+        "watchlist": list(watchlist),
+        "full_model": {"accuracy": float(np.mean(teacher_pred == labels)), "ms_per_image": teacher_ms},
+        "student": {"accuracy": float(np.mean(student_pred == labels)), "ms_per_image": student_ms},
+        "cascade": rows,
+    }
+
+
+def _print_table(report: Dict[str, Any]):
+    print(f"\nCascade report on {report['samples']} images (watchlist: {', '.join(report['watchlist']) or 'none'})")
+    print(f"full model: accuracy {report['full_model']['accuracy']:.3f}, {report['full_model']['ms_per_image']:.1f} ms/image")
+    print(f"student:    accuracy {report['student']['accuracy']:.3f}, {report['student']['ms_per_image']:.1f} ms/image")
+    print(f"{'threshold':>9} {'accuracy':>9} {'agree':>7} {'escalated':>10} {'ms/image':>9} {'speedup':>8}")
+    for row in report["cascade"]:
+        print(
+            f"{row['threshold']:>9.2f} {row['accuracy']:>9.3f} {row['agreement_with_full_model']:>7.3f} "
+            f"{row['escalation_rate']:>10.1%} {row['expected_ms_per_image']:>9.1f} {row['speedup'] or 0:>7.2f}x"
+        )
+
+
+def main():
+    from .inference_backends import BACKENDS, BACKEND_ARTIFACTS, STUDENT_ARTIFACTS
+    from .parity import DEFAULT_SAMPLES, DEFAULT_MODELS_DIR
+    from .ml_service import DISEASE_CLASSES
+
+    parser = argparse.ArgumentParser(description="Evaluate the student/full-model disease cascade")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="Validation directory, one sub-folder per class")
+    parser.add_argument("--limit", type=int, default=1000, help="Max validation images")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--backend", default="keras", choices=sorted(BACKENDS))
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99])
+    parser.add_argument("--watchlist", default=",".join(DISEASE_CASCADE_WATCHLIST),
+                        help="Comma-separated classes always sent to the full model")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=30, help="Single-image timings per model")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    samples, labels = load_labelled_samples(args.samples, DISEASE_CLASSES, args.limit)
+    if len(samples) == 0:
+        print(f"Error: no labelled images found under {args.samples}")
+        sys.exit(1)
+
+    models = {}
+    for role, artifacts in (("teacher", BACKEND_ARTIFACTS), ("student", STUDENT_ARTIFACTS)):
+        path = os.path.join(args.models_dir, artifacts[args.backend])
+        if not os.path.exists(path):
+            print(f"Error: missing {role} model {path}")
+            sys.exit(1)
+        models[role] = BACKENDS[args.backend].load(path)
+
+    probs = {
+        role: np.concatenate([
+            model.predict(samples[i:i + args.batch_size]) for i in range(0, len(samples), args.batch_size)
+        ])
+        for role, model in models.items()
+    }
+    watchlist = [name.strip() for name in args.watchlist.split(",") if name.strip()]
+    report = evaluate(
+        probs["teacher"], probs["student"], labels, DISEASE_CLASSES, args.thresholds, watchlist,
+        teacher_ms=_per_image_ms(models["teacher"], samples, args.repeats),
+        student_ms=_per_image_ms(models["student"], samples, args.repeats),
+    )
+    _print_table(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
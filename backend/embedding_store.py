@@ -0,0 +1,410 @@
+"""
+Append-only store of disease CNN embeddings with nearest-neighbour search.
+
+Every prediction's pooled backbone embedding is L2-normalized and written as
+float16 into fixed-size chunk files that are memory-mapped, next to a chunk
+of prediction ids (0 marks an unused row). Nothing is loaded into memory up
+front; searches stream over the mapped chunks.
+
+Search is an exact dot-product scan while the store is small. Past
+`EMBEDDING_IVF_MIN_ROWS` an IVF index (spherical k-means partitions, built in
+a background thread and saved next to the chunks) narrows each query to the
+rows of its `EMBEDDING_IVF_PROBE` nearest partitions; those rows, plus any
+added since the index was built, are then scored exactly.
+
+Several API worker processes can share one store directory: appends are
+serialized with a file lock, and every read first catches up with rows,
+chunks and indexes written by the others. Job workers do not record
+embeddings.
+"""
+import os
+import json
+import time
+import threading
+import logging
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, use a single process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Embedding store settings
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EMBEDDING_STORE_ENABLED = os.getenv("EMBEDDING_STORE_ENABLED", "true").lower() == "true"
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", os.path.join(BASE_DIR, "data", "embeddings"))
+EMBEDDING_CHUNK_ROWS = int(os.getenv("EMBEDDING_CHUNK_ROWS", "16384"))
+EMBEDDING_IVF_MIN_ROWS = int(os.getenv("EMBEDDING_IVF_MIN_ROWS", "50000"))  # brute force below this
+EMBEDDING_IVF_PROBE = int(os.getenv("EMBEDDING_IVF_PROBE", "8"))  # partitions scanned per query
+
+# Rows converted to float32 at a time during scans
+_SCAN_BLOCK = 8192
+# Rows sampled to train the partition centroids
+_KMEANS_SAMPLE = 50000
+_KMEANS_ITERATIONS = 10
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+@contextmanager
+def _file_lock(path: str, blocking: bool = True):
+    """Exclusive lock on `path` across processes; yields False if not blocking and taken."""
+    if fcntl is None:
+        yield True
+        return
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def split_embedding(result: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    """A prediction result without its `embedding` entry, and the embedding."""
+    if "embedding" not in result:
+        return result, None
+    result = dict(result)
+    return result, result.pop("embedding")
+
+
+class _TopK:
+    """Running top-k (highest score) over blocks of candidates."""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.ids = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=np.float32)
+
+    def push(self, ids: np.ndarray, scores: np.ndarray):
+        ids = np.concatenate([self.ids, ids])
+        scores = np.concatenate([self.scores, scores])
+        if len(scores) > self.k:
+            keep = np.argpartition(-scores, self.k - 1)[:self.k]
+            ids, scores = ids[keep], scores[keep]
+        self.ids, self.scores = ids, scores
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(-self.scores, kind="stable")
+        return self.ids[order], self.scores[order]
+
+
+class IVFIndex:
+    """Inverted lists of store rows grouped by their nearest centroid."""
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, rows: int):
+        self.centroids = centroids
+        self.order = order  # store rows sorted by partition
+        self.offsets = offsets  # partition p holds order[offsets[p]:offsets[p + 1]]
+        self.rows = rows  # rows [0, rows) are indexed
+
+    @classmethod
+    def build(cls, chunks: List[np.ndarray], n_lists: int, seed: int = 0) -> "IVFIndex":
+        """
+        Spherical k-means on a sample of the rows, then assign every row.
+
+        `chunks` are the stored float16 blocks in row order; they are read a
+        block at a time rather than copied whole.
+        """
+        rng = np.random.default_rng(seed)
+        sizes = np.array([len(c) for c in chunks])
+        starts = np.concatenate([[0], np.cumsum(sizes)])
+        n = int(starts[-1])
+
+        sample_rows = np.sort(rng.choice(n, size=min(n, _KMEANS_SAMPLE), replace=False))
+        owner = np.searchsorted(starts, sample_rows, side="right") - 1
+        sample = _normalize(np.concatenate([
+            chunks[c][sample_rows[owner == c] - starts[c]] for c in np.unique(owner)
+        ]))
+        centroids = sample[rng.choice(len(sample), size=min(n_lists, len(sample)), replace=False)]
+        n_lists = len(centroids)
+
+        for _ in range(_KMEANS_ITERATIONS):
+            assign = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=n_lists) == 0
+            # Reseed empty partitions from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+
+        assign = np.empty(n, dtype=np.int32)
+        for c, chunk in enumerate(chunks):
+            for offset in range(0, len(chunk), _SCAN_BLOCK):
+                block = np.asarray(chunk[offset:offset + _SCAN_BLOCK], dtype=np.float32)
+                row = starts[c] + offset
+                assign[row:row + len(block)] = (block @ centroids.T).argmax(axis=1)
+
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))]).astype(np.int64)
+        return cls(centroids, order, offsets, n)
+
+    def candidates(self, query: np.ndarray, n_probe: int) -> np.ndarray:
+        """Rows in the `n_probe` partitions closest to `query`, ascending."""
+        n_probe = min(n_probe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        return np.sort(np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probe]))
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, order=self.order, offsets=self.offsets, rows=self.rows)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        data = np.load(path)
+        return cls(data["centroids"], data["order"], data["offsets"], int(data["rows"]))
+
+
+class EmbeddingStore:
+    """Memory-mapped float16 embeddings keyed by prediction id."""
+
+    def __init__(
+        self,
+        directory: str = EMBEDDING_STORE_DIR,
+        chunk_rows: int = EMBEDDING_CHUNK_ROWS,
+        ivf_min_rows: int = EMBEDDING_IVF_MIN_ROWS,
+        ivf_probe: int = EMBEDDING_IVF_PROBE,
+    ):
+        self.directory = directory
+        self.chunk_rows = max(1, chunk_rows)
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_probe = max(1, ivf_probe)
+        self.dim: Optional[int] = None
+        self._vectors: List[np.memmap] = []
+        self._ids: List[np.memmap] = []
+        self._count = 0
+        self._index: Optional[IVFIndex] = None
+        self._index_mtime: Optional[int] = None
+        self._building = False
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.last_build_seconds: Optional[float] = None
+
+    # -- Storage ---------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _sync(self):
+        """
+        Catch up with the files on disk: map chunks created since the last
+        call (possibly by another process), recount the used rows and pick up
+        a newer saved index. Called with `_lock` held.
+        """
+        if self.dim is None:
+            meta_path = self._path("meta.json")
+            if not os.path.exists(meta_path):
+                return
+            with open(meta_path) as f:
+                meta = json.load(f)
+            self.dim, self.chunk_rows = meta["dim"], meta["chunk_rows"]
+
+        # A chunk is complete once its ids file (created last) has its full size
+        while True:
+            ids_path = self._path(f"ids_{len(self._ids):05d}.i64")
+            if not os.path.exists(ids_path) or os.path.getsize(ids_path) < self.chunk_rows * 8:
+                break
+            self._map_chunk(len(self._ids))
+        if self._ids:
+            # Rows are filled in order, so the used rows are the nonzero ids
+            self._count = (len(self._ids) - 1) * self.chunk_rows + int(np.count_nonzero(self._ids[-1]))
+
+        try:
+            mtime = os.stat(self._path("ivf.npz")).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._index_mtime:
+            self._index_mtime = mtime
+            index = IVFIndex.load(self._path("ivf.npz"))
+            if index.rows <= self._count and index.centroids.shape[1] == self.dim:
+                self._index = index
+
+    def _map_chunk(self, chunk: int, create: bool = False):
+        mode = "w+" if create else "r+"
+        self._vectors.append(np.memmap(
+            self._path(f"vectors_{chunk:05d}.f16"), dtype=np.float16, mode=mode,
+            shape=(self.chunk_rows, self.dim),
+        ))
+        self._ids.append(np.memmap(
+            self._path(f"ids_{chunk:05d}.i64"), dtype=np.int64, mode=mode, shape=(self.chunk_rows,),
+        ))
+
+    def add(self, prediction_ids, embeddings: np.ndarray):
+        """Append embeddings for the given prediction ids (one row each)."""
+        embeddings = _normalize(np.atleast_2d(embeddings)).astype(np.float16)
+        prediction_ids = np.asarray(prediction_ids, dtype=np.int64)
+        if len(prediction_ids) != len(embeddings):
+            raise ValueError("One prediction id is needed per embedding")
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, _file_lock(self._path(".lock")):
+            self._sync()
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+                tmp = self._path("meta.json.tmp")
+                with open(tmp, "w") as f:
+                    json.dump({"dim": self.dim, "chunk_rows": self.chunk_rows}, f)
+                os.replace(tmp, self._path("meta.json"))
+            if embeddings.shape[1] != self.dim:
+                raise ValueError(f"Embedding size {embeddings.shape[1]} does not match the store ({self.dim})")
+
+            written = 0
+            while written < len(embeddings):
+                chunk, row = divmod(self._count, self.chunk_rows)
+                if chunk == len(self._ids):
+                    self._map_chunk(chunk, create=True)
+                n = min(self.chunk_rows - row, len(embeddings) - written)
+                # Vectors before ids: a nonzero id always has its vector
+                self._vectors[chunk][row:row + n] = embeddings[written:written + n]
+                self._ids[chunk][row:row + n] = prediction_ids[written:written + n]
+                written += n
+                self._count += n
+
+        self._maybe_build_index()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync()
+            return self._count
+
+    def _snapshot(self):
+        with self._lock:
+            self._sync()
+            return self._count, list(self._vectors), list(self._ids), self._index
+
+    def _slices(self, start: int, stop: int):
+        """(chunk, first row in chunk, row count) covering store rows [start, stop)."""
+        while start < stop:
+            chunk, row = divmod(start, self.chunk_rows)
+            n = min(self.chunk_rows - row, stop - start)
+            yield chunk, row, n
+            start += n
+
+    def vector(self, prediction_id: int) -> Optional[np.ndarray]:
+        """The stored (normalized) embedding of a prediction, or None."""
+        count, vectors, ids, _ = self._snapshot()
+        # Newest chunks first: recent predictions are looked up most
+        for chunk in range(len(ids) - 1, -1, -1):
+            used = min(self.chunk_rows, count - chunk * self.chunk_rows)
+            hits = np.flatnonzero(ids[chunk][:used] == prediction_id)
+            if len(hits):
+                return np.asarray(vectors[chunk][hits[0]], dtype=np.float32)
+        return None
+
+    # -- Search ----------------------------------------------------------------
+
+    def search(self, query: np.ndarray, k: int = 10, exclude_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Top-k stored predictions by cosine similarity to `query`.
+
+        Returns the prediction ids and similarities (best first), the method
+        used and how many rows were scored.
+        """
+        start = time.perf_counter()
+        count, vectors, ids, index = self._snapshot()
+        query = _normalize(query).ravel()
+        top = _TopK(k + (exclude_id is not None))
+
+        if index is not None:
+            # Partitions near the query, then rows added after the index was built
+            rows = index.candidates(query, self.ivf_probe)
+            scored = len(rows) + count - index.rows
+            chunk, offset = np.divmod(rows, self.chunk_rows)
+            for c in np.unique(chunk):
+                row_offsets = offset[chunk == c]
+                block = np.asarray(vectors[c][row_offsets], dtype=np.float32)
+                top.push(np.array(ids[c][row_offsets]), block @ query)
+            tail_start, method = index.rows, "ivf"
+        else:
+            tail_start, method, scored = 0, "brute_force", count
+
+        for chunk, row, n in self._slices(tail_start, count):
+            for offset in range(row, row + n, _SCAN_BLOCK):
+                end = min(offset + _SCAN_BLOCK, row + n)
+                block = np.asarray(vectors[chunk][offset:end], dtype=np.float32)
+                top.push(np.array(ids[chunk][offset:end]), block @ query)
+
+        result_ids, scores = top.result()
+        if exclude_id is not None:
+            keep = result_ids != exclude_id
+            result_ids, scores = result_ids[keep][:k], scores[keep][:k]
+        self.searches += 1
+        return {
+            "ids": result_ids.tolist(),
+            "similarities": [round(float(s), 4) for s in scores],
+            "method": method,
+            "scored": int(scored),
+            "search_ms": round((time.perf_counter() - start) * 1000.0, 2),
+        }
+
+    def _maybe_build_index(self):
+        """(Re)build the IVF index in the background once the store doubles."""
+        with self._lock:
+            indexed = self._index.rows if self._index is not None else 0
+            if self._building or self._count < self.ivf_min_rows or self._count < 2 * indexed:
+                return
+            self._building = True
+        threading.Thread(target=self._build_index, name="embedding-index", daemon=True).start()
+
+    def _build_index(self):
+        try:
+            # One build at a time across processes; the others load the result
+            with _file_lock(self._path(".index.lock"), blocking=False) as acquired:
+                if acquired:
+                    self._build_index_locked()
+        except Exception as e:
+            logger.error(f"Embedding index build failed: {e}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def _build_index_locked(self):
+        start = time.perf_counter()
+        count, vectors, _, index = self._snapshot()
+        if index is not None and count < 2 * index.rows:
+            return  # another process has just built one
+        chunks = [vectors[chunk][row:row + n] for chunk, row, n in self._slices(0, count)]
+        index = IVFIndex.build(chunks, n_lists=max(16, int(np.sqrt(count))))
+        index.save(self._path("ivf.npz"))
+        with self._lock:
+            self._index = index
+            self._index_mtime = os.stat(self._path("ivf.npz")).st_mtime_ns
+        self.last_build_seconds = time.perf_counter() - start
+        logger.info(
+            f"Built embedding index over {count} rows in {self.last_build_seconds:.1f}s "
+            f"({len(index.centroids)} partitions)"
+        )
+
+    def flush(self):
+        with self._lock:
+            for mapped in self._vectors + self._ids:
+                mapped.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        count, _, _, index = self._snapshot()
+        return {
+            "enabled": EMBEDDING_STORE_ENABLED,
+            "embeddings": count,
+            "dim": self.dim,
+            "chunks": len(self._ids),
+            "index": "ivf" if index is not None else "brute_force",
+            "indexed_rows": index.rows if index is not None else 0,
+            "partitions": len(index.centroids) if index is not None else 0,
+            "last_build_seconds": self.last_build_seconds,
+            "searches": self.searches,
+        }
+
+
+embedding_store = EmbeddingStore()
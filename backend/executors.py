@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from functools import partial
+from concurrent.futures import Executor
+from typing import Dict, Any, Callable
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Executor settings
+ML_THREAD_WORKERS = int(os.getenv("ML_THREAD_WORKERS", str(os.cpu_count() or 1)))
+ML_PROCESS_WORKERS = int(os.getenv("ML_PROCESS_WORKERS", "0"))  # 0 disables the sklearn process pool
+ML_MAX_PENDING = int(os.getenv("ML_MAX_PENDING", "64"))
+
+
+class BoundedExecutor:
+    """
+    Async front for a thread or process pool that caps outstanding work.
+
+    At most `max_pending` calls are handed to the pool at once; further
+    callers wait for a free slot, so bursts queue up here (where they are
+    counted) instead of growing the pool's internal queue without limit.
+    """
+
+    def __init__(self, executor: Executor, workers: int, max_pending: int, name: str, copy_context: bool = True):
+        self._executor = executor
+        # Threads see the caller's contextvars (request stage timings);
+        # process pools can't, as contexts don't pickle
+        self.copy_context = copy_context
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.name = name
+        self._slots = None
+        self._loop = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run `fn(*args)` on the pool without blocking the event loop."""
+        slots = self._semaphore()
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.peak_depth = max(self.peak_depth, self.waiting + self.in_flight)
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.total_wait_seconds += time.perf_counter() - queued_at
+
+        if self.copy_context:
+            fn = partial(contextvars.copy_context().run, fn)
+        
+        self.in_flight += 1
+        try:
+            result = await self._loop.run_in_executor(self._executor, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+        self.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue-depth counters, for sizing the pool against core count."""
+        finished = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting + max(0, self.in_flight - self.workers),
+            "peak_depth": self.peak_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "mean_wait_ms": (
+                1000.0 * self.total_wait_seconds / finished if finished else 0.0
+            ),
+        }
+
+    def shutdown(self, cancel_pending: bool = True):
+        """Stop the pool; with `cancel_pending=False` already submitted calls still finish."""
+        self._executor.shutdown(wait=False, cancel_futures=cancel_pending)
+
+
+# Process-pool workers for the scikit-learn yield model. They live here rather
+# than in ml_service so spawned children do not import TensorFlow.
+_worker_yield_model = None
+
+
+def init_yield_worker(model: Any):
+    """Load the yield model once per worker process (from a path or a pickled model)."""
+    global _worker_yield_model
+    import joblib
+
+    _worker_yield_model = joblib.load(model) if isinstance(model, str) else model
+
+
+def predict_yield_in_worker(features: np.ndarray) -> np.ndarray:
+    """Predict with the worker's yield model; `features` is (N, 10)."""
+    if _worker_yield_model is None:
+        raise RuntimeError("Yield worker was not initialised")
+    return _worker_yield_model.predict(features)
@@ -0,0 +1,174 @@
+"""
+Fertilizer and lime doses sized with the yield model.
+
+`optimize_doses` searches nitrogen, phosphorus and potassium doses (kg of
+nutrient per hectare) and lime (tonnes per hectare) for the combination that
+maximizes predicted yield, or profit when a crop price is given, without the
+dose cost exceeding the budget.
+
+The search is a coarse-to-fine grid: every round evaluates a
+FERTILIZER_GRID_POINTS^4 grid of doses as one yield-model call (see
+`MLService.predict_yield_grid`), then narrows each dose's range to the grid
+step either side of the best feasible point. Rounds stop once the steps are
+below FERTILIZER_MIN_STEP or the next round would overrun the deadline, so
+the answer is always the best point found in time.
+
+How doses reach the model's inputs:
+
+- nutrient doses are added to the soil's available N, P and K;
+- lime raises pH by FERTILIZER_LIME_PH_PER_TONNE per tonne, up to 7.0
+  (or the soil's own pH, if already above that).
+"""
+import os
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Search settings
+FERTILIZER_GRID_POINTS = int(os.getenv("FERTILIZER_GRID_POINTS", "9"))  # per dose, per round
+FERTILIZER_MAX_ROUNDS = int(os.getenv("FERTILIZER_MAX_ROUNDS", "6"))
+FERTILIZER_DEADLINE_MS = float(os.getenv("FERTILIZER_DEADLINE_MS", "500"))
+FERTILIZER_LIME_PH_PER_TONNE = float(os.getenv("FERTILIZER_LIME_PH_PER_TONNE", "0.3"))
+
+DOSES = ("nitrogen", "phosphorus", "potassium", "lime")
+
+# Dose -> column of the yield model's input (`predict_yield` argument order)
+DOSE_FEATURES = {"nitrogen": 4, "phosphorus": 5, "potassium": 6, "lime": 7}
+
+# Largest dose considered, per hectare (kg of nutrient; lime in tonnes)
+MAX_DOSES = {"nitrogen": 300.0, "phosphorus": 150.0, "potassium": 250.0, "lime": 5.0}
+
+# Price per kg of nutrient (lime: per tonne), in the budget's currency
+DEFAULT_PRICES = {"nitrogen": 13.0, "phosphorus": 60.0, "potassium": 30.0, "lime": 3000.0}
+
+# Rounds stop once every step is finer than this
+FERTILIZER_MIN_STEP = {"nitrogen": 1.0, "phosphorus": 0.5, "potassium": 1.0, "lime": 0.05}
+
+LIME_PH_CEILING = 7.0
+
+PredictGrid = Callable[[np.ndarray, Sequence[Tuple[int, np.ndarray]]], Tuple[np.ndarray, str]]
+
+
+def limed_ph(ph: float, lime: np.ndarray) -> np.ndarray:
+    """Soil pH after `lime` tonnes/ha."""
+    return np.minimum(ph + FERTILIZER_LIME_PH_PER_TONNE * np.asarray(lime, dtype=np.float64), max(ph, LIME_PH_CEILING))
+
+
+def optimize_doses(
+    predict_grid: PredictGrid,
+    base: np.ndarray,
+    budget: float,
+    prices: Optional[Dict[str, float]] = None,
+    crop_price: Optional[float] = None,
+    max_doses: Optional[Dict[str, float]] = None,
+    deadline_ms: float = FERTILIZER_DEADLINE_MS,
+) -> dict:
+    """
+    Best doses for one plot.
+
+    Args:
+        predict_grid: `MLService.predict_yield_grid` or equivalent
+        base: the plot's 10 yield-model inputs, season and variety encoded
+        budget: most that may be spent on doses, per hectare
+        prices: per kg of nutrient (lime: per tonne); defaults to DEFAULT_PRICES
+        crop_price: per tonne of tomatoes; when given, profit (extra revenue
+            minus dose cost) is maximized instead of yield
+        max_doses: per-dose upper bounds, overriding MAX_DOSES
+        deadline_ms: time allowed for the whole search
+
+    Raises ValueError for negative budgets, prices or bounds.
+    """
+    started = time.perf_counter()
+    deadline = started + deadline_ms / 1000.0
+    prices = {**DEFAULT_PRICES, **(prices or {})}
+    upper = {**MAX_DOSES, **(max_doses or {})}
+    if budget < 0 or any(prices[d] < 0 or upper[d] < 0 for d in DOSES) or (crop_price is not None and crop_price < 0):
+        raise ValueError("Budget, prices, crop price and dose bounds must not be negative")
+
+    base = np.asarray(base, dtype=np.float64)
+    ph = float(base[DOSE_FEATURES["lime"]])
+    ranges = {d: (0.0, upper[d]) for d in DOSES}
+    points = max(2, FERTILIZER_GRID_POINTS)
+    best = None
+    baseline = None
+    prediction_type = None
+    rounds = evaluated = 0
+    deadline_hit = False
+    last_round = 0.0
+
+    while rounds < FERTILIZER_MAX_ROUNDS:
+        round_start = time.perf_counter()
+        # Always finish the first round; afterwards only start one that fits
+        if rounds and round_start + last_round > deadline:
+            deadline_hit = True
+            break
+
+        values = {d: np.linspace(lo, hi, points) for d, (lo, hi) in ranges.items()}
+        axes = [
+            (DOSE_FEATURES[d], base[DOSE_FEATURES[d]] + values[d] if d != "lime" else limed_ph(ph, values[d]))
+            for d in DOSES
+        ]
+        yields, prediction_type = predict_grid(base, axes)
+        if baseline is None:
+            baseline = float(yields[(0,) * len(DOSES)])  # first round starts at zero doses
+
+        cost = _outer_sum([prices[d] * values[d] for d in DOSES])
+        score = (yields - baseline) * crop_price - cost if crop_price is not None else yields
+        score = np.where(cost <= budget + 1e-9, score, -np.inf)
+        index = _best_index(score, cost)
+        candidate = {
+            "doses": {d: float(values[d][i]) for d, i in zip(DOSES, index)},
+            "predicted_yield": float(yields[index]),
+            "cost": float(cost[index]),
+            "score": float(score[index]),
+        }
+        if best is None or candidate["score"] > best["score"]:
+            best = candidate
+        rounds += 1
+        evaluated += yields.size
+        last_round = time.perf_counter() - round_start
+
+        # Narrow to one step either side of the best point so far
+        steps = {d: (hi - lo) / (points - 1) for d, (lo, hi) in ranges.items()}
+        if all(steps[d] < FERTILIZER_MIN_STEP[d] for d in DOSES):
+            break
+        ranges = {
+            d: (max(0.0, best["doses"][d] - steps[d]), min(upper[d], best["doses"][d] + steps[d]))
+            for d in DOSES
+        }
+
+    gain = best["predicted_yield"] - baseline
+    return {
+        "doses": {d: round(v, 3 if d == "lime" else 1) for d, v in best["doses"].items()},
+        "ph_after_lime": round(float(limed_ph(ph, best["doses"]["lime"])), 2),
+        "cost": round(best["cost"], 2),
+        "predicted_yield": round(best["predicted_yield"], 2),
+        "baseline_yield": round(baseline, 2),
+        "yield_gain": round(gain, 2),
+        "profit_gain": round(gain * crop_price - best["cost"], 2) if crop_price is not None else None,
+        "objective": "profit" if crop_price is not None else "yield",
+        "prediction_type": prediction_type,
+        "search": {
+            "rounds": rounds,
+            "evaluated": evaluated,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "deadline_hit": deadline_hit,
+        },
+    }
+
+
+def _outer_sum(columns: List[np.ndarray]) -> np.ndarray:
+    """Grid of sums: element [i, j, ...] = columns[0][i] + columns[1][j] + ..."""
+    total = np.zeros([len(c) for c in columns])
+    for axis, column in enumerate(columns):
+        shape = [1] * len(columns)
+        shape[axis] = len(column)
+        total = total + column.reshape(shape)
+    return total
+
+
+def _best_index(score: np.ndarray, cost: np.ndarray) -> Tuple[int, ...]:
+    """Highest score, the cheapest such point on ties (forests are flat in places)."""
+    top = score >= score.max() - 1e-9
+    flat = int(np.argmin(np.where(top, cost, np.inf)))
+    return np.unravel_index(flat, score.shape)
@@ -0,0 +1,332 @@
+"""
+Flat, array-backed inference for the yield RandomForest.
+
+`RandomForestRegressor.predict` on a single row spends most of its time on
+input validation and joblib dispatch across the 300 trees rather than on
+walking them. `compile_forest` copies a fitted forest's trees into a few
+contiguous node arrays, and `CompiledForest.predict` walks them with NumPy
+gathers, one vectorised step per tree level:
+
+- small batches walk every tree for every row at once (a trees x rows
+  array of node indices), so one row costs ~15 steps instead of 300 tree
+  calls;
+- from `FOREST_TREE_MAJOR_ROWS` rows, trees are walked one at a time for
+  the whole batch, which keeps each tree's nodes in cache.
+
+Nodes are renumbered breadth-first with the two children of each split next
+to each other, so a step is `node = left[node] + (x > threshold[node])`.
+Leaves point at themselves with an infinite threshold and stay put.
+Thresholds are stored as float32, rounded down, which decides exactly as
+scikit-learn does (it compares float32 inputs against float64 thresholds),
+and the per-tree values are summed in tree order, so predictions match
+scikit-learn's to the last bit or so.
+
+`CompiledForest.predict_grid` evaluates a Cartesian grid of feature values
+(a scenario sweep) without expanding it into rows: each tree is walked once
+per box of cells sharing a path, so a 100k-point grid over a few features
+costs about as much as a few thousand rows.
+
+Check and time it against scikit-learn with:
+
+    python -m benchmarks.bench_forest_compiler [--model models/yield_model.joblib] [--json out.json]
+"""
+import os
+import numpy as np
+from typing import Any, List, Optional, Sequence, Tuple
+
+# Rows walked together across all trees; keeps the (trees x rows) working set small
+FOREST_BLOCK_ROWS = int(os.getenv("FOREST_BLOCK_ROWS", "256"))
+# Batches of at least this many rows are walked one tree at a time
+FOREST_TREE_MAJOR_ROWS = int(os.getenv("FOREST_TREE_MAJOR_ROWS", "1024"))
+
+
+class CompiledForest:
+    """A regression forest as flat node arrays, with a sklearn-style `predict`."""
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 value: np.ndarray, roots: np.ndarray, depths: np.ndarray, n_features: int):
+        # Index arrays are intp so gathers don't convert them on every step
+        self.feature = feature  # intp, split feature (0 for leaves)
+        self.threshold = threshold  # float32, go right when x > threshold (+inf for leaves)
+        self.left = left  # intp, left child; the right child is left + 1 (leaves: self)
+        self.value = value  # float64, node prediction (only read at leaves)
+        self.roots = roots  # intp, root node of each tree
+        self.depths = depths  # intp, depth of each tree
+        self.max_depth = int(depths.max())
+        self.n_features_in_ = n_features
+        self.source = None  # (size, mtime_ns) of the model file it was compiled from, if known
+        self.memory_mapped = False
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in _ARRAYS)
+
+    def predict(self, X) -> np.ndarray:
+        """Mean of the trees' predictions for each row of `X` (n_samples, n_features)."""
+        # Same input handling as scikit-learn's trees: float32, finite, 2-D
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected input of shape (n_samples, {self.n_features_in_}), got {X.shape}")
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity")
+
+        if len(X) >= FOREST_TREE_MAJOR_ROWS:
+            return self._predict_by_tree(X)
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), FOREST_BLOCK_ROWS):
+            block = X[start:start + FOREST_BLOCK_ROWS]
+            out[start:start + len(block)] = self._predict_block(block)
+        return out
+
+    def _predict_block(self, X: np.ndarray) -> np.ndarray:
+        n_rows = len(X)
+        flat = X.ravel()
+        # (trees, rows): node of each tree for each row, starting at the roots
+        offsets = np.arange(n_rows, dtype=np.intp) * X.shape[1]
+        node = np.repeat(self.roots[:, None], n_rows, axis=1).astype(np.intp)
+        for _ in range(self.max_depth):
+            x = flat[offsets + self.feature[node]]
+            node = self.left[node] + (x > self.threshold[node])
+        # Sum over trees in order (axis 0 accumulates row by row), as
+        # scikit-learn accumulates the per-tree predictions
+        return self.value[node].sum(axis=0) / self.n_trees
+
+    def _predict_by_tree(self, X: np.ndarray) -> np.ndarray:
+        n_rows = len(X)
+        # Feature-major copy, so each step reads one contiguous column per row
+        columns = np.ascontiguousarray(X.T).ravel()
+        rows = np.arange(n_rows, dtype=np.intp)
+        column_start = self.feature * n_rows
+        out = np.zeros(n_rows, dtype=np.float64)
+        for root, depth in zip(self.roots, self.depths):
+            node = np.full(n_rows, root, dtype=np.intp)
+            for _ in range(depth):
+                x = columns[column_start[node] + rows]
+                node = self.left[node] + (x > self.threshold[node])
+            out += self.value[node]
+        return out / self.n_trees
+
+
+    def predict_grid(self, base, axes: Sequence[Tuple[int, Sequence[float]]]) -> np.ndarray:
+        """
+        Predictions for every point of a Cartesian grid, as one N-D array.
+
+        `axes` lists (feature index, values) pairs; the other features stay
+        at `base`. Element [i, j, ...] equals `predict` on the row with the
+        first axis at its i-th value, the second at its j-th, and so on.
+
+        Rather than walking each grid row, every tree is walked once per
+        box of grid cells that share a path: splits on fixed features send
+        the whole box one way, splits on swept features cut it in two. Each
+        leaf box then adds its value to all of its cells at once through an
+        N-D difference array.
+        """
+        base = np.asarray(base, dtype=np.float32)
+        if base.shape != (self.n_features_in_,):
+            raise ValueError(f"Expected a base row of {self.n_features_in_} features, got shape {base.shape}")
+        values = [np.asarray(v, dtype=np.float32) for _, v in axes]
+        features = [int(f) for f, _ in axes]
+        if len(set(features)) != len(features) or not all(0 <= f < self.n_features_in_ for f in features):
+            raise ValueError(f"Grid axes must be distinct feature indices below {self.n_features_in_}")
+        if not np.isfinite(base).all() or not all(np.isfinite(v).all() and v.size for v in values):
+            raise ValueError("Grid values must be finite and non-empty")
+        if not axes:
+            return self.predict(base[None])[0]
+
+        # Walk over sorted axis values, so "x <= threshold" is a prefix of each axis
+        order = [np.argsort(v, kind="stable") for v in values]
+        ordered = [v[o] for v, o in zip(values, order)]
+        shape = tuple(len(v) for v in values)
+        axis_of = np.full(self.n_features_in_, -1, dtype=np.intp)
+        axis_of[features] = np.arange(len(features))
+
+        node, lo, hi = self._grid_boxes(base, ordered, axis_of)
+
+        # Corners of each box in a difference array; prefix sums along every
+        # axis then give each cell the total of the boxes covering it
+        dims = len(shape)
+        diff_shape = tuple(n + 1 for n in shape)
+        leaf_values = self.value[node]
+        total = np.zeros(int(np.prod(diff_shape)), dtype=np.float64)
+        for corner in range(1 << dims):
+            upper = [(corner >> a) & 1 for a in range(dims)]
+            index = np.ravel_multi_index([hi[:, a] if u else lo[:, a] for a, u in enumerate(upper)], diff_shape)
+            sign = -1.0 if sum(upper) % 2 else 1.0
+            total += np.bincount(index, weights=sign * leaf_values, minlength=total.size)
+        total = total.reshape(diff_shape)
+        for a in range(dims):
+            np.cumsum(total, axis=a, out=total)
+        grid = total[tuple(slice(0, n) for n in shape)] / self.n_trees
+
+        # Back to the caller's value order on each axis
+        positions = [np.argsort(o) for o in order]
+        return grid[np.ix_(*positions)]
+
+    def _grid_boxes(self, base: np.ndarray, ordered: List[np.ndarray], axis_of: np.ndarray):
+        """Leaf node and [lo, hi) index range per axis of every box reaching a leaf, for all trees."""
+        dims = len(ordered)
+        node = self.roots.copy()
+        lo = np.zeros((len(node), dims), dtype=np.intp)
+        hi = np.tile(np.array([len(v) for v in ordered], dtype=np.intp), (len(node), 1))
+        done = []
+        for _ in range(self.max_depth + 1):
+            at_leaf = self.left[node] == node
+            if at_leaf.any():
+                done.append((node[at_leaf], lo[at_leaf], hi[at_leaf]))
+                node, lo, hi = node[~at_leaf], lo[~at_leaf], hi[~at_leaf]
+            if not len(node):
+                break
+
+            feature = self.feature[node]
+            threshold = self.threshold[node]
+            axis = axis_of[feature]
+            left = self.left[node]
+
+            # Fixed feature: the whole box goes one way
+            fixed = axis < 0
+            moved = (left[fixed] + (base[feature[fixed]] > threshold[fixed]), lo[fixed], hi[fixed])
+
+            # Swept feature: cells up to the split index go left, the rest right
+            swept = np.flatnonzero(~fixed)
+            split = np.empty(len(swept), dtype=np.intp)
+            for a in range(dims):
+                on_axis = axis[swept] == a
+                split[on_axis] = np.searchsorted(ordered[a], threshold[swept[on_axis]], side="right")
+            rows = np.arange(len(swept))
+            s_lo, s_hi, s_axis = lo[swept], hi[swept], axis[swept]
+            cut_hi = s_hi.copy()
+            cut_hi[rows, s_axis] = np.minimum(s_hi[rows, s_axis], split)
+            cut_lo = s_lo.copy()
+            cut_lo[rows, s_axis] = np.maximum(s_lo[rows, s_axis], split)
+            go_left = s_lo[rows, s_axis] < cut_hi[rows, s_axis]
+            go_right = cut_lo[rows, s_axis] < s_hi[rows, s_axis]
+
+            node = np.concatenate([moved[0], left[swept][go_left], left[swept][go_right] + 1])
+            lo = np.concatenate([moved[1], s_lo[go_left], cut_lo[go_right]])
+            hi = np.concatenate([moved[2], cut_hi[go_left], s_hi[go_right]])
+
+        nodes, los, his = zip(*done)
+        return np.concatenate(nodes), np.concatenate(los), np.concatenate(his)
+
+
+def compile_forest(model: Any) -> CompiledForest:
+    """
+    Flatten a fitted single-output forest regressor (RandomForestRegressor,
+    ExtraTreesRegressor).
+
+    Raises ValueError for anything else.
+    """
+    # Boosted ensembles keep a 2-D array of trees (or none at all) and sum
+    # them differently; only bagged forests keep a plain list
+    estimators = getattr(model, "estimators_", None)
+    if not isinstance(estimators, list):
+        raise ValueError(f"Cannot compile {type(model).__name__}: not a supported forest (fitted RandomForestRegressor or ExtraTreesRegressor)")
+    if not estimators or not all(hasattr(e, "tree_") for e in estimators):
+        raise ValueError(f"Cannot compile {type(model).__name__}: not a fitted tree ensemble")
+    if getattr(model, "n_outputs_", 1) != 1 or hasattr(model, "classes_"):
+        raise ValueError(f"Cannot compile {type(model).__name__}: only single-output regressors are supported")
+
+    features, thresholds, lefts, values, roots, depths = [], [], [], [], [], []
+    base = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        feature, threshold, left, value = _flatten_tree(tree)
+        roots.append(base)
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left + base)
+        values.append(value)
+        depths.append(tree.max_depth)
+        base += len(feature)
+
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts).astype(np.intp),
+        value=np.concatenate(values),
+        roots=np.asarray(roots, dtype=np.intp),
+        depths=np.asarray(depths, dtype=np.intp),
+        n_features=int(model.n_features_in_),
+    )
+
+
+def save_compiled(forest: CompiledForest, path: str):
+    """Write a compiled forest for `load_compiled` (to a temporary file, then renamed into place)."""
+    import joblib
+
+    tmp = f"{path}.tmp{os.getpid()}"
+    try:
+        joblib.dump(forest, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_compiled(path: str, mmap_mode: Optional[str] = "r") -> CompiledForest:
+    """
+    Load a forest written by `save_compiled`.
+
+    With `mmap_mode` the node arrays are memory-mapped rather than read in,
+    so every process that loads the same file shares one copy through the
+    page cache. (Loading the scikit-learn forest itself with `mmap_mode`
+    does not: its trees copy their node arrays when unpickled.)
+    """
+    import joblib
+
+    forest = joblib.load(path, mmap_mode=mmap_mode)
+    if not isinstance(forest, CompiledForest):
+        raise ValueError(f"{path} does not hold a compiled forest")
+    for name in _ARRAYS:
+        # Plain ndarray views of the maps; gathers on np.memmap are slower
+        setattr(forest, name, np.asarray(getattr(forest, name)))
+    forest.memory_mapped = mmap_mode is not None
+    return forest
+
+
+_ARRAYS = ("feature", "threshold", "left", "value", "roots", "depths")
+
+
+def _flatten_tree(tree) -> tuple:
+    """One tree's nodes in breadth-first order with sibling children adjacent."""
+    children_left = tree.children_left
+    children_right = tree.children_right
+
+    # Breadth-first order: each split appends its (left, right) pair
+    levels = [np.array([0])]
+    while True:
+        frontier = levels[-1]
+        splits = frontier[children_left[frontier] != -1]
+        if not len(splits):
+            break
+        levels.append(np.stack([children_left[splits], children_right[splits]], axis=1).ravel())
+    order = np.concatenate(levels)
+    position = np.empty(tree.node_count, dtype=np.int64)
+    position[order] = np.arange(len(order))
+
+    is_leaf = children_left[order] == -1
+    left = np.where(is_leaf, np.arange(len(order)), position[np.where(is_leaf, 0, children_left[order])])
+    feature = np.where(is_leaf, 0, tree.feature[order])
+    threshold = np.where(is_leaf, np.inf, tree.threshold[order])
+    return feature, _round_down_to_float32(threshold), left, tree.value[order, 0, 0].astype(np.float64)
+
+
+def _round_down_to_float32(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 not above each threshold.
+
+    For a float32 input x, `x <= t` holds exactly when `x <= round_down(t)`,
+    so comparisons stay in float32 without changing any decision.
+    """
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import threading
+import numpy as np
+from typing import Any, Optional, Tuple
+
+# Disease CNN backend: "keras" (default), "tflite" or "onnx"
+DISEASE_BACKEND = os.getenv("DISEASE_BACKEND", "keras").lower()
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", str(os.cpu_count() or 1)))
+
+# Artifact produced for each backend by model_trainer.py
+BACKEND_ARTIFACTS = {
+    "keras": "disease_model.h5",
+    "tflite": "disease_model.tflite",
+    "onnx": "disease_model.onnx",
+}
+
+# Small student model for the confidence-gated cascade (see cascade.py)
+STUDENT_ARTIFACTS = {kind: name.replace("disease_model", "disease_student") for kind, name in BACKEND_ARTIFACTS.items()}
+
+
+class KerasBackend:
+    """Runs the full Keras model."""
+
+    name = "keras"
+
+    def __init__(self, model: Any):
+        self.model = model
+        # Same weights, also returning the pooled backbone embedding
+        try:
+            from .plant_gate import build_gated_model
+
+            self.embedding_model = build_gated_model(model)
+        except ValueError:
+            self.embedding_model = None
+
+    @classmethod
+    def load(cls, path: str) -> "KerasBackend":
+        from tensorflow import keras
+
+        return cls(keras.models.load_model(path))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch, verbose=0)
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Class probabilities and pooled embeddings from one forward pass."""
+        if self.embedding_model is None:
+            return self.predict(batch), None
+        probs, embeddings = self.embedding_model.predict(batch, verbose=0)
+        return probs, embeddings
+
+
+class TFLiteBackend:
+    """
+    Runs a (possibly quantized) TFLite flatbuffer.
+
+    The interpreter is not thread-safe, so calls are serialised; the input
+    tensor is resized when the batch size changes.
+    """
+
+    name = "tflite"
+
+    def __init__(self, path: str, num_threads: int = TFLITE_NUM_THREADS):
+        Interpreter = _tflite_interpreter_class()
+        self._interpreter = Interpreter(model_path=path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "TFLiteBackend":
+        return cls(path)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input["index"], list(batch.shape))
+                self._interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+
+            self._interpreter.set_tensor(self._input["index"], _quantize(batch, self._input))
+            self._interpreter.invoke()
+            output = self._interpreter.get_tensor(self._output["index"])
+
+        return _dequantize(output, self._output)
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        # The exported flatbuffer only has the class probabilities output
+        return self.predict(batch), None
+
+
+class OnnxBackend:
+    """Runs an ONNX export with ONNX Runtime on CPU."""
+
+    name = "onnx"
+
+    def __init__(self, path: str):
+        import onnxruntime as ort
+
+        self._session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+
+    @classmethod
+    def load(cls, path: str) -> "OnnxBackend":
+        return cls(path)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
+
+    def predict_with_embeddings(self, batch: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        # The ONNX export only has the class probabilities output
+        return self.predict(batch), None
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def import_runtime(kind: str):
+    """Import the runtime a backend needs, so its cost can be timed separately."""
+    if kind == "keras":
+        import tensorflow  # noqa: F401
+    elif kind == "tflite":
+        _tflite_interpreter_class()
+    elif kind == "onnx":
+        import onnxruntime  # noqa: F401
+
+
+def artifact_version(path: str) -> str:
+    """Short identifier that changes whenever the model file is replaced."""
+    stat = os.stat(path)
+    fingerprint = f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(fingerprint.encode()).hexdigest()[:12]
+
+
+def _tflite_interpreter_class():
+    # Prefer the standalone runtimes; fall back to the one bundled with TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def _quantize(batch: np.ndarray, detail: dict) -> np.ndarray:
+    dtype = detail["dtype"]
+    scale, zero_point = detail["quantization"]
+    if dtype == np.float32 or not scale:
+        return batch.astype(dtype, copy=False)
+    info = np.iinfo(dtype)
+    return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+
+def _dequantize(output: np.ndarray, detail: dict) -> np.ndarray:
+    scale, zero_point = detail["quantization"]
+    if output.dtype == np.float32 or not scale:
+        return output.astype(np.float32, copy=False)
+    return (output.astype(np.float32) - zero_point) * scale
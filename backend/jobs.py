@@ -0,0 +1,405 @@
+"""
+Durable prediction job queue.
+
+Jobs are rows in the `prediction_jobs` table. The API inserts them and
+returns straight away. A pool of local worker processes, each holding its
+own warm MLService, claims jobs and writes the results back. The highest
+priority goes first, then the oldest, and no user may have more than
+JOB_MAX_RUNNING_PER_USER jobs running at once. Jobs held by a worker that
+dies are put back in the queue, up to JOB_MAX_ATTEMPTS times.
+"""
+import os
+import time
+import socket
+import threading
+import multiprocessing
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import aliased
+
+from .database import SessionLocal
+from .models import PredictionJob
+
+logger = logging.getLogger(__name__)
+
+# Job queue settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))  # local worker processes; 0 = no pool (opt in)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("JOB_MAX_RUNNING_PER_USER", "2"))
+JOB_MAX_QUEUED_PER_USER = int(os.getenv("JOB_MAX_QUEUED_PER_USER", "100"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))  # seconds
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))  # no heartbeat for this long = worker lost
+
+JOB_KINDS = ("disease", "yield")
+
+# First key of the PostgreSQL advisory locks that serialize claims per user
+_CLAIM_LOCK_NAMESPACE = 0x6a6f62
+MIN_PRIORITY, MAX_PRIORITY = 0, 9
+
+
+class QueueFull(Exception):
+    """The user already has JOB_MAX_QUEUED_PER_USER jobs waiting."""
+
+
+# -- Queue operations (API and workers) --------------------------------------
+
+def submit_job(
+    db,
+    user_id: int,
+    kind: str,
+    input_data: Dict[str, Any],
+    input_blob: Optional[bytes] = None,
+    priority: int = 5,
+) -> PredictionJob:
+    """Queue a job and return it."""
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+
+    queued = db.query(func.count(PredictionJob.id))\
+        .filter(PredictionJob.user_id == user_id)\
+        .filter(PredictionJob.status == "queued")\
+        .scalar()
+    if queued >= JOB_MAX_QUEUED_PER_USER:
+        raise QueueFull(f"At most {JOB_MAX_QUEUED_PER_USER} queued jobs per user")
+
+    job = PredictionJob(
+        user_id=user_id,
+        kind=kind,
+        priority=max(MIN_PRIORITY, min(MAX_PRIORITY, priority)),
+        input_data=input_data,
+        input_blob=input_blob,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_next_job(db, worker: str) -> Optional[PredictionJob]:
+    """
+    Atomically take the next runnable job for `worker`.
+
+    Candidates are scanned in priority order. The claim is one conditional
+    UPDATE that also checks the user's running count against
+    JOB_MAX_RUNNING_PER_USER, so two workers racing for the same row, or
+    for two jobs of the same user, cannot both win. On PostgreSQL the claim
+    first takes a per-user advisory lock, since under READ COMMITTED two
+    concurrent UPDATEs would each count the other's job as still queued.
+    """
+    busy_users = db.query(PredictionJob.user_id)\
+        .filter(PredictionJob.status == "running")\
+        .group_by(PredictionJob.user_id)\
+        .having(func.count(PredictionJob.id) >= JOB_MAX_RUNNING_PER_USER)
+
+    candidates = db.query(PredictionJob.id, PredictionJob.user_id)\
+        .filter(PredictionJob.status == "queued")\
+        .filter(PredictionJob.user_id.notin_(busy_users))\
+        .order_by(PredictionJob.priority.desc(), PredictionJob.id)\
+        .limit(10)\
+        .all()
+
+    running = aliased(PredictionJob)
+    running_for_user = select(func.count(running.id))\
+        .where(running.user_id == PredictionJob.user_id, running.status == "running")\
+        .scalar_subquery()
+
+    for job_id, user_id in candidates:
+        if db.bind.dialect.name == "postgresql":
+            db.execute(text("SELECT pg_advisory_xact_lock(:namespace, :user_id)"),
+                       {"namespace": _CLAIM_LOCK_NAMESPACE, "user_id": user_id})
+        now = datetime.utcnow()
+        claimed = db.execute(
+            update(PredictionJob)
+            .where(
+                PredictionJob.id == job_id,
+                PredictionJob.status == "queued",
+                running_for_user < JOB_MAX_RUNNING_PER_USER,
+            )
+            .values(
+                status="running",
+                worker=worker,
+                started_at=now,
+                heartbeat_at=now,
+                attempts=PredictionJob.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(PredictionJob, job_id)
+    return None
+
+
+def requeue_jobs(db, worker: Optional[str] = None, stale_before: Optional[datetime] = None) -> int:
+    """
+    Put running jobs whose worker is gone back in the queue.
+
+    Selects jobs held by `worker`, or whose heartbeat is older than
+    `stale_before`. Jobs that have used up their attempts fail instead.
+    """
+    query = db.query(PredictionJob).filter(PredictionJob.status == "running")
+    if worker is not None:
+        query = query.filter(PredictionJob.worker == worker)
+    if stale_before is not None:
+        query = query.filter(PredictionJob.heartbeat_at < stale_before)
+
+    jobs = query.all()
+    for job in jobs:
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            job.status = "failed"
+            job.error = f"Worker {job.worker} died; giving up after {job.attempts} attempts"
+            job.finished_at = datetime.utcnow()
+            job.input_blob = None
+        else:
+            job.status = "queued"
+        job.worker = None
+    db.commit()
+    if jobs:
+        logger.warning(f"Requeued {len(jobs)} job(s) from lost worker {worker or '(stale heartbeat)'}")
+    return len(jobs)
+
+
+def queue_position(db, job: PredictionJob) -> int:
+    """Number of queued jobs that will be considered before this one."""
+    return db.query(func.count(PredictionJob.id))\
+        .filter(PredictionJob.status == "queued")\
+        .filter(
+            (PredictionJob.priority > job.priority)
+            | ((PredictionJob.priority == job.priority) & (PredictionJob.id < job.id))
+        )\
+        .scalar()
+
+
+def queue_stats(db, window: int = 500) -> Dict[str, Any]:
+    """Queue depth by status and priority, plus wait times of recent jobs."""
+    by_status = dict(
+        db.query(PredictionJob.status, func.count(PredictionJob.id))
+        .group_by(PredictionJob.status)
+        .all()
+    )
+    queued_by_priority = dict(
+        db.query(PredictionJob.priority, func.count(PredictionJob.id))
+        .filter(PredictionJob.status == "queued")
+        .group_by(PredictionJob.priority)
+        .all()
+    )
+    oldest = db.query(func.min(PredictionJob.created_at))\
+        .filter(PredictionJob.status == "queued")\
+        .scalar()
+
+    recent = db.query(PredictionJob.created_at, PredictionJob.started_at)\
+        .filter(PredictionJob.started_at.isnot(None))\
+        .order_by(PredictionJob.started_at.desc())\
+        .limit(window)\
+        .all()
+    waits = sorted((started - created).total_seconds() for created, started in recent)
+
+    now = datetime.utcnow()
+    return {
+        "queued": by_status.get("queued", 0),
+        "running": by_status.get("running", 0),
+        "succeeded": by_status.get("succeeded", 0),
+        "failed": by_status.get("failed", 0),
+        "queued_by_priority": {str(p): n for p, n in sorted(queued_by_priority.items(), reverse=True)},
+        "oldest_queued_seconds": (now - oldest).total_seconds() if oldest else 0.0,
+        "recent_jobs": len(waits),
+        "mean_wait_seconds": sum(waits) / len(waits) if waits else 0.0,
+        "p95_wait_seconds": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+    }
+
+
+# -- Worker processes ---------------------------------------------------------
+
+def _run_disease_job(service, job: PredictionJob, db) -> Dict[str, Any]:
+    from .models import DiseasePrediction
+    from .routers.disease import TREATMENT_ADVICE, _preprocess_image, _predict_tiled
+
+    if (job.input_data or {}).get("tiled"):
+        result = _predict_tiled(job.input_blob)
+    else:
+        result = service.predict_disease_batch([_preprocess_image(job.input_blob)])[0]
+
+    treatment = TREATMENT_ADVICE.get(result["disease"], "Consult an agricultural expert for specific treatment.")
+    db.add(DiseasePrediction(
+        user_id=job.user_id,
+        model_type=result["model_used"],
+        predicted_disease=result["disease"],
+        confidence=result["confidence"],
+        all_predictions=result["all_predictions"],
+        treatment_advice=treatment
+    ))
+    return {**result, "treatment_advice": treatment}
+
+
+def _run_yield_job(service, job: PredictionJob, db) -> Dict[str, Any]:
+    from .models import YieldForecast
+    from .routers.yield_pred import YieldPredictionRequest, yield_features, build_recommendations
+
+    data = YieldPredictionRequest(**job.input_data)
+    model_version = service.yield_model_version
+    yield_pred = service.predict_yield(**yield_features(data))
+    prediction_type = "ml" if 'yield' in service.models else "heuristic"
+
+    db.add(YieldForecast(
+        user_id=job.user_id,
+        season=data.season,
+        temperature=data.temperature,
+        rainfall=data.rainfall,
+        humidity=data.humidity,
+        predicted_yield=yield_pred,
+        prediction_type=prediction_type,
+        input_data=job.input_data
+    ))
+    return {
+        "predicted_yield": round(yield_pred, 2),
+        "prediction_type": prediction_type,
+        "recommendations": build_recommendations(data, yield_pred),
+        "model_version": model_version if prediction_type == "ml" else None
+    }
+
+
+JOB_RUNNERS = {
+    "disease": _run_disease_job,
+    "yield": _run_yield_job,
+}
+
+
+def _heartbeat(worker: str, stop: threading.Event):
+    """Keep this worker's running jobs from looking stale."""
+    while not stop.wait(JOB_STALE_SECONDS / 4):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(PredictionJob)
+                .where(PredictionJob.worker == worker, PredictionJob.status == "running")
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Job heartbeat failed: {e}")
+        finally:
+            db.close()
+
+
+def job_worker_main(worker: str, stop_event):
+    """Entry point of a worker process: load models once, then process jobs until told to stop."""
+    # Jobs already run in their own process; no nested yield pool
+    os.environ["ML_PROCESS_WORKERS"] = "0"
+    logging.basicConfig(level=logging.INFO)
+    from .ml_service import ml_service
+
+    ml_service.load_models()
+    ml_service.registry.start_watching()
+
+    beat_stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(worker, beat_stop), daemon=True).start()
+    logger.info(f"Job worker {worker} ready")
+
+    try:
+        while not stop_event.is_set():
+            db = SessionLocal()
+            try:
+                job = claim_next_job(db, worker)
+                if job is None:
+                    db.close()
+                    stop_event.wait(JOB_POLL_INTERVAL)
+                    continue
+
+                try:
+                    job.result = JOB_RUNNERS[job.kind](ml_service, job, db)
+                    job.status = "succeeded"
+                except Exception as e:
+                    # Bad input or model error: retrying won't help
+                    logger.error(f"Job {job.id} failed: {e}")
+                    db.rollback()
+                    job.status = "failed"
+                    job.error = str(e)
+                job.finished_at = datetime.utcnow()
+                job.input_blob = None
+                job.worker = None
+                db.commit()
+            finally:
+                db.close()
+    finally:
+        beat_stop.set()
+        ml_service.registry.stop()
+
+
+class JobWorkerPool:
+    """
+    Supervises the local job worker processes.
+
+    A monitor thread restarts workers that exit unexpectedly and requeues
+    the jobs they were holding; it also requeues jobs whose heartbeat went
+    stale (e.g. held by a worker on a host that went away).
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, monitor_interval: float = 1.0):
+        self.workers = workers
+        self.monitor_interval = monitor_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._stop = self._context.Event()
+        self._processes: Dict[str, multiprocessing.Process] = {}
+        self._monitor: Optional[threading.Thread] = None
+        self._monitor_stop = threading.Event()
+        self.restarts = 0
+        self._prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def start(self):
+        if self.workers <= 0 or self._monitor is not None:
+            return
+        for i in range(self.workers):
+            self._spawn(f"{self._prefix}-w{i}")
+        self._monitor = threading.Thread(target=self._watch, name="job-monitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"Started {self.workers} job worker(s)")
+
+    def _spawn(self, name: str):
+        process = self._context.Process(
+            target=job_worker_main, args=(name, self._stop), name=name, daemon=True
+        )
+        process.start()
+        self._processes[name] = process
+
+    def _watch(self):
+        while not self._monitor_stop.wait(self.monitor_interval):
+            db = SessionLocal()
+            try:
+                for name, process in list(self._processes.items()):
+                    if process.is_alive() or self._stop.is_set():
+                        continue
+                    logger.error(f"Job worker {name} exited with code {process.exitcode}; restarting")
+                    requeue_jobs(db, worker=name)
+                    self.restarts += 1
+                    self._spawn(name)
+                requeue_jobs(db, stale_before=datetime.utcnow() - timedelta(seconds=JOB_STALE_SECONDS))
+            except Exception as e:
+                logger.error(f"Job monitor failed: {e}")
+            finally:
+                db.close()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._monitor_stop.set()
+        if self._monitor is not None:
+            self._monitor.join(timeout=timeout)
+            self._monitor = None
+        deadline = time.monotonic() + timeout
+        for process in self._processes.values():
+            process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+        self._processes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "alive": sum(p.is_alive() for p in self._processes.values()),
+            "restarts": self.restarts,
+        }
+
+
+job_pool = JobWorkerPool()
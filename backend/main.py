@@ -1,9 +1,18 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from contextlib import asynccontextmanager
+import asyncio
+import time
 import logging
 
+# Measured before the heavy imports below, for the startup timing breakdown
+_import_start = time.perf_counter()
+
+from .uploads import UploadLimitMiddleware, UPLOAD_MAX_BYTES, UPLOAD_BULK_MAX_BYTES
+from .metrics import REGISTRY, ServerTimingMiddleware
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,26 +20,40 @@ logger = logging.getLogger(__name__)
 # Import routers (will be created in separate files)
 # from .routers import disease, yield_pred, fertilizer, auth, users
 
-# ML models will be loaded at startup
-ml_models = {}
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Load ML models on startup and cleanup on shutdown."""
+async def _load_models_in_background():
+    """Load and warm up models without blocking startup; /ready reports progress."""
+    from .ml_service import ml_service
     logger.info("Loading ML models...")
     try:
-        from .ml_service import load_models
-        global ml_models
-        ml_models = load_models()
-        logger.info(f"Successfully loaded {len(ml_models)} models")
+        models = await asyncio.to_thread(ml_service.load_models)
+        logger.info(f"Successfully loaded {len(models)} models")
     except Exception as e:
         logger.error(f"Failed to load models: {e}")
     
+    # Pick up new artifacts in models/ from now on
+    ml_service.registry.start_watching()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load ML models on startup and cleanup on shutdown."""
+    from .ml_service import ml_service
+    ml_service.startup_timings["app_imports"] = time.perf_counter() - _import_start
+    loader = asyncio.create_task(_load_models_in_background())
+    
+    # Job workers load their own models in separate processes
+    from .jobs import job_pool
+    job_pool.start()
+    
     yield
     
     # Cleanup
     logger.info("Shutting down...")
-    ml_models.clear()
+    if not loader.done():
+        loader.cancel()
+    await asyncio.to_thread(job_pool.stop)
+    await ml_service.shutdown()
+    from .embedding_store import embedding_store
+    embedding_store.flush()
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -49,6 +72,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads while they stream in, not after buffering them
+app.add_middleware(
+    UploadLimitMiddleware,
+    limits={
+        "/api/disease/predict/bulk": UPLOAD_BULK_MAX_BYTES,
+        "/api/disease/predict": UPLOAD_MAX_BYTES,
+        "/api/jobs/disease": UPLOAD_MAX_BYTES,
+        "/api/yield/predict/batch": UPLOAD_BULK_MAX_BYTES,
+    },
+)
+
+# Outermost, so the Server-Timing total covers the whole request
+app.add_middleware(ServerTimingMiddleware)
+
 # Security
 security = HTTPBearer()
 
@@ -61,21 +98,77 @@ async def root():
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness probe: 503 until models are loaded and warmed up, or if
+    startup failed and no model could be loaded.
+    """
+    from .ml_service import ml_service
+    if not ml_service.ready.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    if ml_service.startup_errors and not ml_service.models:
+        return JSONResponse(status_code=503, content={"status": "failed", "errors": ml_service.startup_errors})
+    return {
+        "status": "ready",
+        "startup_timings": ml_service.startup_timings,
+        "startup_errors": ml_service.startup_errors,
+    }
+
+def _check_database() -> str:
+    from sqlalchemy import text
+    from .database import engine
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return "connected"
+    except Exception as e:
+        logger.error(f"Database health check failed: {e}")
+        return "unavailable"
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics (text exposition format)."""
+    # Importing ml_service registers its model and executor gauges
+    from . import ml_service  # noqa: F401
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """Detailed health check."""
+    from .ml_service import ml_service
+    from .jobs import job_pool
+    from .uploads import decode_limiter
+    from .embedding_store import embedding_store
+    database = await asyncio.to_thread(_check_database)
     return {
-        "status": "healthy",
-        "models_loaded": len(ml_models),
-        "database": "connected"  # Will be implemented with DB
+        "status": "healthy" if database == "connected" else "degraded",
+        "ready": ml_service.ready.is_set(),
+        "models_loaded": len(ml_service.models),
+        "database": database,
+        "disease_backend": getattr(ml_service.models.get('disease_cnn'), "name", None),
+        "model_versions": {
+            name: ml_service.registry.version(name) for name in ml_service.models
+        },
+        "model_registry": ml_service.registry.status(),
+        "disease_batching": ml_service.disease_batcher.stats(),
+        "disease_cascade": ml_service.cascade.stats() if ml_service.cascade is not None else None,
+        "executors": ml_service.executor_stats(),
+        "prediction_cache": ml_service.prediction_cache.stats(),
+        "job_workers": job_pool.stats(),
+        "uploads": decode_limiter.stats(),
+        "embedding_store": embedding_store.stats()
     }
 
 # Include routers
-from .routers import auth, disease, yield_pred
+from .routers import auth, disease, yield_pred, fertilizer, admin, jobs
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(disease.router, prefix="/api/disease", tags=["Disease Detection"])
 app.include_router(yield_pred.router, prefix="/api/yield", tags=["Yield Prediction"])
+app.include_router(fertilizer.router, prefix="/api/fertilizer", tags=["Fertilizer"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Jobs"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,49 +1,457 @@
 import os
+import time
+import asyncio
+import importlib
+import threading
+import multiprocessing
 import numpy as np
-from tensorflow import keras
 import joblib
-from typing import Dict, Any, Tuple
+from collections import Counter
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Tuple, List, Sequence, Callable, Optional
 import logging
 
+from .inference_backends import DISEASE_BACKEND, BACKEND_ARTIFACTS, STUDENT_ARTIFACTS, BACKENDS, import_runtime
+from .model_registry import ModelRegistry, ModelVersion
+from .prediction_cache import PredictionCache
+from .embedding_store import EMBEDDING_STORE_ENABLED
+from .cascade import DISEASE_CASCADE, DiseaseCascade
+from .forest_compiler import CompiledForest, compile_forest
+from .preprocessing import to_float32
+from .tiling import tile_grid, green_fraction
+from .metrics import REGISTRY
+from .executors import (
+    BoundedExecutor,
+    ML_THREAD_WORKERS,
+    ML_PROCESS_WORKERS,
+    ML_MAX_PENDING,
+    init_yield_worker,
+    predict_yield_in_worker,
+)
+
 logger = logging.getLogger(__name__)
 
 # Model paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODELS_DIR = os.path.join(BASE_DIR, "models")
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.join(BASE_DIR, "models"))
+
+# Micro-batching settings for concurrent disease requests
+DISEASE_BATCH_MAX_SIZE = int(os.getenv("DISEASE_BATCH_MAX_SIZE", "16"))
+DISEASE_BATCH_MAX_WAIT_MS = float(os.getenv("DISEASE_BATCH_MAX_WAIT_MS", "10"))
+
+# Batch sizes the disease model is warmed up at before reporting ready
+ML_WARMUP_BATCH_SIZES = [
+    int(size) for size in os.getenv("ML_WARMUP_BATCH_SIZES", f"1,{DISEASE_BATCH_MAX_SIZE}").split(",")
+    if size.strip()
+]
+
+# Yield forest inference: "compiled" (flat arrays, see forest_compiler.py) or "sklearn"
+YIELD_FOREST_ENGINE = os.getenv("YIELD_FOREST_ENGINE", "compiled").lower()
+
+# Model-level metrics (request stages are timed in the routers)
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "tomato_model_inference_seconds", "Time spent in model calls", ("model",)
+)
+DISEASE_BATCH_SIZE = REGISTRY.histogram(
+    "tomato_disease_batch_size", "Images per disease model call", (),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+YIELD_PREDICTIONS = REGISTRY.counter(
+    "tomato_yield_predictions_total", "Yield predictions by source (ml model or heuristic fallback)",
+    ("prediction_type",)
+)
+MODEL_LOADED = REGISTRY.gauge(
+    "tomato_model_loaded", "1 for each loaded model version", ("model", "version")
+)
+EXECUTOR_QUEUE_DEPTH = REGISTRY.gauge(
+    "tomato_executor_queue_depth", "Calls waiting for an executor slot or worker", ("executor",)
+)
+EXECUTOR_IN_FLIGHT = REGISTRY.gauge(
+    "tomato_executor_in_flight", "Calls handed to an executor and not finished", ("executor",)
+)
+PREDICTION_CACHE_LOOKUPS = REGISTRY.counter(
+    "tomato_prediction_cache_lookups_total", "Prediction cache lookups by outcome", ("outcome",)
+)
+
+# Disease CNN output classes, in training (sorted folder name) order
+DISEASE_CLASSES = [
+    "Early_blight", "Healthy", "Late_blight", "Leaf Miner",
+    "Magnesium Deficiency", "Nitrogen Deficiency",
+    "Pottassium Deficiency", "Spotted Wilt Virus"
+]
+
+# Tiled (whole-plant) analysis settings
+TILE_SIZE = 224
+TILE_STRIDE = int(os.getenv("DISEASE_TILE_STRIDE", "112"))
+TILE_MIN_GREEN = float(os.getenv("DISEASE_TILE_MIN_GREEN", "0.2"))
+TILE_MAX_SIDE = int(os.getenv("DISEASE_TILE_MAX_SIDE", "1344"))
+
+
+class DiseaseBatcher:
+    """
+    Collects concurrent disease requests into micro-batches.
+
+    Requests are queued until either `max_batch_size` images are waiting or
+    `max_wait_ms` has passed since the first one arrived. The whole batch is
+    then passed to `predict_batch` in a single call and each awaiting request
+    receives its own result. When an executor is given the call runs there,
+    keeping the event loop free while the model works.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[Sequence[np.ndarray]], List[Dict[str, Any]]],
+        max_batch_size: int = DISEASE_BATCH_MAX_SIZE,
+        max_wait_ms: float = DISEASE_BATCH_MAX_WAIT_MS,
+        executor: Optional[BoundedExecutor] = None,
+    ):
+        self._predict_batch = predict_batch
+        self._executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        self.batch_sizes = Counter()
+        self.total_requests = 0
+        self.total_batches = 0
+
+    def _ensure_worker(self):
+        """Start the collector task on the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, image: np.ndarray) -> Dict[str, Any]:
+        """Queue one preprocessed image and wait for its prediction."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """Wait for the first request, then gather more until size or time runs out."""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait_ms / 1000.0
+        
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        # Take whatever else is already waiting without extending the window
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            
+            # Drop requests whose clients went away while queued
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                continue
+            
+            self._record(len(batch))
+            
+            images = [image for image, _ in batch]
+            try:
+                if self._executor is not None:
+                    results = await self._executor.run(self._predict_batch, images)
+                else:
+                    results = self._predict_batch(images)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _record(self, size: int):
+        self.batch_sizes[size] += 1
+        self.total_requests += size
+        self.total_batches += 1
+        logger.debug(f"Disease micro-batch of {size} request(s)")
+
+    def stats(self) -> Dict[str, Any]:
+        """Achieved batch sizes, for tuning throughput against tail latency."""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "requests": self.total_requests,
+            "batches": self.total_batches,
+            "mean_batch_size": (
+                self.total_requests / self.total_batches if self.total_batches else 0.0
+            ),
+            "batch_size_histogram": {
+                str(size): count for size, count in sorted(self.batch_sizes.items())
+            },
+        }
+
+    async def close(self):
+        """Stop the collector task."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
 
 class MLService:
     """ML model service for disease detection and yield prediction."""
     
     def __init__(self):
-        self.models = {}
-        self.class_names = [
-            "Early_blight", "Healthy", "Late_blight", "Leaf Miner",
-            "Magnesium Deficiency", "Nitrogen Deficiency",
-            "Pottassium Deficiency", "Spotted Wilt Virus"
-        ]
+        self.class_names = list(DISEASE_CLASSES)
+        
+        # Thread pool for TensorFlow and image work (TF releases the GIL)
+        self.thread_executor = BoundedExecutor(
+            ThreadPoolExecutor(max_workers=ML_THREAD_WORKERS, thread_name_prefix="ml"),
+            workers=ML_THREAD_WORKERS,
+            max_pending=ML_MAX_PENDING,
+            name="thread",
+        )
+        # Optional process pool for the sklearn yield model, (re)started whenever
+        # a yield model version is activated
+        self.process_executor: Optional[BoundedExecutor] = None
+        # Set in a pre-fork parent (backend/serve.py): a pool's handles and
+        # threads don't survive fork, so each worker starts its own instead
+        self.defer_process_pool = False
+        
+        # Versioned models, hot-reloaded from MODELS_DIR
+        self.registry = ModelRegistry()
+        self.registry.register(
+            'disease_cnn', self._disease_artifact, self._load_disease_backend,
+            warm_up=self._warm_up_disease,
+        )
+        if DISEASE_CASCADE:
+            self.registry.register(
+                'disease_student', self._student_artifact, self._load_disease_backend,
+                warm_up=partial(self._warm_up_disease, embeddings=False),
+            )
+        self.registry.register(
+            'yield', self._yield_artifact, self._load_yield_model,
+            warm_up=self._warm_up_yield, on_swap=self._on_yield_swap,
+        )
+        
+        # Interactive predictions also return embeddings for the similar-case store
+        self.disease_batcher = DiseaseBatcher(
+            partial(self.predict_disease_batch, with_embeddings=EMBEDDING_STORE_ENABLED),
+            executor=self.thread_executor,
+        )
+        self.prediction_cache = PredictionCache()
+        self.cascade = DiseaseCascade(self.class_names) if DISEASE_CASCADE else None
+        
+        # Set once models are loaded and warmed up (see /ready)
+        self.ready = threading.Event()
+        self.startup_timings: Dict[str, float] = {}
+        # Why a model failed to load at startup, by name
+        self.startup_errors: Dict[str, str] = {}
+    
+    @property
+    def models(self) -> Dict[str, Any]:
+        """Active models by name (a snapshot; swaps replace it)."""
+        return self.registry.models
+    
+    @property
+    def disease_model_version(self) -> str:
+        """Version of the active disease model(s), used to key cached predictions."""
+        version = self.registry.version('disease_cnn') or "none"
+        student = self.registry.version('disease_student') if self.cascade is not None else None
+        return f"{version}+{student}" if student else version
+    
+    @property
+    def yield_model_version(self) -> Optional[str]:
+        return self.registry.version('yield')
     
     def load_models(self):
-        """Load all ML models."""
+        """
+        Load all ML models in parallel, warm them up and mark the service ready.
+        
+        Timings for each phase are kept in `startup_timings` and logged. A
+        runtime that fails to import is recorded in `startup_errors` and the
+        remaining models still load; the service is marked ready either way,
+        so /ready can report the failure instead of warming up forever.
+        Later artifact changes are picked up by `registry.start_watching()`.
+        """
         try:
-            # Load CNN disease model
-            cnn_path = os.path.join(MODELS_DIR, "disease_model.h5")
-            if os.path.exists(cnn_path):
-                self.models['disease_cnn'] = keras.models.load_model(cnn_path)
-                logger.info("Loaded CNN disease model")
+            start = time.perf_counter()
             
-
+            # Import the runtimes concurrently, then load and warm up each model
+            # concurrently (the registry loads changed slots in parallel)
+            if self._disease_kind() != DISEASE_BACKEND:
+                logger.warning(f"No {DISEASE_BACKEND} artifact found, falling back to Keras")
+            
+            imports = {}
+            if os.path.exists(self._disease_artifact()):
+                imports["disease_cnn"] = (import_runtime, self._disease_kind())
+            if DISEASE_CASCADE and not os.path.exists(self._student_artifact()):
+                logger.warning(f"Disease cascade enabled but {self._student_artifact()} is missing; using the full model only")
+            if os.path.exists(self._yield_artifact()):
+                imports["yield"] = (importlib.import_module, "sklearn.ensemble")
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="import") as pool:
+                futures = {name: pool.submit(self._timed, *call) for name, call in imports.items()}
+                for name, future in futures.items():
+                    try:
+                        self.startup_timings[f"{name}_import"] = future.result()
+                    except Exception as e:
+                        logger.error(f"Failed to import the {name} runtime: {e}")
+                        self.startup_errors[name] = f"import failed: {e}"
             
-            # Load yield model
-            yield_path = os.path.join(MODELS_DIR, "yield_model.joblib")
-            if os.path.exists(yield_path):
-                self.models['yield'] = joblib.load(yield_path)
-                logger.info("Loaded yield prediction model")
+            for entry in self.registry.refresh():
+                self.startup_timings[f"{entry.name}_deserialize"] = entry.load_seconds
+                self.startup_timings[f"{entry.name}_warmup"] = entry.warmup_seconds
+            for name in imports:
+                if name not in self.models:
+                    error = self.registry.last_error or ""
+                    self.startup_errors.setdefault(name, error if error.startswith(f"{name} ") else "load failed")
+            self.startup_timings["total"] = time.perf_counter() - start
+            
+            breakdown = ", ".join(f"{k}={v:.2f}s" for k, v in self.startup_timings.items())
+            logger.info(f"Models ready ({len(self.models)} loaded): {breakdown}")
             
             return self.models
         
         except Exception as e:
             logger.error(f"Error loading models: {e}")
+            self.startup_errors["startup"] = str(e)
             raise
+        
+        finally:
+            self.ready.set()
+    
+    @staticmethod
+    def _timed(fn: Callable, *args) -> float:
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+    
+    @staticmethod
+    def _disease_kind() -> str:
+        """The configured disease backend, or Keras if its artifact is missing."""
+        kind = DISEASE_BACKEND
+        if kind not in BACKENDS:
+            raise ValueError(f"Unknown disease backend '{kind}' (expected one of {sorted(BACKENDS)})")
+        if kind != "keras" and not os.path.exists(os.path.join(MODELS_DIR, BACKEND_ARTIFACTS[kind])):
+            kind = "keras"
+        return kind
+    
+    @classmethod
+    def _disease_artifact(cls) -> str:
+        return os.path.join(MODELS_DIR, BACKEND_ARTIFACTS[cls._disease_kind()])
+    
+    @classmethod
+    def _student_artifact(cls) -> str:
+        return os.path.join(MODELS_DIR, STUDENT_ARTIFACTS[cls._disease_kind()])
+    
+    @staticmethod
+    def _yield_artifact() -> str:
+        return os.path.join(MODELS_DIR, "yield_model.joblib")
+    
+    @staticmethod
+    def _load_yield_model(path: str):
+        """Load the yield model, compiled to flat arrays when it is a supported forest."""
+        model = joblib.load(path)
+        if YIELD_FOREST_ENGINE != "compiled":
+            return model
+        try:
+            compiled = compile_forest(model)
+        except ValueError as e:
+            logger.info(f"Using scikit-learn for the yield model: {e}")
+            return model
+        logger.info(
+            f"Compiled yield forest: {compiled.n_trees} trees, {compiled.n_nodes} nodes, "
+            f"{compiled.nbytes / 1e6:.1f} MB"
+        )
+        return compiled
+    
+    @staticmethod
+    def _load_disease_backend(path: str):
+        name = os.path.basename(path)
+        kind = next(k for k in BACKENDS if name in (BACKEND_ARTIFACTS[k], STUDENT_ARTIFACTS[k]))
+        return BACKENDS[kind].load(path)
+    
+    @staticmethod
+    def _warm_up_disease(model, batch_sizes: Sequence[int] = ML_WARMUP_BATCH_SIZES, embeddings: bool = EMBEDDING_STORE_ENABLED):
+        """
+        Run throwaway predictions so graph tracing and allocator growth happen
+        before the first real request rather than during it.
+        """
+        for size in sorted(set(batch_sizes)):
+            batch = np.zeros((size, 224, 224, 3), dtype=np.float32)
+            model.predict(batch)
+            if embeddings:
+                model.predict_with_embeddings(batch)
+    
+    @staticmethod
+    def _warm_up_yield(model):
+        model.predict(np.zeros((1, 10)))
+    
+    def _on_yield_swap(self, entry: ModelVersion):
+        """Restart the sklearn process pool (if enabled) on the new yield model."""
+        if ML_PROCESS_WORKERS <= 0 or self.defer_process_pool:
+            return
+        
+        # Spawn rather than fork: forking after TensorFlow has started its
+        # thread pools is not safe
+        pool = ProcessPoolExecutor(
+            max_workers=ML_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_yield_worker,
+            initargs=(entry.model,),
+        )
+        previous = self.process_executor
+        self.process_executor = BoundedExecutor(
+            pool,
+            workers=ML_PROCESS_WORKERS,
+            max_pending=ML_MAX_PENDING,
+            name="process",
+            copy_context=False,
+        )
+        # Calls already handed to the old pool finish on the old model
+        if previous is not None:
+            previous.shutdown(cancel_pending=False)
+        logger.info(f"Started yield process pool with {ML_PROCESS_WORKERS} workers (version {entry.version})")
+    
+    def start_process_pool(self):
+        """Start the yield process pool on the active yield model (e.g. in a forked worker), if enabled."""
+        self.defer_process_pool = False
+        entry = self.registry.active('yield')
+        if entry is not None and self.process_executor is None:
+            self._on_yield_swap(entry)
+    
+    async def run_in_thread(self, fn: Callable, *args) -> Any:
+        """Run blocking work (decode, resize, inference) off the event loop."""
+        return await self.thread_executor.run(fn, *args)
+    
+    def executor_stats(self) -> Dict[str, Any]:
+        """Queue-depth metrics for each executor."""
+        stats = {"thread": self.thread_executor.stats()}
+        if self.process_executor is not None:
+            stats["process"] = self.process_executor.stats()
+        return stats
+    
+    async def shutdown(self):
+        """Stop the model watcher, batcher and executors."""
+        self.registry.stop()
+        await self.disease_batcher.close()
+        self.thread_executor.shutdown()
+        if self.process_executor is not None:
+            self.process_executor.shutdown()
+            self.process_executor = None
     
     def predict_disease(
         self,
@@ -58,41 +466,215 @@ class MLService:
         Returns:
             Dictionary with prediction results
         """
+        # Accept an already batched (1, 224, 224, 3) array as before
+        if len(image.shape) == 4:
+            image = image[0]
+        
+        return self.predict_disease_batch([image])[0]
+    
+    def predict_disease_batch(
+        self,
+        images: Sequence[np.ndarray],
+        with_embeddings: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Predict diseases for several leaf images with one model call.
+        
+        Args:
+            images: Preprocessed leaf image arrays, each (224, 224, 3),
+                or an already stacked (N, 224, 224, 3) float32 array
+            with_embeddings: Also return each image's pooled backbone
+                embedding (float16) under `embedding`, when the backend has one
+                (only images the full model classified have one)
+        
+        In cascade mode the student model classifies the batch first and only
+        the images it is unsure about, or puts on the watchlist, are passed to
+        the full model.
+        
+        Returns:
+            One prediction dictionary per image, in input order
+        """
         try:
-            if 'disease_cnn' not in self.models:
+            # Pin one version for the whole batch, even if a swap happens meanwhile
+            entry = self.registry.active('disease_cnn')
+            if entry is None:
                 raise ValueError("Disease model not loaded")
             
-            model = self.models['disease_cnn']
+            # Stack into a single (N, 224, 224, 3) batch
+            if isinstance(images, np.ndarray) and images.ndim == 4:
+                batch = images.astype(np.float32, copy=False)
+            else:
+                batch = np.stack(images).astype(np.float32, copy=False)
             
-            # Ensure correct shape
-            if len(image.shape) == 3:
-                image = np.expand_dims(image, axis=0)
+            student = self.registry.active('disease_student') if self.cascade is not None else None
+            if student is None:
+                return self._predict_full(entry, batch, with_embeddings)
             
-            # Predict
-            predictions = model.predict(image, verbose=0)[0]
+            # Cascade: keep the student's confident answers, escalate the rest
+            with INFERENCE_SECONDS.time(model="disease_student"):
+                student_probs = np.asarray(student.model.predict(batch))
+            escalated, watched = self.cascade.escalate(student_probs)
+            self.cascade.record(escalated, watched)
             
-            # Get top prediction
-            top_idx = np.argmax(predictions)
-            confidence = float(predictions[top_idx])
-            disease = self.class_names[top_idx]
+            results = [
+                None if escalate else self._format_disease_result(probs, student.version, "CNN-student")
+                for probs, escalate in zip(student_probs, escalated)
+            ]
+            indices = np.flatnonzero(escalated)
+            if len(indices):
+                full = self._predict_full(entry, batch[indices], with_embeddings)
+                for i, result in zip(indices, full):
+                    results[i] = result
+            return results
+        
+        except Exception as e:
+            logger.error(f"Error in disease prediction: {e}")
+            raise
+    
+    def _predict_full(self, entry: ModelVersion, batch: np.ndarray, with_embeddings: bool) -> List[Dict[str, Any]]:
+        """Run the full disease model on a stacked batch."""
+        embeddings = None
+        with INFERENCE_SECONDS.time(model="disease_cnn"):
+            if with_embeddings:
+                predictions, embeddings = entry.model.predict_with_embeddings(batch)
+            else:
+                predictions = entry.model.predict(batch)
+        DISEASE_BATCH_SIZE.observe(len(batch))
+        
+        results = [self._format_disease_result(probs, entry.version) for probs in predictions]
+        if embeddings is not None:
+            for result, embedding in zip(results, np.asarray(embeddings, dtype=np.float16)):
+                result["embedding"] = embedding
+        return results
+    
+    def predict_disease_tiled(
+        self,
+        image: np.ndarray,
+        stride: int = TILE_STRIDE,
+        min_green: float = TILE_MIN_GREEN,
+    ) -> Dict[str, Any]:
+        """
+        Analyse a whole-plant photo tile by tile.
+        
+        The image is cut into overlapping 224x224 tiles; tiles with too few
+        green pixels are skipped as background, and the rest are classified
+        in a single batched model call.
+        
+        Args:
+            image: Decoded uint8 RGB image (H, W, 3), at most TILE_MAX_SIDE per side
+            stride: Step between tile origins in pixels
+            min_green: Minimum fraction of green pixels for a tile to be analysed
+        
+        Returns:
+            Prediction dictionary for the whole image plus a `tiles` map
+        """
+        try:
+            entry = self.registry.active('disease_cnn')
+            if entry is None:
+                raise ValueError("Disease model not loaded")
             
-            # All predictions
-            all_preds = {
-                self.class_names[i]: float(predictions[i])
-                for i in range(len(self.class_names))
-            }
+            # Photos smaller than a tile are scaled up so at least one tile fits
+            if min(image.shape[:2]) < TILE_SIZE:
+                from PIL import Image
+                scale = TILE_SIZE / min(image.shape[:2])
+                size = (max(TILE_SIZE, round(image.shape[1] * scale)), max(TILE_SIZE, round(image.shape[0] * scale)))
+                image = np.asarray(Image.fromarray(image).resize(size))
             
-            return {
-                "disease": disease,
-                "confidence": confidence,
-                "all_predictions": all_preds,
-                "model_used": "CNN"
-            }
+            windows, rows, cols = tile_grid(image, TILE_SIZE, stride)
+            green = green_fraction(image, TILE_SIZE, rows, cols)
+            keep_r, keep_c = np.nonzero(green >= min_green)
+            
+            # Nothing leafy enough: fall back to the most leafy tile
+            if len(keep_r) == 0:
+                best = np.unravel_index(np.argmax(green), green.shape)
+                keep_r, keep_c = np.array([best[0]]), np.array([best[1]])
+            
+            # Gather only the kept tiles (the one copy) and scale to float32
+            tiles = windows[np.asarray(rows)[keep_r], np.asarray(cols)[keep_c]]
+            batch = to_float32(tiles)
+            with INFERENCE_SECONDS.time(model="disease_cnn"):
+                probs = np.asarray(entry.model.predict(batch))
+            DISEASE_BATCH_SIZE.observe(len(batch))
+            
+            result = self._aggregate_tiles(probs, keep_r, keep_c, len(rows), len(cols), stride, green)
+            result["model_version"] = entry.version
+            return result
         
         except Exception as e:
-            logger.error(f"Error in disease prediction: {e}")
+            logger.error(f"Error in tiled disease prediction: {e}")
             raise
     
+    def _aggregate_tiles(self, probs, keep_r, keep_c, n_rows, n_cols, stride, green) -> Dict[str, Any]:
+        """Combine per-tile probabilities into a disease map and summary."""
+        top = probs.argmax(axis=1)
+        healthy_idx = self.class_names.index("Healthy")
+        
+        # Per-tile map; background tiles stay None
+        labels = [[None] * n_cols for _ in range(n_rows)]
+        confidence = [[None] * n_cols for _ in range(n_rows)]
+        for (r, c), idx, p in zip(zip(keep_r, keep_c), top, probs):
+            labels[r][c] = self.class_names[idx]
+            confidence[r][c] = round(float(p[idx]), 4)
+        
+        counts = np.bincount(top, minlength=len(self.class_names))
+        diseased = counts.copy()
+        diseased[healthy_idx] = 0
+        
+        # The image is diseased if any tile is; report the most widespread problem
+        dominant = int(np.argmax(diseased)) if diseased.any() else healthy_idx
+        mean_probs = probs.mean(axis=0)
+        
+        return {
+            "disease": self.class_names[dominant],
+            "confidence": float(probs[top == dominant, dominant].max()),
+            "all_predictions": {
+                name: float(mean_probs[i]) for i, name in enumerate(self.class_names)
+            },
+            "model_used": "CNN",
+            "tiles": {
+                "rows": n_rows,
+                "cols": n_cols,
+                "tile_size": TILE_SIZE,
+                "stride": stride,
+                "tiles_total": n_rows * n_cols,
+                "tiles_analyzed": int(len(top)),
+                "diseased_fraction": float(diseased.sum() / len(top)),
+                "tile_counts": {
+                    name: int(counts[i]) for i, name in enumerate(self.class_names) if counts[i]
+                },
+                "labels": labels,
+                "confidence": confidence,
+                "green_fraction": np.round(green, 3).tolist(),
+            },
+        }
+    
+    async def predict_disease_async(self, image: np.ndarray) -> Dict[str, Any]:
+        """Predict disease, sharing a model call with concurrent requests."""
+        return await self.disease_batcher.submit(image)
+    
+    def _format_disease_result(
+        self, predictions: np.ndarray, model_version: Optional[str] = None, model_used: str = "CNN"
+    ) -> Dict[str, Any]:
+        """Turn one row of class probabilities into a response dictionary."""
+        # Get top prediction
+        top_idx = np.argmax(predictions)
+        confidence = float(predictions[top_idx])
+        disease = self.class_names[top_idx]
+        
+        # All predictions
+        all_preds = {
+            self.class_names[i]: float(predictions[i])
+            for i in range(len(self.class_names))
+        }
+        
+        return {
+            "disease": disease,
+            "confidence": confidence,
+            "all_predictions": all_preds,
+            "model_used": model_used,
+            "model_version": model_version
+        }
+    
     def predict_yield(
         self,
         season: int,
@@ -118,6 +700,7 @@ class MLService:
         try:
             if 'yield' not in self.models:
                 # Fallback to heuristic
+                YIELD_PREDICTIONS.inc(prediction_type="heuristic")
                 return self._heuristic_yield(
                     season, temperature, rainfall, nitrogen, phosphorus, potassium, ph
                 )
@@ -131,7 +714,9 @@ class MLService:
             ]])
             
             # Predict
-            yield_pred = model.predict(features)[0]
+            with INFERENCE_SECONDS.time(model="yield"):
+                yield_pred = model.predict(features)[0]
+            YIELD_PREDICTIONS.inc(prediction_type="ml")
             
             return float(yield_pred)
         
@@ -139,6 +724,113 @@ class MLService:
             logger.error(f"Error in yield prediction: {e}")
             raise
     
+    async def predict_yield_async(self, **features) -> float:
+        """
+        Predict yield without blocking the event loop.
+        
+        Uses the process pool when one is running, otherwise the thread pool.
+        Takes the same keyword arguments as `predict_yield`.
+        """
+        executor = self.process_executor
+        if executor is not None and 'yield' in self.models:
+            row = np.array([[
+                features["season"], features["temperature"], features["rainfall"],
+                features["humidity"], features["nitrogen"], features["phosphorus"],
+                features["potassium"], features["ph"], features["organic_carbon"],
+                features["variety"]
+            ]])
+            YIELD_PREDICTIONS.inc(prediction_type="ml")
+            try:
+                yield_pred = await executor.run(predict_yield_in_worker, row)
+            except RuntimeError:
+                # The pool was replaced by a model swap while this call waited
+                if executor is self.process_executor:
+                    raise
+                yield_pred = await self.process_executor.run(predict_yield_in_worker, row)
+            return float(yield_pred[0])
+        
+        return await self.thread_executor.run(partial(self.predict_yield, **features))
+    
+    def predict_yield_batch(self, features: np.ndarray) -> Tuple[np.ndarray, str]:
+        """
+        Predict tomato yield for many rows with one model call.
+        
+        Args:
+            features: (N, 10) matrix in `predict_yield` argument order, with
+                season and variety already encoded
+        
+        Returns:
+            (yields in tons/hectare, prediction type "ml" or "heuristic")
+        """
+        features = np.asarray(features, dtype=np.float64)
+        if 'yield' not in self.models:
+            YIELD_PREDICTIONS.inc(len(features), prediction_type="heuristic")
+            preds = self._heuristic_yield_batch(
+                features[:, 0].astype(np.intp), *features[:, [1, 2, 4, 5, 6, 7]].T
+            )
+            return preds, "heuristic"
+        
+        with INFERENCE_SECONDS.time(model="yield"):
+            preds = self.models['yield'].predict(features)
+        YIELD_PREDICTIONS.inc(len(features), prediction_type="ml")
+        return np.asarray(preds, dtype=np.float64), "ml"
+    
+    async def predict_yield_batch_async(self, features: np.ndarray) -> Tuple[np.ndarray, str]:
+        """`predict_yield_batch` off the event loop (process pool when one is running)."""
+        executor = self.process_executor
+        if executor is not None and 'yield' in self.models:
+            YIELD_PREDICTIONS.inc(len(features), prediction_type="ml")
+            try:
+                preds = await executor.run(predict_yield_in_worker, features)
+            except RuntimeError:
+                # The pool was replaced by a model swap while this call waited
+                if executor is self.process_executor:
+                    raise
+                preds = await self.process_executor.run(predict_yield_in_worker, features)
+            return np.asarray(preds, dtype=np.float64), "ml"
+        
+        return await self.thread_executor.run(self.predict_yield_batch, features)
+    
+    def predict_yield_grid(
+        self,
+        base: np.ndarray,
+        axes: Sequence[Tuple[int, np.ndarray]],
+    ) -> Tuple[np.ndarray, str]:
+        """
+        Predict tomato yield over a Cartesian grid of feature values.
+        
+        Args:
+            base: the 10 features in `predict_yield` argument order, with
+                season and variety already encoded
+            axes: (feature index, values) pairs for the features to vary;
+                the others stay at `base`
+        
+        Returns:
+            (yields shaped by the axis lengths, prediction type "ml" or "heuristic")
+        
+        A compiled forest evaluates the grid directly (see
+        `CompiledForest.predict_grid`); other models and the heuristic get
+        the expanded grid as one feature matrix.
+        """
+        base = np.asarray(base, dtype=np.float64)
+        shape = tuple(len(values) for _, values in axes)
+        model = self.models.get('yield')
+        if isinstance(model, CompiledForest):
+            with INFERENCE_SECONDS.time(model="yield"):
+                grid = model.predict_grid(base, axes)
+            YIELD_PREDICTIONS.inc(grid.size, prediction_type="ml")
+            return grid, "ml"
+        
+        matrix = np.tile(base, (int(np.prod(shape)), 1))
+        for (feature, _), column in zip(axes, np.meshgrid(*[values for _, values in axes], indexing="ij")):
+            matrix[:, feature] = column.ravel()
+        preds, prediction_type = self.predict_yield_batch(matrix)
+        return preds.reshape(shape), prediction_type
+    
+    async def predict_yield_grid_async(self, base: np.ndarray, axes: Sequence[Tuple[int, np.ndarray]]) -> Tuple[np.ndarray, str]:
+        """`predict_yield_grid` off the event loop."""
+        return await self.thread_executor.run(self.predict_yield_grid, base, axes)
+    
     def _heuristic_yield(
         self,
         season: int,
@@ -170,11 +862,53 @@ class MLService:
         yield_tons = base_yield * season_impact * temp_impact * rain_impact * npk_impact * ph_impact
         
         return max(5.0, min(25.0, yield_tons))
+    
+    def _heuristic_yield_batch(
+        self,
+        season: np.ndarray,
+        temperature: np.ndarray,
+        rainfall: np.ndarray,
+        nitrogen: np.ndarray,
+        phosphorus: np.ndarray,
+        potassium: np.ndarray,
+        ph: np.ndarray
+    ) -> np.ndarray:
+        """`_heuristic_yield` over arrays of rows (season as integer codes)."""
+        base_yield = 15.0
+        season_impact = np.array([1.2, 1.0, 0.8])[season]
+        temp_impact = 1.0 - 0.02 * np.abs(temperature - 24)
+        rain_impact = 1.0 - 0.003 * np.abs(rainfall - 175)
+        npk_impact = (nitrogen / 250) * 0.4 + (phosphorus / 70) * 0.3 + (potassium / 175) * 0.3
+        ph_impact = 1.0 - 0.1 * np.abs(ph - 6.5)
+        
+        yield_tons = base_yield * season_impact * temp_impact * rain_impact * npk_impact * ph_impact
+        
+        # fmin/fmax clip NaN like the scalar min/max calls
+        return np.fmax(5.0, np.fmin(25.0, yield_tons))
 
 def load_models() -> Dict[str, Any]:
-    """Load all ML models at startup."""
-    service = MLService()
-    return service.load_models()
+    """Load all ML models at startup into the shared service instance."""
+    return ml_service.load_models()
 
 # Global service instance
 ml_service = MLService()
+
+def _model_gauges():
+    for name in ml_service.models:
+        yield {"model": name, "version": ml_service.registry.version(name)}, 1
+
+def _executor_gauge(field):
+    def collect():
+        for name, stats in ml_service.executor_stats().items():
+            yield {"executor": name}, stats[field]
+    return collect
+
+def _cache_gauges():
+    stats = ml_service.prediction_cache.stats()
+    for outcome in ("hits", "perceptual_hits", "persistent_hits", "misses"):
+        yield {"outcome": outcome}, stats[outcome]
+
+MODEL_LOADED.set_function(_model_gauges)
+EXECUTOR_QUEUE_DEPTH.set_function(_executor_gauge("queue_depth"))
+EXECUTOR_IN_FLIGHT.set_function(_executor_gauge("in_flight"))
+PREDICTION_CACHE_LOOKUPS.set_function(_cache_gauges)
@@ -0,0 +1,255 @@
+"""
+Versioned, hot-reloadable registry of the served models.
+
+Each registered model has a slot that knows where its artifact lives and how
+to load it. A background watcher polls the artifacts; when one changes, the
+new version is loaded and warmed up off to the side and then swapped in by
+replacing a single snapshot dict. Requests that already picked up the old
+model finish on it. The last few versions stay in memory so a bad deploy can
+be rolled back without touching disk.
+"""
+import os
+import time
+import threading
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+
+from .inference_backends import artifact_version
+
+logger = logging.getLogger(__name__)
+
+# Registry settings
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "30"))  # seconds, 0 disables the watcher
+MODEL_KEEP_VERSIONS = int(os.getenv("MODEL_KEEP_VERSIONS", "2"))  # previous versions kept for rollback
+
+
+class ModelVersion:
+    """One loaded version of a model."""
+
+    def __init__(self, name: str, version: str, model: Any, path: str, load_seconds: float):
+        self.name = name
+        self.version = version
+        self.model = model
+        self.path = path
+        self.load_seconds = load_seconds
+        self.warmup_seconds = 0.0
+        self.loaded_at = time.time()
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": round(self.warmup_seconds, 3),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class _Slot:
+    def __init__(self, locate, load, warm_up, on_swap):
+        self.locate = locate
+        self.load = load
+        self.warm_up = warm_up
+        self.on_swap = on_swap
+
+
+class ModelRegistry:
+    """
+    Holds the active version of every model plus a short rollback history.
+
+    The active set is a dict that is replaced on every swap, never mutated,
+    so readers never see a half-updated set of models.
+    """
+
+    def __init__(self, keep_versions: int = MODEL_KEEP_VERSIONS, watch_interval: float = MODEL_WATCH_INTERVAL):
+        self.keep_versions = max(0, keep_versions)
+        self.watch_interval = watch_interval
+        self._slots: Dict[str, _Slot] = {}
+        self._active: Dict[str, ModelVersion] = {}
+        self._previous: Dict[str, deque] = {}
+        # Artifact versions not to load again until the file changes
+        # (failed to load, or rolled back from)
+        self._skipped: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.swaps = 0
+        self.rollbacks = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def register(
+        self,
+        name: str,
+        locate: Callable[[], Optional[str]],
+        load: Callable[[str], Any],
+        warm_up: Optional[Callable[[Any], None]] = None,
+        on_swap: Optional[Callable[[ModelVersion], None]] = None,
+    ):
+        """
+        Register a model slot.
+
+        `locate()` returns the artifact path (or None if there is none yet),
+        `load(path)` deserializes it, `warm_up(model)` runs before the new
+        version is swapped in and `on_swap(entry)` right after.
+        """
+        self._slots[name] = _Slot(locate, load, warm_up, on_swap)
+        self._previous[name] = deque(maxlen=self.keep_versions or None)
+        self._skipped[name] = set()
+
+    @property
+    def models(self) -> Dict[str, Any]:
+        """Snapshot of the active models by name."""
+        return {name: entry.model for name, entry in self._active.items()}
+
+    def active(self, name: str) -> Optional[ModelVersion]:
+        return self._active.get(name)
+
+    def version(self, name: str) -> Optional[str]:
+        entry = self._active.get(name)
+        return entry.version if entry is not None else None
+
+    def refresh(self, names: Optional[List[str]] = None) -> List[ModelVersion]:
+        """
+        Load every model (or just `names`) whose artifact changed, in
+        parallel, and swap them in.
+
+        Returns the newly activated versions.
+        """
+        with self._refresh_lock:
+            pending = []
+            for name, slot in self._slots.items():
+                if names is not None and name not in names:
+                    continue
+                path = slot.locate()
+                if path is None or not os.path.exists(path):
+                    continue
+                try:
+                    version = artifact_version(path)
+                except OSError:
+                    continue  # replaced mid-check; picked up on the next poll
+                if version == self.version(name) or version in self._skipped[name]:
+                    continue
+                pending.append((name, path, version))
+
+            if not pending:
+                return []
+
+            with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="model-load") as pool:
+                futures = [pool.submit(self._load, *args) for args in pending]
+                loaded = [f.result() for f in futures]
+
+            activated = [entry for entry in loaded if entry is not None]
+            for entry in activated:
+                self._activate(entry)
+            return activated
+
+    def _load(self, name: str, path: str, version: str) -> Optional[ModelVersion]:
+        slot = self._slots[name]
+
+        # A version still in the rollback history does not need reloading
+        for entry in self._previous[name]:
+            if entry.version == version:
+                return entry
+
+        try:
+            start = time.perf_counter()
+            entry = ModelVersion(name, version, slot.load(path), path, time.perf_counter() - start)
+            if slot.warm_up is not None:
+                start = time.perf_counter()
+                slot.warm_up(entry.model)
+                entry.warmup_seconds = time.perf_counter() - start
+            logger.info(f"Loaded {name} version {version} from {path} in {entry.load_seconds:.2f}s")
+            return entry
+        except Exception as e:
+            # Keep serving the current version; don't retry until the file changes
+            logger.error(f"Failed to load {name} version {version} from {path}: {e}")
+            self._skipped[name].add(version)
+            self.failures += 1
+            self.last_error = f"{name} {version}: {e}"
+            return None
+
+    def _activate(self, entry: ModelVersion, rollback: bool = False):
+        with self._lock:
+            history = self._previous[entry.name]
+            if entry in history:
+                history.remove(entry)
+            current = self._active.get(entry.name)
+            if current is not None and self.keep_versions:
+                history.appendleft(current)
+            self._active = {**self._active, entry.name: entry}
+            if rollback:
+                self.rollbacks += 1
+            else:
+                self.swaps += 1
+
+        logger.info(f"Activated {entry.name} version {entry.version}")
+        on_swap = self._slots[entry.name].on_swap
+        if on_swap is not None:
+            on_swap(entry)
+
+    def rollback(self, name: str, version: Optional[str] = None) -> ModelVersion:
+        """
+        Switch back to a previous version (the most recent one by default).
+
+        The version being replaced is not reloaded from disk until its
+        artifact changes again.
+        """
+        if name not in self._slots:
+            raise KeyError(f"Unknown model '{name}'")
+        with self._refresh_lock:
+            history = self._previous[name]
+            candidates = [e for e in history if version is None or e.version == version]
+            if not candidates:
+                wanted = f"version {version} of {name}" if version else f"previous version of {name}"
+                raise LookupError(f"No {wanted} is loaded")
+
+            current = self._active.get(name)
+            if current is not None:
+                self._skipped[name].add(current.version)
+            target = candidates[0]
+            self._skipped[name].discard(target.version)
+            self._activate(target, rollback=True)
+            return target
+
+    def start_watching(self):
+        """Poll the artifacts every `watch_interval` seconds in a daemon thread."""
+        if self.watch_interval <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Model refresh failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> Dict[str, Any]:
+        """Active and rollback versions per model, for /health."""
+        return {
+            "watch_interval": self.watch_interval,
+            "keep_versions": self.keep_versions,
+            "swaps": self.swaps,
+            "rollbacks": self.rollbacks,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "models": {
+                name: {
+                    "active": self._active[name].describe() if name in self._active else None,
+                    "previous": [entry.version for entry in self._previous[name]],
+                }
+                for name in self._slots
+            },
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, JSON, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -108,3 +108,34 @@ class WeatherCache(Base):
     weather_data = Column(JSON)
     expires_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class PredictionCacheEntry(Base):
+    """Cached disease predictions keyed by image content hash."""
+    __tablename__ = "prediction_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String, index=True, nullable=False)
+    model_version = Column(String, nullable=False)
+    result = Column(JSON)
+    expires_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class PredictionJob(Base):
+    """Queued disease/yield prediction, processed by the job workers."""
+    __tablename__ = "prediction_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # disease, yield
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    priority = Column(Integer, default=5)  # higher runs first
+    input_data = Column(JSON)  # request parameters
+    input_blob = Column(LargeBinary)  # uploaded image, cleared once the job finishes
+    result = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    worker = Column(String)  # worker holding the job while running
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
@@ -0,0 +1,192 @@
+"""
+Parity and cost report for the disease CNN inference backends.
+
+Compares each backend against the full Keras model on a sample of leaf
+images (top-1 agreement and probability drift) and reports load time,
+latency and resident memory. Every backend is measured in its own fresh
+process so RSS numbers are not polluted by the others.
+
+Usage:
+    python -m backend.parity --backends keras tflite onnx --samples path/to/val
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+from typing import Dict, Any, List
+
+from .inference_backends import BACKENDS, BACKEND_ARTIFACTS
+from .preprocessing import preprocess_image
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAMPLES = os.path.join(BASE_DIR, "data", "Variant-a(Multiclass Classification)", "val")
+DEFAULT_MODELS_DIR = os.path.join(BASE_DIR, "models")
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def load_samples(sample_dir: str, limit: int, size=(224, 224)) -> np.ndarray:
+    """Load up to `limit` images (recursively) as a float32 (N, 224, 224, 3) batch."""
+    paths = []
+    for root, _, files in os.walk(sample_dir):
+        paths.extend(
+            os.path.join(root, f) for f in sorted(files)
+            if os.path.splitext(f)[1].lower() in IMAGE_EXTENSIONS
+        )
+
+    # Spread the sample across class folders rather than taking the first one
+    if len(paths) > limit:
+        paths = [paths[i] for i in np.linspace(0, len(paths) - 1, limit).astype(int)]
+
+    batch = np.empty((len(paths), *size, 3), dtype=np.float32)
+    for i, path in enumerate(paths):
+        preprocess_image(path, size, out=batch[i])
+    return batch
+
+
+def compare(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Top-1 agreement and probability drift of `candidate` against `reference`."""
+    drift = np.abs(reference - candidate)
+    return {
+        "top1_agreement": float(np.mean(reference.argmax(1) == candidate.argmax(1))),
+        "mean_abs_drift": float(drift.mean()),
+        "max_abs_drift": float(drift.max()),
+        "p99_abs_drift": float(np.percentile(drift.max(1), 99)),
+    }
+
+
+def _rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+
+    # Peak rather than current RSS, but the best available off Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def _latency_ms(backend, batch: np.ndarray, repeats: int) -> Dict[str, float]:
+    backend.predict(batch)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(batch)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "per_image_ms": float(np.percentile(timings, 50)) / len(batch),
+    }
+
+
+def measure_backend(kind: str, model_path: str, samples_path: str, batch_size: int, repeats: int) -> Dict[str, Any]:
+    """Load one backend and measure it; meant to run in a fresh process."""
+    samples = np.load(samples_path)
+    rss_before = _rss_mb()
+
+    start = time.perf_counter()
+    backend = BACKENDS[kind].load(model_path)
+    load_seconds = time.perf_counter() - start
+
+    probs = np.concatenate([
+        backend.predict(samples[i:i + batch_size])
+        for i in range(0, len(samples), batch_size)
+    ])
+
+    return {
+        "backend": kind,
+        "artifact_mb": os.path.getsize(model_path) / 1e6,
+        "load_seconds": load_seconds,
+        "rss_mb": _rss_mb(),
+        "rss_model_mb": _rss_mb() - rss_before,
+        "latency_batch_1": _latency_ms(backend, samples[:1], repeats),
+        f"latency_batch_{batch_size}": _latency_ms(backend, samples[:batch_size], max(1, repeats // 4)),
+        "probs": probs,
+    }
+
+
+def run_report(backends: List[str], samples: np.ndarray, models_dir: str, batch_size: int = 32, repeats: int = 20) -> Dict[str, Any]:
+    """Measure every available backend and compare it with Keras."""
+    if "keras" not in backends:
+        backends = ["keras"] + backends
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        samples_path = os.path.join(tmp, "samples.npy")
+        np.save(samples_path, samples)
+
+        for kind in backends:
+            path = os.path.join(models_dir, BACKEND_ARTIFACTS[kind])
+            if not os.path.exists(path):
+                results[kind] = {"backend": kind, "error": f"missing artifact {path}"}
+                continue
+            with ctx.Pool(1) as pool:
+                try:
+                    results[kind] = pool.apply(
+                        measure_backend, (kind, path, samples_path, batch_size, repeats)
+                    )
+                except Exception as e:
+                    results[kind] = {"backend": kind, "error": str(e)}
+
+    reference = results["keras"].get("probs")
+    report = {"samples": int(len(samples)), "backends": []}
+    for kind in backends:
+        entry = results[kind]
+        probs = entry.pop("probs", None)
+        if probs is not None and reference is not None:
+            entry["parity"] = compare(reference, probs)
+        report["backends"].append(entry)
+    return report
+
+
+def _print_table(report: Dict[str, Any]):
+    print(f"\nParity report on {report['samples']} sample images")
+    print(f"{'backend':<8} {'size MB':>8} {'load s':>7} {'RSS MB':>7} {'b1 p50 ms':>10} {'top-1':>7} {'max drift':>10}")
+    for entry in report["backends"]:
+        if "error" in entry:
+            print(f"{entry['backend']:<8} {entry['error']}")
+            continue
+        parity = entry.get("parity", {})
+        print(
+            f"{entry['backend']:<8} {entry['artifact_mb']:>8.1f} {entry['load_seconds']:>7.2f} "
+            f"{entry['rss_model_mb']:>7.0f} {entry['latency_batch_1']['p50_ms']:>10.2f} "
+            f"{parity.get('top1_agreement', float('nan')):>7.3f} {parity.get('max_abs_drift', float('nan')):>10.4f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare disease CNN inference backends")
+    parser.add_argument("--backends", nargs="+", default=["keras", "tflite", "onnx"], choices=sorted(BACKENDS))
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="Directory of sample leaf images")
+    parser.add_argument("--limit", type=int, default=200, help="Max sample images")
+    parser.add_argument("--models-dir", default=DEFAULT_MODELS_DIR)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples, args.limit)
+    if len(samples) == 0:
+        print(f"Error: no sample images found under {args.samples}")
+        sys.exit(1)
+
+    report = run_report(args.backends, samples, args.models_dir, args.batch_size, args.repeats)
+    _print_table(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
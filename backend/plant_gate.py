@@ -0,0 +1,80 @@
+"""
+Out-of-distribution gate built on the disease CNN's own backbone.
+
+Instead of running a second ImageNet MobileNetV2 to decide whether an image
+is a leaf, the disease model is extended to also return its pooled backbone
+embedding. The gate compares that embedding with per-class centroids
+measured on the training set: images far from every class centroid are
+treated as unrecognized.
+"""
+import numpy as np
+from typing import Any, Tuple
+
+# Artifact written by `python model_trainer.py --build-gate`
+GATE_ARTIFACT = "plant_gate.npz"
+
+
+def build_gated_model(model: Any):
+    """
+    Wrap a trained disease model so one forward pass returns
+    (class probabilities, pooled embedding).
+    """
+    from tensorflow import keras
+
+    pool = next(
+        (layer for layer in model.layers if isinstance(layer, keras.layers.GlobalAveragePooling2D)),
+        None,
+    )
+    if pool is None:
+        raise ValueError("Disease model has no GlobalAveragePooling2D layer to take embeddings from")
+
+    return keras.Model(model.inputs, [model.outputs[0], pool.output])
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+class PlantGate:
+    """Nearest-centroid cosine-distance check over backbone embeddings."""
+
+    def __init__(self, centroids: np.ndarray, thresholds: np.ndarray):
+        self.centroids = _normalize(centroids)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, labels: np.ndarray, num_classes: int, quantile: float = 0.99) -> "PlantGate":
+        """
+        Build centroids from training embeddings; each class threshold is the
+        `quantile` of its own training images' distance to the centroid.
+        """
+        embeddings = _normalize(embeddings)
+        centroids = np.zeros((num_classes, embeddings.shape[1]), dtype=np.float32)
+        thresholds = np.zeros(num_classes, dtype=np.float32)
+        for c in range(num_classes):
+            members = embeddings[labels == c]
+            if len(members) == 0:
+                continue
+            centroids[c] = _normalize(members.mean(axis=0))
+            thresholds[c] = np.quantile(1.0 - members @ centroids[c], quantile)
+        return cls(centroids, thresholds)
+
+    @classmethod
+    def load(cls, path) -> "PlantGate":
+        data = np.load(path)
+        return cls(data["centroids"], data["thresholds"])
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, thresholds=self.thresholds)
+
+    def distances(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cosine distance to the nearest class centroid, and that class."""
+        similarity = _normalize(embeddings) @ self.centroids.T
+        nearest = similarity.argmax(axis=1)
+        return 1.0 - similarity[np.arange(len(nearest)), nearest], nearest
+
+    def is_leaf(self, embeddings: np.ndarray) -> np.ndarray:
+        """Boolean mask of embeddings that look like the training leaves."""
+        distance, nearest = self.distances(embeddings)
+        return distance <= self.thresholds[nearest]
@@ -0,0 +1,216 @@
+import os
+import time
+import hashlib
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, BinaryIO, Optional, Tuple, Callable
+
+logger = logging.getLogger(__name__)
+
+# Prediction cache settings
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "2048"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", str(24 * 3600)))  # seconds
+PREDICTION_CACHE_PERSIST = os.getenv("PREDICTION_CACHE_PERSIST", "false").lower() == "true"
+PREDICTION_CACHE_PHASH = os.getenv("PREDICTION_CACHE_PHASH", "false").lower() == "true"
+PHASH_MAX_DISTANCE = int(os.getenv("PREDICTION_CACHE_PHASH_DISTANCE", "4"))  # bits out of 64
+PREDICTION_CACHE_PRUNE_INTERVAL = float(os.getenv("PREDICTION_CACHE_PRUNE_INTERVAL", "600"))  # seconds between expired-row sweeps
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the uploaded bytes; identical uploads share a key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_content_hash(file: BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    """`content_hash` of a file, read in chunks rather than as one bytes object."""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def perceptual_hash(image: np.ndarray) -> int:
+    """
+    64-bit difference hash (dHash) of a preprocessed (H, W, 3) image.
+
+    Re-encoded or slightly resized copies of the same photo land within a
+    few bits of each other, unlike their content hashes.
+    """
+    from PIL import Image
+
+    gray = np.asarray(image, dtype=np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    small = np.asarray(Image.fromarray(gray).resize((9, 8), Image.BOX))
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class PredictionCache:
+    """
+    Two-tier cache of disease predictions keyed by image content.
+
+    The in-memory tier is an LRU with a TTL; the optional persistent tier is
+    the `prediction_cache` table. Every entry is tied to the model version
+    that produced it, so deploying a new model invalidates old results.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = PREDICTION_CACHE_SIZE,
+        ttl_seconds: float = PREDICTION_CACHE_TTL,
+        persist: bool = PREDICTION_CACHE_PERSIST,
+        perceptual: bool = PREDICTION_CACHE_PHASH,
+        session_factory: Optional[Callable] = None,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.perceptual = perceptual
+        self._session_factory = session_factory
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], Optional[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.model_version = None
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._last_prune = 0.0
+
+    def _check_version(self, model_version: str):
+        """Drop in-memory entries when the model version changes."""
+        if model_version != self.model_version:
+            if self.model_version is not None:
+                logger.info(f"Model version changed to {model_version}, clearing prediction cache")
+                self.invalidations += 1
+            self._entries.clear()
+            self.model_version = model_version
+
+    def get(self, digest: str, model_version: str) -> Optional[Dict[str, Any]]:
+        """Look up an exact content match (memory first, then database)."""
+        now = time.time()
+        with self._lock:
+            self._check_version(model_version)
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[digest]
+
+        if self.persist:
+            result = self._load_persistent(digest, model_version)
+            if result is not None:
+                with self._lock:
+                    self.persistent_hits += 1
+                    self._store(digest, result, None, now)
+                return result
+
+        return None
+
+    def get_similar(self, phash: int, model_version: str) -> Optional[Dict[str, Any]]:
+        """Look up a near-duplicate by perceptual hash (memory tier only)."""
+        if not self.perceptual:
+            return None
+        now = time.time()
+        with self._lock:
+            self._check_version(model_version)
+            for digest, (expires, result, other) in reversed(self._entries.items()):
+                if other is not None and expires > now and (phash ^ other).bit_count() <= PHASH_MAX_DISTANCE:
+                    self._entries.move_to_end(digest)
+                    self.perceptual_hits += 1
+                    return result
+        return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, digest: str, model_version: str, result: Dict[str, Any], phash: Optional[int] = None):
+        """Store a fresh prediction in every enabled tier."""
+        now = time.time()
+        with self._lock:
+            self._check_version(model_version)
+            self._store(digest, result, phash, now)
+        if self.persist:
+            self._save_persistent(digest, model_version, result)
+
+    def _store(self, digest, result, phash, now):
+        self._entries[digest] = (now + self.ttl_seconds, result, phash)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.perceptual_hits + self.persistent_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "model_version": self.model_version,
+                "hits": self.hits,
+                "perceptual_hits": self.perceptual_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+    def _session(self):
+        if self._session_factory is None:
+            from .database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def _load_persistent(self, digest: str, model_version: str) -> Optional[Dict[str, Any]]:
+        from .models import PredictionCacheEntry
+
+        db = self._session()
+        try:
+            row = db.query(PredictionCacheEntry)\
+                .filter(PredictionCacheEntry.content_hash == digest)\
+                .filter(PredictionCacheEntry.model_version == model_version)\
+                .filter(PredictionCacheEntry.expires_at > datetime.utcnow())\
+                .first()
+            return row.result if row else None
+        except Exception as e:
+            logger.warning(f"Prediction cache lookup failed: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _save_persistent(self, digest: str, model_version: str, result: Dict[str, Any]):
+        from .models import PredictionCacheEntry
+
+        db = self._session()
+        try:
+            db.query(PredictionCacheEntry)\
+                .filter(PredictionCacheEntry.content_hash == digest)\
+                .delete()
+            # Expired rows for images that never come back would otherwise stay forever
+            if time.monotonic() - self._last_prune >= PREDICTION_CACHE_PRUNE_INTERVAL:
+                self._last_prune = time.monotonic()
+                db.query(PredictionCacheEntry)\
+                    .filter(PredictionCacheEntry.expires_at < datetime.utcnow())\
+                    .delete()
+            db.add(PredictionCacheEntry(
+                content_hash=digest,
+                model_version=model_version,
+                result=result,
+                expires_at=datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+            ))
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Prediction cache write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,99 @@
+"""
+Shared image preprocessing for the disease CNN.
+
+Used by both the API (backend/routers/disease.py) and the Streamlit app
+(disease_model.py) so the model always sees identically prepared input.
+
+Compared with `np.array(Image.open(...).convert('RGB').resize(...)) / 255.0`:
+- JPEGs are decoded at a reduced DCT scale (`Image.draft`), so a 12 MP phone
+  photo is never fully decoded just to be shrunk to 224x224;
+- pixels go straight from uint8 to float32 in one pass, instead of via a
+  float64 array that TensorFlow casts again;
+- callers can pass an output buffer (e.g. a slot of a `BatchBuffer`) so
+  batches are assembled without extra copies.
+"""
+import numpy as np
+from PIL import Image
+from typing import BinaryIO, Optional, Tuple, Union
+
+INPUT_SIZE = (224, 224)
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def open_image(source: Union[str, BinaryIO, Image.Image], size: Tuple[int, int] = INPUT_SIZE) -> Image.Image:
+    """
+    Open an image as RGB, asking the JPEG decoder for the smallest DCT scale
+    that is still at least `size`. Other formats decode normally.
+    """
+    img = source if isinstance(source, Image.Image) else Image.open(source)
+    if img.format == "JPEG":
+        img.draft("RGB", size)
+    return img.convert("RGB")
+
+
+def to_float32(pixels: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Scale uint8 pixels to [0, 1] float32 in a single pass (into `out` if given)."""
+    if out is None:
+        out = np.empty(pixels.shape, dtype=np.float32)
+    np.multiply(pixels, _SCALE, out=out, dtype=np.float32)
+    return out
+
+
+def decode_image(source: Union[str, BinaryIO, Image.Image], size: Tuple[int, int] = INPUT_SIZE) -> np.ndarray:
+    """Decode and resize an image to a uint8 (H, W, 3) array."""
+    img = open_image(source, size)
+    if img.size != size:
+        img = img.resize(size)
+    return np.asarray(img)
+
+
+def decode_image_max_side(source: Union[str, BinaryIO, Image.Image], max_side: int) -> np.ndarray:
+    """
+    Decode an image to a uint8 (H, W, 3) array, keeping its aspect ratio and
+    shrinking it so the longer side is at most `max_side`.
+    """
+    img = open_image(source, (max_side, max_side))
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side))
+    return np.asarray(img)
+
+
+def preprocess_image(
+    source: Union[str, BinaryIO, Image.Image],
+    size: Tuple[int, int] = INPUT_SIZE,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Decode an image file into a float32 (H, W, 3) array scaled to [0, 1]."""
+    return to_float32(decode_image(source, size), out=out)
+
+
+def preprocess_array(
+    image_rgb: np.ndarray,
+    size: Tuple[int, int] = INPUT_SIZE,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Resize an in-memory uint8 RGB array and scale it to float32 [0, 1]."""
+    if image_rgb.shape[1::-1] != size:
+        image_rgb = np.asarray(Image.fromarray(image_rgb).resize(size))
+    return to_float32(image_rgb, out=out)
+
+
+class BatchBuffer:
+    """
+    Reusable float32 (capacity, H, W, 3) buffer for assembling batches.
+
+    `slot(i)` is a view that preprocessing functions can write into directly;
+    `batch(n)` is a view of the first n images. Not thread-safe across
+    batches: use one buffer per batch in flight.
+    """
+
+    def __init__(self, capacity: int, size: Tuple[int, int] = INPUT_SIZE):
+        self.capacity = capacity
+        self.size = size
+        self._data = np.empty((capacity, size[1], size[0], 3), dtype=np.float32)
+
+    def slot(self, i: int) -> np.ndarray:
+        return self._data[i]
+
+    def batch(self, n: int) -> np.ndarray:
+        return self._data[:n]
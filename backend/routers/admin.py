@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from ..models import User
+from ..auth import check_admin
+from ..ml_service import ml_service
+
+router = APIRouter()
+
+@router.get("/models")
+async def model_status(current_user: User = Depends(check_admin)):
+    """Active and rollback versions of every served model."""
+    return ml_service.registry.status()
+
+@router.post("/models/reload")
+async def reload_models(current_user: User = Depends(check_admin)):
+    """Check models/ for new artifacts now instead of waiting for the watcher."""
+    activated = await ml_service.run_in_thread(ml_service.registry.refresh)
+    return {
+        "activated": {entry.name: entry.version for entry in activated},
+        "registry": ml_service.registry.status()
+    }
+
+@router.post("/models/{name}/rollback")
+async def rollback_model(
+    name: str,
+    version: Optional[str] = None,
+    current_user: User = Depends(check_admin)
+):
+    """
+    Switch a model back to a previous in-memory version.
+    
+    - **version**: Version to restore (default: the one before the current)
+    """
+    try:
+        entry = await ml_service.run_in_thread(ml_service.registry.rollback, name, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return {"name": entry.name, "active_version": entry.version}
@@ -4,6 +4,7 @@ from pydantic import BaseModel, EmailStr
 from datetime import timedelta
 from ..database import get_db
 from ..models import User
+from ..metrics import stage
 from ..auth import (
     create_access_token,
     get_password_hash,
@@ -34,20 +35,25 @@ class Token(BaseModel):
 async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user."""
     # Check if user exists
-    if db.query(User).filter(User.username == user_data.username).first():
+    with stage("db_query"):
+        username_taken = db.query(User).filter(User.username == user_data.username).first()
+        email_taken = not username_taken and db.query(User).filter(User.email == user_data.email).first()
+    
+    if username_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
     
-    if db.query(User).filter(User.email == user_data.email).first():
+    if email_taken:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    with stage("hash_password"):
+        hashed_password = get_password_hash(user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -57,15 +63,17 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
         role="farmer"
     )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    with stage("db_commit"):
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
     
     # Create access token
-    access_token = create_access_token(
-        data={"sub": new_user.username},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    with stage("token"):
+        access_token = create_access_token(
+            data={"sub": new_user.username},
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
     
     return {
         "access_token": access_token,
@@ -82,9 +90,13 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     """Authenticate user and return token."""
-    user = db.query(User).filter(User.username == credentials.username).first()
+    with stage("db_query"):
+        user = db.query(User).filter(User.username == credentials.username).first()
     
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    with stage("verify_password"):
+        valid = user is not None and verify_password(credentials.password, user.hashed_password)
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -98,10 +110,11 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
         )
     
     # Create access token
-    access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    )
+    with stage("token"):
+        access_token = create_access_token(
+            data={"sub": user.username},
+            expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
     
     return {
         "access_token": access_token,
@@ -1,24 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, BinaryIO, Callable, List, Tuple, Optional, Union
+from datetime import datetime
+import asyncio
+import json
 import numpy as np
-from PIL import Image
 import io
-from ..database import get_db
+import os
+import logging
+import zipfile
+from functools import partial
+from ..database import get_db, SessionLocal
 from ..models import User, DiseasePrediction
 from ..auth import get_current_user
-from ..ml_service import ml_service
+from ..ml_service import ml_service, TILE_MAX_SIDE
+from ..preprocessing import INPUT_SIZE, BatchBuffer, open_image, to_float32, decode_image_max_side
+from ..prediction_cache import file_content_hash, perceptual_hash
+from ..uploads import (
+    UPLOAD_MAX_BYTES, CorruptImage, check_image_upload, decode_limiter, image_decode_errors, sniff_image_format
+)
+from ..embedding_store import EMBEDDING_STORE_ENABLED, embedding_store, split_embedding
+from ..metrics import REGISTRY, stage
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Bulk scan settings
+BULK_BATCH_SIZE = int(os.getenv("DISEASE_BULK_BATCH_SIZE", "32"))
+BULK_MAX_IMAGES = int(os.getenv("DISEASE_BULK_MAX_IMAGES", "1000"))
+BULK_MAX_IMAGE_BYTES = UPLOAD_MAX_BYTES
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+DISEASE_PREDICTIONS = REGISTRY.counter(
+    "tomato_disease_predictions_total", "Disease predictions by source", ("source",)
+)
+
 # Request/Response schemas
 class DiseaseResponse(BaseModel):
     disease: str
     confidence: float
     all_predictions: Dict[str, float]
     model_used: str
+    model_version: Optional[str] = None
     treatment_advice: str
+    cached: bool = False
+    tiles: Optional[Dict[str, Any]] = None
 
 # Treatment advice mapping
 TREATMENT_ADVICE = {
@@ -32,10 +62,36 @@ TREATMENT_ADVICE = {
     "Spotted Wilt Virus": "No cure available. Remove and destroy infected plants immediately. Control thrips vectors with insecticides. Use resistant varieties."
 }
 
+def _open_upload(source: Union[bytes, BinaryIO]) -> BinaryIO:
+    """File object for uploaded bytes or a (spooled) upload file, rewound."""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def _preprocess_image(source: Union[bytes, BinaryIO], out: np.ndarray = None) -> np.ndarray:
+    """Decode an uploaded image into a float32 (224, 224, 3) array scaled to [0, 1]."""
+    # Same steps as preprocessing.preprocess_image, timed separately.
+    # PIL decodes lazily, so the resize can also hit a corrupt body
+    with image_decode_errors():
+        with stage("decode"):
+            img = open_image(_open_upload(source))
+        with stage("resize"):
+            if img.size != INPUT_SIZE:
+                img = img.resize(INPUT_SIZE)
+            return to_float32(np.asarray(img), out=out)
+
+def _predict_tiled(source: Union[bytes, BinaryIO]) -> Dict[str, Any]:
+    """Decode at up to TILE_MAX_SIDE and run the tiled analysis."""
+    with stage("decode"), image_decode_errors():
+        img = decode_image_max_side(_open_upload(source), TILE_MAX_SIDE)
+    with stage("cnn"):
+        return ml_service.predict_disease_tiled(img)
+
 @router.post("/predict", response_model=DiseaseResponse)
 async def predict_disease(
     image: UploadFile = File(...),
-
+    tiled: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -43,18 +99,60 @@ async def predict_disease(
     Detect disease from tomato leaf image.
     
     - **image**: Leaf image file (JPG, PNG)
-    - **image**: Leaf image file (JPG, PNG)
+    - **tiled**: Analyse a whole-plant or canopy photo in overlapping tiles
+      and return a per-tile disease map under `tiles`
     """
     try:
+        embedding = None
+        embedding_source = None  # cache hits: the prediction whose embedding this result shares
+        to_cache = None  # fresh CNN result: (digest, phash), cached once saved
 
-        # Read and preprocess image
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents)).convert('RGB')
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0
+        # Reject non-images from their header, then check for an identical
+        # earlier upload; both read the spooled file rather than copying it.
+        # Cache lookups and writes may hit the database, so they run off the loop
+        cache = ml_service.prediction_cache
+        model_version = ml_service.disease_model_version
+        with stage("read"):
+            check_image_upload(image.file)
+            digest = await ml_service.run_in_thread(file_content_hash, image.file)
+        digest += ":tiled" if tiled else ""
+        with stage("cache"):
+            result = await ml_service.run_in_thread(cache.get, digest, model_version)
         
-        # Predict
-        result = ml_service.predict_disease(img_array)
+        if result is None and tiled:
+            cache.record_miss()
+            async with decode_limiter:
+                result = await ml_service.run_in_thread(_predict_tiled, image.file)
+            await ml_service.run_in_thread(cache.put, digest, model_version, result)
+            DISEASE_PREDICTIONS.inc(source="tiled")
+        elif result is None:
+            # Preprocess image (off the event loop)
+            async with decode_limiter:
+                img_array = await ml_service.run_in_thread(_preprocess_image, image.file)
+            
+            # Near-duplicate (re-encoded/resized copy) of a recent upload?
+            phash = perceptual_hash(img_array) if cache.perceptual else None
+            if phash is not None:
+                with stage("cache"):
+                    result = await ml_service.run_in_thread(cache.get_similar, phash, model_version)
+            
+            if result is None:
+                cache.record_miss()
+                
+                # Predict (batched with concurrent requests)
+                with stage("cnn"):
+                    result = await ml_service.predict_disease_async(img_array)
+                result, embedding = split_embedding(result)
+                to_cache = (digest, phash)
+                DISEASE_PREDICTIONS.inc(source="model")
+            else:
+                result = {**result, "cached": True}
+                embedding_source = result.pop("embedding_source_id", None)
+                DISEASE_PREDICTIONS.inc(source="cache")
+        else:
+            result = {**result, "cached": True}
+            embedding_source = result.pop("embedding_source_id", None)
+            DISEASE_PREDICTIONS.inc(source="cache")
         
         # Get treatment advice
         disease = result["disease"]
@@ -63,23 +161,208 @@ async def predict_disease(
         # Save prediction to database
         prediction = DiseasePrediction(
             user_id=current_user.id,
-            model_type="CNN",
+            model_type=result["model_used"],
             predicted_disease=disease,
             confidence=result["confidence"],
             all_predictions=result["all_predictions"],
             treatment_advice=treatment
         )
-        db.add(prediction)
-        db.commit()
+        with stage("db_commit"):
+            db.add(prediction)
+            db.commit()
+        
+        # A cache hit reuses the embedding of the prediction that filled the
+        # cache, so similar-case search works for repeat uploads too
+        if embedding is None and embedding_source is not None:
+            embedding = await ml_service.run_in_thread(embedding_store.vector, embedding_source)
+        if embedding is not None:
+            _store_embeddings([prediction.id], [embedding])
+        
+        # Cached after saving, so the entry can name the prediction holding its embedding
+        if to_cache is not None:
+            cached = {**result, "embedding_source_id": prediction.id if embedding is not None else None}
+            await ml_service.run_in_thread(cache.put, to_cache[0], model_version, cached, to_cache[1])
         
         return {
             **result,
             "treatment_advice": treatment
         }
     
+    except HTTPException:
+        raise
+    except CorruptImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+def _store_embeddings(prediction_ids: List[int], embeddings: List[np.ndarray]):
+    """Record embeddings for similar-case search; failures only cost the search."""
+    try:
+        with stage("embedding"):
+            embedding_store.add(prediction_ids, np.stack(embeddings))
+    except Exception as e:
+        logger.error(f"Could not store prediction embeddings: {e}")
+
+BulkSource = Union[BinaryIO, Callable[[], bytes]]
+
+def _expand_uploads(uploads: List[Tuple[str, BinaryIO]]) -> List[Tuple[str, BulkSource]]:
+    """
+    Flatten uploaded files into (name, source) pairs, unpacking zip archives.
+    
+    A source is the spooled upload file itself, or a callable that reads one
+    zip member; nothing is read into memory until the image is decoded.
+    """
+    items = []
+    for name, file in uploads:
+        if name.lower().endswith(".zip") or zipfile.is_zipfile(file):
+            file.seek(0)
+            archive = zipfile.ZipFile(file)
+            for info in archive.infolist():
+                ext = os.path.splitext(info.filename)[1].lower()
+                if info.is_dir() or ext not in IMAGE_EXTENSIONS:
+                    continue
+                if info.file_size > BULK_MAX_IMAGE_BYTES:
+                    raise ValueError(f"{info.filename} exceeds the per-image size limit")
+                items.append((info.filename, partial(archive.read, info)))
+        else:
+            items.append((name, file))
+        
+        if len(items) > BULK_MAX_IMAGES:
+            raise ValueError(f"At most {BULK_MAX_IMAGES} images per bulk request")
+    return items
+
+def _decode_bulk_item(source: BulkSource, out: np.ndarray) -> np.ndarray:
+    """Read (zip members only), sniff and decode one bulk image into `out`."""
+    file = io.BytesIO(source()) if callable(source) else _open_upload(source)
+    if sniff_image_format(file.read(16)) is None:
+        raise ValueError("Unsupported file type")
+    return _preprocess_image(file, out=out)
+
+async def _decode_one(source: BulkSource, out: np.ndarray) -> np.ndarray:
+    async with decode_limiter:
+        return await ml_service.run_in_thread(_decode_bulk_item, source, out)
+
+async def _decode_chunk(chunk: List[Tuple[str, BulkSource]], buffer: BatchBuffer) -> list:
+    """
+    Decode a chunk of images in parallel straight into `buffer`.
+    Failures are returned in place of the array, not raised.
+    """
+    return await asyncio.gather(
+        *[_decode_one(source, buffer.slot(i)) for i, (_, source) in enumerate(chunk)],
+        return_exceptions=True
+    )
+
+@router.post("/predict/bulk")
+async def predict_disease_bulk(
+    images: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Detect diseases for many leaf images at once.
+    
+    - **images**: Leaf image files and/or zip archives of images
+    
+    Streams one JSON object per image (NDJSON) as each batch finishes,
+    followed by a summary line. Predictions are saved in a single insert
+    once all images are processed.
+    """
+    try:
+        uploads = [(upload.filename or "", upload.file) for upload in images]
+        # Sniffing and listing archives reads the spooled uploads, which may be on disk
+        items = await ml_service.run_in_thread(_expand_uploads, uploads)
+    except (ValueError, zipfile.BadZipFile) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    
+    user_id = current_user.id
+    chunks = [items[i:i + BULK_BATCH_SIZE] for i in range(0, len(items), BULK_BATCH_SIZE)]
+    
+    async def stream():
+        rows = []
+        embeddings = []
+        failed = 0
+        
+        # Decode the next chunk while the current one is in the CNN,
+        # alternating between two reusable batch buffers
+        buffers = [BatchBuffer(BULK_BATCH_SIZE), BatchBuffer(BULK_BATCH_SIZE)]
+        next_decode = asyncio.ensure_future(_decode_chunk(chunks[0], buffers[0]))
+        try:
+            for chunk_idx, chunk in enumerate(chunks):
+                buffer = buffers[chunk_idx % 2]
+                decoded = await next_decode
+                if chunk_idx + 1 < len(chunks):
+                    next_decode = asyncio.ensure_future(
+                        _decode_chunk(chunks[chunk_idx + 1], buffers[(chunk_idx + 1) % 2])
+                    )
+                
+                ok = [i for i, arr in enumerate(decoded) if not isinstance(arr, Exception)]
+                results = {}
+                if ok:
+                    # Whole chunk decoded: predict on the buffer view without copying
+                    batch = buffer.batch(len(chunk)) if len(ok) == len(chunk) else buffer.batch(len(chunk))[ok]
+                    try:
+                        predictions = await ml_service.run_in_thread(
+                            partial(ml_service.predict_disease_batch, with_embeddings=EMBEDDING_STORE_ENABLED), batch
+                        )
+                        results = dict(zip(ok, predictions))
+                    except Exception as e:
+                        decoded = [e] * len(chunk)
+                
+                for i, (name, _) in enumerate(chunk):
+                    line = {"index": chunk_idx * BULK_BATCH_SIZE + i, "filename": name}
+                    if i in results:
+                        result, embedding = split_embedding(results[i])
+                        embeddings.append(embedding)
+                        treatment = TREATMENT_ADVICE.get(result["disease"], "Consult an agricultural expert for specific treatment.")
+                        line.update(result, treatment_advice=treatment)
+                        rows.append({
+                            "user_id": user_id,
+                            "image_path": name,
+                            "model_type": result["model_used"],
+                            "predicted_disease": result["disease"],
+                            "confidence": result["confidence"],
+                            "all_predictions": result["all_predictions"],
+                            "treatment_advice": treatment,
+                            "created_at": datetime.utcnow()
+                        })
+                    else:
+                        failed += 1
+                        line["error"] = str(decoded[i])
+                    yield json.dumps(line) + "\n"
+        
+        finally:
+            # Stop prefetching if the client went away mid-stream
+            next_decode.cancel()
+        
+        # Save all predictions in one bulk insert
+        saved = False
+        if rows:
+            db = SessionLocal()
+            try:
+                ids = db.execute(
+                    insert(DiseasePrediction).returning(DiseasePrediction.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                db.commit()
+                saved = True
+            except Exception as e:
+                logger.error(f"Bulk insert of disease predictions failed: {e}")
+                db.rollback()
+            finally:
+                db.close()
+            
+            # Cascade answers from the student model have no embedding
+            stored = [(i, e) for i, e in zip(ids, embeddings) if e is not None] if saved else []
+            if stored:
+                _store_embeddings(*map(list, zip(*stored)))
+        
+        yield json.dumps({
+            "summary": {"total": len(items), "predicted": len(rows), "failed": failed, "saved": saved}
+        }) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.get("/history")
 async def get_prediction_history(
     current_user: User = Depends(get_current_user),
@@ -103,3 +386,51 @@ async def get_prediction_history(
         }
         for p in predictions
     ]
+
+@router.get("/similar/{prediction_id}")
+async def get_similar_predictions(
+    prediction_id: int,
+    k: int = Query(10, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Past predictions whose leaf images look most like this one.
+    
+    Compares CNN embeddings across all stored predictions, best match first.
+    Experts and admins can search from any prediction, farmers from their own.
+    """
+    prediction = db.get(DiseasePrediction, prediction_id)
+    if prediction is None or (
+        prediction.user_id != current_user.id and current_user.role not in ("expert", "admin")
+    ):
+        raise HTTPException(status_code=404, detail="Prediction not found")
+    
+    query = embedding_store.vector(prediction_id)
+    if query is None:
+        raise HTTPException(status_code=404, detail="No embedding stored for this prediction")
+    
+    with stage("search"):
+        found = await ml_service.run_in_thread(embedding_store.search, query, k, prediction_id)
+    
+    matches = {
+        p.id: p for p in db.query(DiseasePrediction).filter(DiseasePrediction.id.in_(found["ids"])).all()
+    }
+    return {
+        "prediction_id": prediction_id,
+        "method": found["method"],
+        "scored": found["scored"],
+        "search_ms": found["search_ms"],
+        "results": [
+            {
+                "id": match_id,
+                "similarity": similarity,
+                "disease": matches[match_id].predicted_disease,
+                "confidence": matches[match_id].confidence,
+                "model_type": matches[match_id].model_type,
+                "date": matches[match_id].created_at.isoformat()
+            }
+            for match_id, similarity in zip(found["ids"], found["similarities"])
+            if match_id in matches
+        ]
+    }
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import Dict, Optional
+import numpy as np
+from ..models import User
+from ..auth import get_current_user
+from ..ml_service import ml_service
+from ..metrics import stage
+from ..fertilizer_optimizer import DOSES, FERTILIZER_DEADLINE_MS, optimize_doses
+from .yield_pred import YIELD_FEATURES, YieldPredictionRequest, yield_features
+
+router = APIRouter()
+
+# Request schemas
+class FertilizerOptimizeRequest(BaseModel):
+    plot: YieldPredictionRequest
+    budget: float = Field(..., ge=0)  # per hectare
+    prices: Dict[str, float] = {}  # per kg of N, P or K (lime: per tonne); defaults fill the rest
+    crop_price: Optional[float] = Field(None, ge=0)  # per tonne of tomatoes; maximizes profit when set
+    max_doses: Dict[str, float] = {}  # kg/ha (lime: t/ha)
+    deadline_ms: Optional[float] = Field(None, gt=0)  # capped at FERTILIZER_DEADLINE_MS
+
+@router.post("/optimize")
+async def optimize_fertilizer(
+    data: FertilizerOptimizeRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Size nitrogen, phosphorus, potassium and lime doses with the yield model.
+
+    Searches doses within `budget` for the highest predicted yield, or the
+    highest profit over no fertilizer when `crop_price` is given. Returns
+    the doses, their cost, the predicted yield with and without them and
+    how the search went. The search stops at the deadline with the best
+    doses found so far.
+    """
+    unknown = sorted((set(data.prices) | set(data.max_doses)) - set(DOSES))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown dose '{unknown[0]}' (expected one of {', '.join(DOSES)})")
+
+    features = yield_features(data.plot)
+    base = np.array([features[name] for name in YIELD_FEATURES], dtype=np.float64)
+    deadline_ms = min(data.deadline_ms or FERTILIZER_DEADLINE_MS, FERTILIZER_DEADLINE_MS)
+    model_version = ml_service.yield_model_version
+    try:
+        with stage("optimize"):
+            result = await ml_service.run_in_thread(
+                optimize_doses, ml_service.predict_yield_grid, base, data.budget,
+                data.prices, data.crop_price, data.max_doses, deadline_ms
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Optimization failed: {str(e)}")
+
+    result["model_version"] = model_version if result["prediction_type"] == "ml" else None
+    return result
@@ -0,0 +1,97 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Dict, Any, Optional
+from datetime import datetime
+from ..database import get_db
+from ..models import User, PredictionJob
+from ..auth import get_current_user, check_admin
+from ..jobs import QueueFull, submit_job, queue_position, queue_stats, job_pool
+from ..uploads import check_image_upload
+from .yield_pred import YieldPredictionRequest
+
+router = APIRouter()
+
+# Request/Response schemas
+class JobResponse(BaseModel):
+    id: int
+    kind: str
+    status: str
+    priority: int
+    attempts: int
+    queue_position: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+def _job_response(db: Session, job: PredictionJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "queue_position": queue_position(db, job) if job.status == "queued" else None,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at
+    }
+
+def _submit(db: Session, user: User, kind: str, input_data: Dict[str, Any], blob: bytes = None, priority: int = 5):
+    try:
+        job = submit_job(db, user.id, kind, input_data, blob, priority)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return _job_response(db, job)
+
+@router.post("/disease", response_model=JobResponse, status_code=202)
+async def submit_disease_job(
+    image: UploadFile = File(...),
+    tiled: bool = False,
+    priority: int = 5,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a disease prediction and return its job id immediately.
+    
+    - **image**: Leaf (or whole-plant, with `tiled`) image file
+    - **priority**: 0-9, higher runs first
+    """
+    check_image_upload(image.file)
+    contents = await image.read()
+    return _submit(db, current_user, "disease", {"filename": image.filename, "tiled": tiled}, contents, priority)
+
+@router.post("/yield", response_model=JobResponse, status_code=202)
+async def submit_yield_job(
+    data: YieldPredictionRequest,
+    priority: int = 5,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a yield prediction and return its job id immediately."""
+    return _submit(db, current_user, "yield", data.dict(), priority=priority)
+
+@router.get("/stats")
+async def job_stats(
+    current_user: User = Depends(check_admin),
+    db: Session = Depends(get_db)
+):
+    """Queue depth and wait-time metrics (admin only)."""
+    return {**queue_stats(db), "pool": job_pool.stats()}
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Status of a job, and its result once it has succeeded."""
+    job = db.get(PredictionJob, job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(db, job)
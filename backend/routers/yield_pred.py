@@ -1,13 +1,32 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from ..database import get_db
+from typing import Dict, List, Optional, Tuple, Union
+from datetime import datetime
+import asyncio
+import logging
+import os
+import numpy as np
+from ..database import get_db, SessionLocal
 from ..models import User, YieldForecast
 from ..auth import get_current_user
 from ..ml_service import ml_service
+from ..metrics import stage
+from ..tabular import FORMATS, MEDIA_TYPES, Table, UnsupportedFormat, detect_format, read_table, write_table
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Batch prediction settings
+YIELD_BATCH_MAX_ROWS = int(os.getenv("YIELD_BATCH_MAX_ROWS", "100000"))
+YIELD_BATCH_CHUNK_ROWS = int(os.getenv("YIELD_BATCH_CHUNK_ROWS", "5000"))  # rows per streamed piece
+
+# Sweep settings
+YIELD_SWEEP_MAX_POINTS = int(os.getenv("YIELD_SWEEP_MAX_POINTS", "250000"))
+
 # Request/Response schemas
 class YieldPredictionRequest(BaseModel):
     season: str  # "Kharif", "Rabi", "Zayad"
@@ -25,11 +44,78 @@ class YieldResponse(BaseModel):
     predicted_yield: float
     prediction_type: str
     recommendations: list[str]
+    model_version: Optional[str] = None
+
+class SweepRange(BaseModel):
+    values: Optional[List[Union[float, str]]] = None  # explicit values (names for season/variety)
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    steps: int = 10  # evenly spaced values from start to stop, inclusive
+
+class YieldSweepRequest(BaseModel):
+    base: YieldPredictionRequest
+    sweep: Dict[str, SweepRange]  # feature -> values; the grid's axes, in this order
+    include_surface: bool = True
 
 # Mappings
 SEASON_MAP = {"Kharif": 0, "Rabi": 1, "Zayad": 2}
 VARIETY_MAP = {"Desi": 0, "Hybrid": 1, "Cherry": 2, "Beefsteak": 3}
 
+# Model input columns, in the order the model expects them
+YIELD_FEATURES = [
+    "season", "temperature", "rainfall", "humidity", "nitrogen",
+    "phosphorus", "potassium", "ph", "organic_carbon", "variety"
+]
+CATEGORY_MAPS = {"season": SEASON_MAP, "variety": VARIETY_MAP}
+
+def yield_features(data: YieldPredictionRequest) -> dict:
+    """Model inputs for a request, with categorical fields encoded."""
+    return dict(
+        season=SEASON_MAP.get(data.season, 0),
+        temperature=data.temperature,
+        rainfall=data.rainfall,
+        humidity=data.humidity,
+        nitrogen=data.nitrogen,
+        phosphorus=data.phosphorus,
+        potassium=data.potassium,
+        ph=data.ph,
+        organic_carbon=data.organic_carbon,
+        variety=VARIETY_MAP.get(data.variety, 0)
+    )
+
+def build_recommendations(data: YieldPredictionRequest, yield_pred: float) -> list[str]:
+    """Agronomy recommendations for a request and its predicted yield."""
+    recommendations = []
+    
+    if data.temperature < 20:
+        recommendations.append("⚠️ Temperature is low. Consider using mulching or row covers.")
+    elif data.temperature > 30:
+        recommendations.append("⚠️ Temperature is high. Ensure adequate irrigation and shade.")
+    
+    if data.rainfall < 100:
+        recommendations.append("💧 Low rainfall. Increase irrigation frequency.")
+    elif data.rainfall > 250:
+        recommendations.append("💧 High rainfall. Ensure proper drainage to avoid waterlogging.")
+    
+    if data.nitrogen < 200:
+        recommendations.append("🌱 Nitrogen is low. Apply urea or compost.")
+    if data.phosphorus < 50:
+        recommendations.append("🌱 Phosphorus is low. Apply DAP fertilizer.")
+    if data.potassium < 150:
+        recommendations.append("🌱 Potassium is low. Apply muriate of potash.")
+    
+    if data.ph < 6.0:
+        recommendations.append("⚗️ Soil is acidic. Apply lime to raise pH.")
+    elif data.ph > 7.5:
+        recommendations.append("⚗️ Soil is alkaline. Add sulfur or organic matter.")
+    
+    if yield_pred < 10:
+        recommendations.append("📉 Yield is predicted to be low. Review all factors and consult an expert.")
+    elif yield_pred > 18:
+        recommendations.append("📈 Excellent yield expected! Maintain current practices.")
+    
+    return recommendations if recommendations else ["✅ All parameters are optimal!"]
+
 @router.post("/predict", response_model=YieldResponse)
 async def predict_yield(
     data: YieldPredictionRequest,
@@ -42,57 +128,14 @@ async def predict_yield(
     Returns predicted yield in tons/hectare with recommendations.
     """
     try:
-        # Convert categorical to numerical
-        season_num = SEASON_MAP.get(data.season, 0)
-        variety_num = VARIETY_MAP.get(data.variety, 0)
-        
-        # Predict
-        yield_pred = ml_service.predict_yield(
-            season=season_num,
-            temperature=data.temperature,
-            rainfall=data.rainfall,
-            humidity=data.humidity,
-            nitrogen=data.nitrogen,
-            phosphorus=data.phosphorus,
-            potassium=data.potassium,
-            ph=data.ph,
-            organic_carbon=data.organic_carbon,
-            variety=variety_num
-        )
+        # Predict (off the event loop)
+        model_version = ml_service.yield_model_version
+        with stage("predict"):
+            yield_pred = await ml_service.predict_yield_async(**yield_features(data))
         
         # Determine prediction type
         prediction_type = "ml" if 'yield' in ml_service.models else "heuristic"
         
-        # Generate recommendations
-        recommendations = []
-        
-        if data.temperature < 20:
-            recommendations.append("⚠️ Temperature is low. Consider using mulching or row covers.")
-        elif data.temperature > 30:
-            recommendations.append("⚠️ Temperature is high. Ensure adequate irrigation and shade.")
-        
-        if data.rainfall < 100:
-            recommendations.append("💧 Low rainfall. Increase irrigation frequency.")
-        elif data.rainfall > 250:
-            recommendations.append("💧 High rainfall. Ensure proper drainage to avoid waterlogging.")
-        
-        if data.nitrogen < 200:
-            recommendations.append("🌱 Nitrogen is low. Apply urea or compost.")
-        if data.phosphorus < 50:
-            recommendations.append("🌱 Phosphorus is low. Apply DAP fertilizer.")
-        if data.potassium < 150:
-            recommendations.append("🌱 Potassium is low. Apply muriate of potash.")
-        
-        if data.ph < 6.0:
-            recommendations.append("⚗️ Soil is acidic. Apply lime to raise pH.")
-        elif data.ph > 7.5:
-            recommendations.append("⚗️ Soil is alkaline. Add sulfur or organic matter.")
-        
-        if yield_pred < 10:
-            recommendations.append("📉 Yield is predicted to be low. Review all factors and consult an expert.")
-        elif yield_pred > 18:
-            recommendations.append("📈 Excellent yield expected! Maintain current practices.")
-        
         # Save to database
         forecast = YieldForecast(
             user_id=current_user.id,
@@ -104,19 +147,275 @@ async def predict_yield(
             prediction_type=prediction_type,
             input_data=data.dict()
         )
-        db.add(forecast)
-        db.commit()
+        with stage("db_commit"):
+            db.add(forecast)
+            db.commit()
         
         return {
             "predicted_yield": round(yield_pred, 2),
             "prediction_type": prediction_type,
-            "recommendations": recommendations if recommendations else ["✅ All parameters are optimal!"]
+            "recommendations": build_recommendations(data, yield_pred),
+            "model_version": model_version if prediction_type == "ml" else None
         }
     
     except Exception as e:
         from fastapi import HTTPException
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+def _encode_category(values: np.ndarray, mapping: Dict[str, int]) -> np.ndarray:
+    """Map category names to codes with one dict lookup per distinct value (unknown -> 0, as for single requests)."""
+    names, inverse = np.unique(values.astype(str), return_inverse=True)
+    codes = np.array([mapping.get(name.strip(), 0) for name in names], dtype=np.float64)
+    return codes[inverse.reshape(-1)]
+
+def _to_float(values: np.ndarray) -> np.ndarray:
+    """Numeric column as float64, with NaN where a value isn't a number."""
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+def encode_yield_table(table: Table) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Model inputs for every row of an uploaded table.
+    
+    Returns the (N, 10) feature matrix and a boolean mask of rows whose
+    numeric fields are all valid numbers. Raises ValueError when columns
+    are missing.
+    """
+    missing = [name for name in YIELD_FEATURES if name not in table.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)} (expected {', '.join(YIELD_FEATURES)})")
+    
+    features = np.empty((table.n_rows, len(YIELD_FEATURES)), dtype=np.float64)
+    for j, name in enumerate(YIELD_FEATURES):
+        column = table.columns[name]
+        if name in CATEGORY_MAPS:
+            features[:, j] = _encode_category(column, CATEGORY_MAPS[name])
+        else:
+            features[:, j] = _to_float(column)
+    return features, np.isfinite(features).all(axis=1)
+
+def _row_errors(features: np.ndarray, valid: np.ndarray) -> List[Optional[str]]:
+    """Error message for each invalid row, naming its first bad column."""
+    errors = [None] * len(valid)
+    bad = ~np.isfinite(features)
+    for i in np.flatnonzero(~valid):
+        errors[i] = f"{YIELD_FEATURES[int(bad[i].argmax())]} is not a number"
+    return errors
+
+def _save_forecasts(rows: List[dict]) -> bool:
+    """Insert batch forecasts in one statement; returns False (and logs) on failure."""
+    db = SessionLocal()
+    try:
+        db.execute(insert(YieldForecast), rows)
+        db.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Bulk insert of yield forecasts failed: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+@router.post("/predict/batch")
+async def predict_yield_batch(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description=f"One of {', '.join(FORMATS)}; detected from the upload if omitted"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Predict yield for many plots at once.
+    
+    - **file**: CSV, JSON array of objects, Parquet or Arrow IPC, with one
+      row per plot and the same fields as `/predict`; other columns (e.g. a
+      plot id) are passed through
+    
+    All rows are predicted with one model call and saved in one insert.
+    The table is streamed back in the upload's format with
+    `predicted_yield`, `prediction_type` and `error` columns added; rows
+    with non-numeric values get an error instead of a prediction.
+    """
+    if format is not None and format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format '{format}' (expected one of {', '.join(FORMATS)})")
+    
+    file.file.seek(0)
+    fmt = format or detect_format(file.filename, file.file.read(8))
+    try:
+        with stage("parse"):
+            table = await ml_service.run_in_thread(read_table, file.file, fmt, YIELD_BATCH_MAX_ROWS)
+            features, valid = encode_yield_table(table)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if table.n_rows == 0:
+        raise HTTPException(status_code=400, detail="Upload has no rows")
+    
+    # One model call over every valid row
+    model_version = ml_service.yield_model_version
+    preds = np.full(table.n_rows, np.nan)
+    prediction_type = None
+    if valid.any():
+        try:
+            with stage("predict"):
+                preds[valid], prediction_type = await ml_service.predict_yield_batch_async(features[valid])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    
+    # Save all valid rows in one bulk insert, with the same fields as /predict
+    now = datetime.utcnow()
+    inputs = {name: table.columns[name].tolist() for name in YIELD_FEATURES}
+    for name in YIELD_FEATURES:
+        if name not in CATEGORY_MAPS:
+            inputs[name] = features[:, YIELD_FEATURES.index(name)].tolist()
+    rows = [
+        {
+            "user_id": current_user.id,
+            "season": inputs["season"][i],
+            "temperature": inputs["temperature"][i],
+            "rainfall": inputs["rainfall"][i],
+            "humidity": inputs["humidity"][i],
+            "predicted_yield": float(preds[i]),
+            "prediction_type": prediction_type,
+            "input_data": {name: inputs[name][i] for name in YIELD_FEATURES},
+            "created_at": now
+        }
+        for i in np.flatnonzero(valid)
+    ]
+    saved = False
+    if rows:
+        with stage("db_commit"):
+            saved = await asyncio.to_thread(_save_forecasts, rows)
+    
+    rounded = np.round(preds, 2).tolist()
+    results = {
+        "predicted_yield": [value if ok else None for value, ok in zip(rounded, valid.tolist())],
+        "prediction_type": [prediction_type if ok else None for ok in valid.tolist()],
+        "error": _row_errors(features, valid),
+    }
+    headers = {
+        "Content-Disposition": f'attachment; filename="yield_predictions.{fmt}"',
+        "X-Rows-Predicted": str(len(rows)),
+        "X-Rows-Failed": str(table.n_rows - len(rows)),
+        "X-Saved": str(saved).lower(),
+    }
+    if prediction_type == "ml" and model_version:
+        headers["X-Model-Version"] = model_version
+    return StreamingResponse(
+        write_table(table, results, YIELD_BATCH_CHUNK_ROWS), media_type=MEDIA_TYPES[fmt], headers=headers
+    )
+
+def sweep_axes(sweep: Dict[str, SweepRange]) -> List[Tuple[str, np.ndarray, list]]:
+    """
+    (feature, encoded values, values as given) for each swept feature.
+    
+    Raises ValueError for unknown features, unknown categories, bad ranges
+    and grids over YIELD_SWEEP_MAX_POINTS.
+    """
+    if not sweep:
+        raise ValueError("Sweep at least one feature")
+    axes = []
+    for name, spec in sweep.items():
+        if name not in YIELD_FEATURES:
+            raise ValueError(f"Unknown feature '{name}' (expected one of {', '.join(YIELD_FEATURES)})")
+        if name in CATEGORY_MAPS:
+            mapping = CATEGORY_MAPS[name]
+            if not spec.values or any(value not in mapping for value in spec.values):
+                raise ValueError(f"{name} needs a list of values from {', '.join(mapping)}")
+            labels = list(spec.values)
+            encoded = np.array([mapping[value] for value in labels], dtype=np.float64)
+        elif spec.values is not None:
+            if not spec.values or any(isinstance(value, str) for value in spec.values):
+                raise ValueError(f"{name} needs a non-empty list of numbers")
+            encoded = np.array(spec.values, dtype=np.float64)
+            labels = encoded.tolist()
+        else:
+            if spec.start is None or spec.stop is None or spec.steps < 1:
+                raise ValueError(f"{name} needs either values or start, stop and steps >= 1")
+            encoded = np.linspace(spec.start, spec.stop, spec.steps)
+            labels = encoded.tolist()
+        if not np.isfinite(encoded).all():
+            raise ValueError(f"{name} values must be finite")
+        axes.append((name, encoded, labels))
+    
+    points = int(np.prod([len(encoded) for _, encoded, _ in axes], dtype=np.float64))
+    if points > YIELD_SWEEP_MAX_POINTS:
+        raise ValueError(f"Sweep has {points} points; at most {YIELD_SWEEP_MAX_POINTS} allowed")
+    return axes
+
+def summarize_surface(grid: np.ndarray, axes: List[Tuple[str, np.ndarray, list]]) -> dict:
+    """Marginal curves along each axis and the grid's best point."""
+    marginals = {}
+    for a, (name, _, labels) in enumerate(axes):
+        others = tuple(i for i in range(grid.ndim) if i != a)
+        marginals[name] = {
+            "values": labels,
+            "mean": np.round(grid.mean(axis=others), 2).tolist(),
+            "min": np.round(grid.min(axis=others), 2).tolist(),
+            "max": np.round(grid.max(axis=others), 2).tolist(),
+        }
+    best = np.unravel_index(int(grid.argmax()), grid.shape)
+    return {
+        "marginals": marginals,
+        "best": {
+            "predicted_yield": round(float(grid[best]), 2),
+            "features": {name: labels[i] for (name, _, labels), i in zip(axes, best)},
+        },
+    }
+
+@router.post("/predict/sweep")
+async def predict_yield_sweep(
+    data: YieldSweepRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Predict yield over a grid of scenarios around one plot.
+    
+    - **base**: the plot, with the same fields as `/predict`
+    - **sweep**: for each feature to vary, either `values` (category names
+      for season and variety) or `start`, `stop` and `steps`
+    
+    The Cartesian product of the swept values is evaluated in one model
+    call. Returns each axis's marginal curve (mean, min and max predicted
+    yield for each of its values, over the rest of the grid), the best
+    point and, unless `include_surface` is false, the whole surface as a
+    flat row-major list with its `shape`. Sweeps are not saved.
+    """
+    try:
+        axes = sweep_axes(data.sweep)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    features = yield_features(data.base)
+    base = np.array([features[name] for name in YIELD_FEATURES], dtype=np.float64)
+    model_version = ml_service.yield_model_version
+    try:
+        with stage("predict"):
+            grid, prediction_type = await ml_service.predict_yield_grid_async(
+                base, [(YIELD_FEATURES.index(name), encoded) for name, encoded, _ in axes]
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+    
+    with stage("summarize"):
+        response = {
+            "features": [name for name, _, _ in axes],
+            "shape": list(grid.shape),
+            "points": int(grid.size),
+            **summarize_surface(grid, axes),
+            "surface": np.round(grid, 2).ravel().tolist() if data.include_surface else None,
+            "prediction_type": prediction_type,
+            "model_version": model_version if prediction_type == "ml" else None,
+        }
+    return JSONResponse(response)
+
 @router.get("/history")
 async def get_yield_history(
     current_user: User = Depends(get_current_user),
@@ -0,0 +1,177 @@
+"""
+Pre-fork server: load the shareable models once, then fork the HTTP workers.
+
+`uvicorn --workers N` starts N fresh interpreters and each one loads its own
+copy of every model. Here the parent process loads the yield forest, freezes
+its heap (`gc.freeze()`) and only then forks the workers, so the forest's
+node arrays stay in copy-on-write pages that all workers share. (joblib's
+`mmap_mode` does not help here: scikit-learn copies tree nodes out of the
+loaded arrays.)
+
+The disease CNN is still loaded by each worker: forking after TensorFlow or
+the TFLite runtime has started its thread pools is not safe, so the parent
+never imports them. With `DISEASE_BACKEND=tflite` the interpreter maps the
+flatbuffer straight from disk, so those weights are shared through the page
+cache anyway; Keras weights are per worker.
+
+Usage:
+    python -m backend.serve --workers 4 [--host 0.0.0.0] [--port 8000]
+"""
+import os
+import gc
+import sys
+import time
+import signal
+import socket
+import argparse
+import logging
+import traceback
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Models loaded in the parent and inherited by the workers
+SHARED_MODELS = ["yield"]
+
+
+def configure_environment(workers: int):
+    """
+    Defaults for running `workers` copies of the app on one machine.
+
+    Must run before the backend is imported, since settings are read at
+    import time. Explicit environment variables always win.
+    """
+    cpus = os.cpu_count() or 1
+    per_worker = str(max(1, cpus // max(1, workers)))
+    # Forked workers already spread yield predictions across processes. An
+    # explicit value still works: each worker then starts its own pool
+    # after the fork (see preload_shared_models)
+    os.environ.setdefault("ML_PROCESS_WORKERS", "0")
+    # Split the cores instead of every worker sizing its pools to all of them
+    os.environ.setdefault("ML_THREAD_WORKERS", per_worker)
+    os.environ.setdefault("TFLITE_NUM_THREADS", per_worker)
+    os.environ.setdefault("UPLOAD_MAX_CONCURRENT_DECODES", per_worker)
+
+
+def preload_shared_models():
+    """Load `SHARED_MODELS` into this (parent) process and freeze the heap for forking."""
+    from .ml_service import ml_service
+
+    start = time.perf_counter()
+    # A process pool built here would be inherited broken by every fork
+    ml_service.defer_process_pool = True
+    loaded = ml_service.registry.refresh(SHARED_MODELS)
+    for entry in loaded:
+        logger.info(f"Preloaded {entry.name} version {entry.version} for sharing in {entry.load_seconds:.2f}s")
+    if "tensorflow" in sys.modules:
+        logger.warning("TensorFlow was imported before forking; workers may deadlock")
+
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers don't write to (and un-share) those pages
+    gc.collect()
+    gc.freeze()
+    return time.perf_counter() - start
+
+
+def fork_worker(index: int, target: Callable[[int], None]) -> int:
+    """Fork a child that runs `target(index)` and exits; returns the child's pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        target(index)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _serve(index: int, sock: socket.socket, log_level: str):
+    """Run one uvicorn worker on the inherited listening socket."""
+    import uvicorn
+    from .main import app
+    from .jobs import job_pool
+
+    # Job workers are supervised by the first HTTP worker only
+    if index:
+        job_pool.workers = 0
+    from .ml_service import ml_service
+    ml_service.start_process_pool()
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """Keeps `workers` forked children running until SIGINT/SIGTERM."""
+
+    def __init__(self, workers: int, target: Callable[[int], None]):
+        self.workers = workers
+        self.target = target
+        self.children: Dict[int, int] = {}  # pid -> worker index
+        self._stopping = False
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        for index in range(self.workers):
+            self._start(index)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = self.children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+            logger.error(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(1.0)
+            self._start(index)
+
+    def _start(self, index: int):
+        pid = fork_worker(index, self.target)
+        self.children[pid] = index
+        logger.info(f"Started worker {index} (pid {pid})")
+
+    def _stop(self, signum, frame):
+        if self._stopping:
+            return
+        self._stopping = True
+        logger.info("Stopping workers...")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API from forked workers sharing preloaded models")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper())
+    configure_environment(args.workers)
+
+    sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    seconds = preload_shared_models()
+    logger.info(f"Shared models ready in {seconds:.2f}s; forking {args.workers} workers on {args.host}:{args.port}")
+    Supervisor(args.workers, lambda index: _serve(index, sock, args.log_level)).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Reading and writing tabular uploads for batch endpoints.
+
+Supported formats:
+
+- `csv`: header row, UTF-8 (a BOM is ignored);
+- `json`: an array of objects;
+- `parquet` and `arrow` (Arrow IPC file or stream): need the optional
+  `pyarrow` package.
+
+`read_table` turns an upload into named column arrays; `write_table` writes
+those columns plus result columns back out in the same format, a chunk of
+rows at a time, so large responses can be streamed.
+"""
+import io
+import os
+import csv
+import json
+import numpy as np
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+FORMATS = ("csv", "json", "parquet", "arrow")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "json": "application/json",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+_EXTENSIONS = {
+    ".csv": "csv",
+    ".json": "json",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".ipc": "arrow",
+}
+
+
+class UnsupportedFormat(ValueError):
+    """The upload's format is unknown, or needs a package that isn't installed."""
+
+
+class Table:
+    """An uploaded table as named columns, in the upload's column order."""
+
+    def __init__(self, fmt: str, columns: Dict[str, np.ndarray], n_rows: int,
+                 records: Optional[List[dict]] = None, arrow: Any = None):
+        self.format = fmt
+        self.columns = columns
+        self.n_rows = n_rows
+        self.records = records  # json: the original objects, echoed back as-is
+        self.arrow = arrow  # parquet/arrow: the pyarrow.Table
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.columns)
+
+
+def detect_format(filename: str, head: bytes) -> str:
+    """Format from the file's leading bytes, falling back to its extension and then CSV."""
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    if head.startswith(b"ARROW1") or head.startswith(b"\xff\xff\xff\xff"):
+        return "arrow"
+    if head.lstrip().startswith(b"["):
+        return "json"
+    return _EXTENSIONS.get(os.path.splitext(filename or "")[1].lower(), "csv")
+
+
+def read_table(file: BinaryIO, fmt: str, max_rows: int) -> Table:
+    """
+    Read an upload into columns.
+
+    Raises ValueError for malformed input or more than `max_rows` rows, and
+    UnsupportedFormat when the format can't be read here.
+    """
+    file.seek(0)
+    if fmt == "csv":
+        return _read_csv(file, max_rows)
+    if fmt == "json":
+        return _read_json(file, max_rows)
+    if fmt in ("parquet", "arrow"):
+        return _read_arrow(file, fmt, max_rows)
+    raise UnsupportedFormat(f"Unknown format '{fmt}' (expected one of {list(FORMATS)})")
+
+
+def write_table(table: Table, results: Dict[str, list], chunk_rows: int) -> Iterator[bytes]:
+    """
+    Yield `table` with the `results` columns appended, in the table's format.
+
+    Result values may be None (missing). Each yielded piece covers up to
+    `chunk_rows` rows.
+    """
+    writer = {"csv": _write_csv, "json": _write_json}.get(table.format, _write_arrow)
+    starts = range(0, table.n_rows, max(1, chunk_rows)) or [0]
+    return writer(table, results, [(start, min(start + chunk_rows, table.n_rows)) for start in starts])
+
+
+# -- Readers ---------------------------------------------------------------------
+
+def _read_csv(file: BinaryIO, max_rows: int) -> Table:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("CSV upload is empty")
+        header = [name.strip() for name in header]
+        rows = []
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != len(header):
+                raise ValueError(f"CSV row {len(rows) + 2} has {len(row)} fields, expected {len(header)}")
+            rows.append(row)
+            if len(rows) > max_rows:
+                raise ValueError(f"At most {max_rows} rows per batch")
+    except UnicodeDecodeError:
+        raise ValueError("CSV upload is not valid UTF-8")
+    finally:
+        text.detach()  # leave the upload itself open
+
+    values = np.array(rows, dtype=object).reshape(len(rows), len(header))
+    return Table("csv", {name: values[:, i] for i, name in enumerate(header)}, len(rows))
+
+
+def _read_json(file: BinaryIO, max_rows: int) -> Table:
+    try:
+        records = json.load(file)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise ValueError("JSON upload must be an array of objects")
+    if len(records) > max_rows:
+        raise ValueError(f"At most {max_rows} rows per batch")
+
+    names = list(dict.fromkeys(key for record in records for key in record))
+    columns = {}
+    for name in names:
+        column = np.empty(len(records), dtype=object)
+        column[:] = [record.get(name) for record in records]
+        columns[name] = column
+    return Table("json", columns, len(records), records=records)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise UnsupportedFormat("Parquet and Arrow uploads need the pyarrow package; upload CSV or JSON instead")
+    return pyarrow
+
+
+def _read_arrow(file: BinaryIO, fmt: str, max_rows: int) -> Table:
+    pa = _pyarrow()
+    try:
+        if fmt == "parquet":
+            table = pa.parquet.read_table(file)
+        elif file.read(6) == b"ARROW1":
+            file.seek(0)
+            table = pa.ipc.open_file(file).read_all()
+        else:
+            file.seek(0)
+            table = pa.ipc.open_stream(file).read_all()
+    except pa.ArrowException as e:
+        raise ValueError(f"Invalid {fmt} upload: {e}")
+    if table.num_rows > max_rows:
+        raise ValueError(f"At most {max_rows} rows per batch")
+
+    columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+    return Table(fmt, columns, table.num_rows, arrow=table)
+
+
+# -- Writers ---------------------------------------------------------------------
+
+def _write_csv(table: Table, results: Dict[str, list], bounds) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(table.names + list(results))
+    columns = list(table.columns.values()) + list(results.values())
+    for start, end in bounds:
+        writer.writerows(
+            ["" if value is None else value for value in row]
+            for row in zip(*[column[start:end] for column in columns])
+        )
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _write_json(table: Table, results: Dict[str, list], bounds) -> Iterator[bytes]:
+    yield b"["
+    for start, end in bounds:
+        pieces = []
+        for i in range(start, end):
+            record = dict(table.records[i])
+            for name, values in results.items():
+                if values[i] is not None:
+                    record[name] = values[i]
+            pieces.append(json.dumps(record))
+        yield ((", " if start else "") + ", ".join(pieces)).encode()
+    yield b"]\n"
+
+
+class _Drain(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last `take()`."""
+
+    def __init__(self):
+        self._pieces = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self) -> bytes:
+        data, self._pieces = b"".join(self._pieces), []
+        return data
+
+
+def _write_arrow(table: Table, results: Dict[str, list], bounds) -> Iterator[bytes]:
+    pa = _pyarrow()
+    sink = _Drain()
+    writer = None
+    # Fix each result column's type up front so every chunk has the same schema
+    types = {name: pa.array(list(values)).type for name, values in results.items()}
+    types = {name: pa.string() if pa.types.is_null(t) else t for name, t in types.items()}
+    for start, end in bounds:
+        chunk = table.arrow.slice(start, end - start)
+        for name, values in results.items():
+            chunk = chunk.append_column(name, pa.array(list(values[start:end]), type=types[name]))
+        if writer is None:
+            writer = (
+                pa.parquet.ParquetWriter(sink, chunk.schema) if table.format == "parquet"
+                else pa.ipc.new_stream(sink, chunk.schema)
+            )
+        writer.write_table(chunk)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+    yield sink.take()
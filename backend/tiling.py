@@ -0,0 +1,58 @@
+"""
+Sliding-window tiling for whole-plant and canopy photos.
+
+Large photos are cut into overlapping model-sized tiles instead of being
+squashed to 224x224, so small lesions stay visible to the CNN. Tiles are
+NumPy stride views into the decoded image (no copies until the tiles that
+survive the background filter are gathered into a batch).
+"""
+import numpy as np
+from typing import List, Tuple
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def tile_positions(length: int, tile: int, stride: int) -> List[int]:
+    """Tile start offsets along one axis, always including the far edge."""
+    if length <= tile:
+        return [0]
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] != length - tile:
+        positions.append(length - tile)
+    return positions
+
+
+def tile_grid(image: np.ndarray, tile: int, stride: int) -> Tuple[np.ndarray, List[int], List[int]]:
+    """
+    Zero-copy view of every tile start position in an (H, W, 3) image.
+
+    Returns the (H - tile + 1, W - tile + 1, tile, tile, 3) window view and
+    the row/column offsets of the tiles to use.
+    """
+    windows = sliding_window_view(image, (tile, tile), axis=(0, 1))
+    # sliding_window_view puts the window axes last: (..., 3, tile, tile)
+    windows = np.moveaxis(windows, 2, -1)
+    rows = tile_positions(image.shape[0], tile, stride)
+    cols = tile_positions(image.shape[1], tile, stride)
+    return windows, rows, cols
+
+
+def green_fraction(image: np.ndarray, tile: int, rows: List[int], cols: List[int], margin: int = 10) -> np.ndarray:
+    """
+    Fraction of clearly green pixels in each tile, as a (len(rows), len(cols)) array.
+
+    Uses a summed-area table, so the cost is one pass over the image
+    regardless of how many tiles overlap.
+    """
+    pixels = image.astype(np.int16)
+    red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    mask = (green > red + margin) & (green > blue + margin)
+
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0), axis=1, out=table[1:, 1:])
+
+    r0 = np.asarray(rows)[:, None]
+    c0 = np.asarray(cols)[None, :]
+    r1, c1 = r0 + tile, c0 + tile
+    counts = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+    return counts / float(tile * tile)
@@ -0,0 +1,193 @@
+"""
+Memory-bounded handling of image uploads.
+
+- `UploadLimitMiddleware` counts request body bytes as they arrive and
+  rejects the request with 413 once a route's limit is passed, so an
+  oversized upload is never buffered in full;
+- `sniff_image_format` checks the header bytes of the spooled upload, so
+  non-images are rejected before anything is decoded;
+- `image_decode_errors` turns a body that fails to decode behind a valid
+  header (corrupt, truncated or a decompression bomb) into `CorruptImage`,
+  which routes answer with 400 rather than 500;
+- `DecodeLimiter` caps how many images are being decoded at once, since each
+  decode briefly holds a full-resolution bitmap.
+
+Routes decode straight from `UploadFile.file` (a spooled temporary file that
+Starlette moves to disk past 1 MB) instead of `await image.read()`.
+"""
+import os
+import json
+import asyncio
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Optional
+
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+
+# Upload limits
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_BULK_MAX_BYTES = int(os.getenv("UPLOAD_BULK_MAX_BYTES", str(512 * 1024 * 1024)))
+UPLOAD_MAX_CONCURRENT_DECODES = int(os.getenv("UPLOAD_MAX_CONCURRENT_DECODES", str(os.cpu_count() or 1)))
+
+# Room for multipart boundaries and form fields around the file itself
+_MULTIPART_OVERHEAD = 64 * 1024
+
+# Leading bytes of each accepted format
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+)
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if it isn't one we accept."""
+    for signature, name in _SIGNATURES:
+        if head.startswith(signature):
+            return name
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def check_image_upload(file: BinaryIO) -> str:
+    """
+    Sniff an upload's format from its header and rewind it.
+
+    Raises 415 for anything that is not a supported image.
+    """
+    file.seek(0)
+    head = file.read(16)
+    file.seek(0)
+    kind = sniff_image_format(head)
+    if kind is None:
+        raise HTTPException(status_code=415, detail="Unsupported file type; upload a JPEG, PNG, BMP or WebP image")
+    return kind
+
+
+class CorruptImage(ValueError):
+    """An upload with an image header whose body could not be decoded."""
+
+
+@contextmanager
+def image_decode_errors():
+    """Raise `CorruptImage` for PIL decode failures inside the block."""
+    try:
+        yield
+    except Image.DecompressionBombError as e:
+        raise CorruptImage(f"Image has too many pixels to decode: {e}") from e
+    except UnidentifiedImageError as e:
+        # Its message names the (temporary) file object rather than the problem
+        raise CorruptImage("Image could not be decoded; the file is corrupt or not really an image") from e
+    # SyntaxError is what PIL's PNG plugin raises for broken chunks
+    except (OSError, SyntaxError) as e:
+        raise CorruptImage(f"Image could not be decoded: {e}") from e
+
+
+class DecodeLimiter:
+    """
+    Async semaphore around image decodes, with counters for /health.
+
+    Created lazily per event loop, like the executors' slots.
+    """
+
+    def __init__(self, max_concurrent: int = UPLOAD_MAX_CONCURRENT_DECODES):
+        self.max_concurrent = max(1, max_concurrent)
+        self._slots = None
+        self._loop = None
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        return self._slots
+
+    async def __aenter__(self):
+        slots = self._semaphore()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+        }
+
+
+decode_limiter = DecodeLimiter()
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware enforcing per-route request body limits while streaming.
+
+    `limits` maps path prefixes to byte limits (longest prefix wins); other
+    paths are not limited. A declared Content-Length over the limit is
+    rejected before any body is read.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit + _MULTIPART_OVERHEAD
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await _send_413(send, limit)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside FastAPI's body parsing, which turns it into the response
+                    raise HTTPException(status_code=413, detail=_too_large(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _too_large(limit: int) -> str:
+    return f"Upload too large (limit {(limit - _MULTIPART_OVERHEAD) // (1024 * 1024)} MB)"
+
+
+async def _send_413(send, limit: int):
+    body = json.dumps({"detail": _too_large(limit)}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
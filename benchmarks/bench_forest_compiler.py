@@ -0,0 +1,97 @@
+"""
+Microbenchmark: the compiled yield forest (backend/forest_compiler.py)
+against scikit-learn.
+
+Loads a trained yield model, compiles it and reports the largest prediction
+difference and the latency of both at several batch sizes.
+
+Usage:
+    python -m benchmarks.bench_forest_compiler [--model models/yield_model.joblib] [--json out.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from typing import Any, Dict, List, Sequence
+
+from backend.forest_compiler import compile_forest
+
+
+def _timed(fn, X: np.ndarray, repeats: int) -> float:
+    """Median milliseconds per call."""
+    fn(X)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+def benchmark(model: Any, batch_sizes: Sequence[int], repeats: int, seed: int = 0) -> Dict[str, Any]:
+    """Latency of sklearn vs. the compiled forest per batch size, plus their largest difference."""
+    start = time.perf_counter()
+    compiled = compile_forest(model)
+    compile_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    # Typical ranges of the yield features (see train_yield_model.py)
+    low = np.array([0, 15, 0, 30, 100, 20, 80, 5.0, 0.2, 0])
+    high = np.array([2.99, 40, 400, 95, 400, 120, 300, 8.5, 1.5, 3.99])
+    rows: List[Dict[str, Any]] = []
+    max_abs_diff = 0.0
+    for size in batch_sizes:
+        X = rng.uniform(low, high, (size, len(low)))
+        X[:, [0, 9]] = np.floor(X[:, [0, 9]])
+        max_abs_diff = max(max_abs_diff, float(np.abs(model.predict(X) - compiled.predict(X)).max()))
+        n = max(3, repeats // max(1, size // 64))
+        sklearn_ms = _timed(model.predict, X, n)
+        compiled_ms = _timed(compiled.predict, X, n)
+        rows.append({
+            "batch_size": size,
+            "sklearn_ms": round(sklearn_ms, 3),
+            "compiled_ms": round(compiled_ms, 3),
+            "speedup": round(sklearn_ms / compiled_ms, 2) if compiled_ms else None,
+        })
+    return {
+        "trees": compiled.n_trees,
+        "nodes": compiled.n_nodes,
+        "max_depth": compiled.max_depth,
+        "compiled_mb": round(compiled.nbytes / 1e6, 2),
+        "compile_seconds": round(compile_seconds, 3),
+        "max_abs_diff": max_abs_diff,
+        "batches": rows,
+    }
+
+
+def main():
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Compare the compiled yield forest with scikit-learn")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "yield_model.joblib"))
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 10000])
+    parser.add_argument("--repeats", type=int, default=50, help="Timed calls per batch size (fewer for large batches)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Error: model not found at {args.model} (train it with train_yield_model.py)")
+        sys.exit(1)
+
+    report = benchmark(joblib.load(args.model), args.batch_sizes, args.repeats)
+    print(f"{report['trees']} trees, {report['nodes']} nodes, depth {report['max_depth']}, "
+          f"{report['compiled_mb']} MB compiled in {report['compile_seconds']}s; "
+          f"max |sklearn - compiled| = {report['max_abs_diff']:.2e}")
+    print(f"{'batch':>7} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8}")
+    for row in report["batches"]:
+        print(f"{row['batch_size']:>7} {row['sklearn_ms']:>11.3f} {row['compiled_ms']:>12.3f} {row['speedup'] or 0:>7.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Microbenchmark: image decode + preprocess time before and after
+backend/preprocessing.py.
+
+Synthesises phone-like JPEGs at several resolutions and times the old
+`np.array(Image.open(...).convert('RGB').resize(...)) / 255.0` path against
+`preprocess_image` (reduced-size JPEG decode, direct float32 scaling).
+
+Usage:
+    python -m benchmarks.bench_preprocessing [--repeats 20] [--json out.json]
+"""
+import io
+import json
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+from backend.preprocessing import BatchBuffer, preprocess_image
+
+RESOLUTIONS = {
+    "0.3 MP": (640, 480),
+    "2 MP": (1600, 1200),
+    "8 MP": (3264, 2448),
+    "12 MP": (4032, 3024),
+}
+
+
+def make_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    """A smooth, leaf-coloured test image (noise would compress unrealistically badly)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        60 + 40 * np.sin(x / 97.0),
+        140 + 60 * np.cos(y / 53.0),
+        50 + 30 * np.sin((x + y) / 71.0),
+    ], axis=-1)
+    base += rng.normal(0, 6, base.shape)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def legacy_preprocess(contents: bytes) -> np.ndarray:
+    """The original backend path."""
+    img = Image.open(io.BytesIO(contents)).convert('RGB')
+    img = img.resize((224, 224))
+    return np.array(img) / 255.0
+
+
+def fast_preprocess(contents: bytes, out: np.ndarray) -> np.ndarray:
+    return preprocess_image(io.BytesIO(contents), out=out)
+
+
+def _time_ms(fn, repeats: int) -> float:
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(timings))
+
+
+def run(repeats: int):
+    buffer = BatchBuffer(1)
+    results = []
+    for label, (width, height) in RESOLUTIONS.items():
+        contents = make_jpeg(width, height)
+        megapixels = width * height / 1e6
+
+        before = _time_ms(lambda: legacy_preprocess(contents), repeats)
+        after = _time_ms(lambda: fast_preprocess(contents, buffer.slot(0)), repeats)
+
+        # Sanity check: the fast path should see essentially the same image
+        diff = np.abs(legacy_preprocess(contents) - fast_preprocess(contents, buffer.slot(0))).mean()
+
+        results.append({
+            "resolution": label,
+            "megapixels": round(megapixels, 2),
+            "jpeg_kb": round(len(contents) / 1024, 1),
+            "before_ms": round(before, 2),
+            "after_ms": round(after, 2),
+            "before_ms_per_mp": round(before / megapixels, 2),
+            "after_ms_per_mp": round(after / megapixels, 2),
+            "speedup": round(before / after, 1),
+            "mean_abs_pixel_diff": round(float(diff), 4),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image decode + preprocessing")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.repeats)
+
+    print(f"{'resolution':<10} {'before ms':>10} {'after ms':>9} {'before ms/MP':>13} {'after ms/MP':>12} {'speedup':>8} {'pixel diff':>11}")
+    for r in results:
+        print(
+            f"{r['resolution']:<10} {r['before_ms']:>10.2f} {r['after_ms']:>9.2f} "
+            f"{r['before_ms_per_mp']:>13.2f} {r['after_ms_per_mp']:>12.2f} {r['speedup']:>7.1f}x "
+            f"{r['mean_abs_pixel_diff']:>11.4f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Per-worker memory with independent vs. pre-fork (shared) model loading.
+
+"independent" starts each worker as a fresh interpreter that loads every
+model itself, as `uvicorn --workers N` does. "shared" loads the yield forest
+once in the parent (`backend.serve.preload_shared_models`) and forks the
+workers, which then load only the disease CNN. Each worker makes a few
+predictions and then reports its /proc/<pid>/smaps_rollup; PSS (shared pages
+divided among the processes that map them) is the number that adds up to the
+machine's real footprint.
+
+Without --models-dir, stub models are generated (a large forest, so the
+difference is visible). Linux only.
+
+Usage:
+    python -m benchmarks.bench_worker_memory [--workers 4] [--trees 300]
+        [--models-dir path/to/models] [--json out.json]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import multiprocessing as mp
+
+MODES = ("independent", "shared")
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid) -> dict:
+    """Memory totals in MB from /proc/<pid>/smaps_rollup."""
+    totals = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in FIELDS:
+                totals[key] = int(value.split()[0]) / 1024.0
+    return {
+        "rss_mb": round(totals["Rss"], 1),
+        "pss_mb": round(totals["Pss"], 1),
+        "shared_mb": round(totals["Shared_Clean"] + totals["Shared_Dirty"], 1),
+        "private_mb": round(totals["Private_Clean"] + totals["Private_Dirty"], 1),
+    }
+
+
+def _worker(index, ready, done):
+    """Load whatever isn't loaded yet, predict a little, report memory and wait."""
+    import numpy as np
+    from backend.ml_service import ml_service
+
+    ml_service.load_models()
+    rng = np.random.default_rng(index)
+    for _ in range(20):
+        features = rng.random(10) * [2, 40, 300, 100, 400, 100, 300, 9, 3, 3]
+        ml_service.predict_yield(int(features[0]), *features[1:9], int(features[9]))
+    if "disease_cnn" in ml_service.models:
+        ml_service.predict_disease_batch(rng.random((4, 224, 224, 3), dtype=np.float32))
+    ready.set()
+    # Stay alive until every worker has loaded, so shared pages are counted
+    # across all of them
+    done.wait()
+
+
+def measure(mode: str, workers: int) -> dict:
+    """Start `workers` processes in `mode` and collect each one's memory."""
+    if mode == "shared":
+        from backend.serve import preload_shared_models
+
+        preload_shared_models()
+        ctx = mp.get_context("fork")
+    else:
+        ctx = mp.get_context("spawn")
+
+    done = ctx.Event()
+    procs, events = [], []
+    for index in range(workers):
+        ready = ctx.Event()
+        proc = ctx.Process(target=_worker, args=(index, ready, done), daemon=True)
+        proc.start()
+        procs.append(proc)
+        events.append(ready)
+
+    try:
+        for proc, ready in zip(procs, events):
+            while not ready.wait(1.0):
+                if not proc.is_alive():
+                    raise RuntimeError(f"{mode} worker {proc.pid} exited with code {proc.exitcode}")
+        per_worker = [read_memory(proc.pid) for proc in procs]
+        parent = read_memory(os.getpid())
+    finally:
+        done.set()
+        for proc in procs:
+            proc.join(30)
+
+    total_pss = sum(w["pss_mb"] for w in per_worker) + (parent["pss_mb"] if mode == "shared" else 0.0)
+    return {
+        "workers": per_worker,
+        "parent": parent if mode == "shared" else None,
+        "mean_worker_pss_mb": round(sum(w["pss_mb"] for w in per_worker) / workers, 1),
+        "mean_worker_private_mb": round(sum(w["private_mb"] for w in per_worker) / workers, 1),
+        "total_pss_mb": round(total_pss, 1),
+    }
+
+
+def _make_models(models_dir: str, trees: int):
+    from benchmarks.load_test import make_stub_models
+
+    make_stub_models(models_dir, n_estimators=trees, n_samples=20000, max_depth=None)
+
+
+def _run_mode(mode: str, workers: int, queue):
+    try:
+        queue.put(measure(mode, workers))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-worker memory with independent and pre-fork model loading")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--trees", type=int, default=300, help="Forest size for the generated stub yield model")
+    parser.add_argument("--models-dir", help="Use these models instead of generating stubs")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("Error: this benchmark needs Linux (/proc/<pid>/smaps_rollup)")
+        sys.exit(1)
+
+    workdir = tempfile.mkdtemp(prefix="tomato-mem-")
+    models_dir = args.models_dir
+    spawn = mp.get_context("spawn")
+    if models_dir is None:
+        # Generated in a child so this process never imports TensorFlow,
+        # which would make forking unsafe
+        models_dir = os.path.join(workdir, "models")
+        os.makedirs(models_dir)
+        proc = spawn.Process(target=_make_models, args=(models_dir, args.trees))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0:
+            print("Error: failed to generate stub models")
+            sys.exit(1)
+
+    # Must be set before the backend is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODELS_DIR"] = models_dir
+    os.environ["EMBEDDING_STORE_DIR"] = os.path.join(workdir, "embeddings")
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    from backend.serve import configure_environment
+
+    configure_environment(args.workers)
+
+    # Each mode runs in its own spawned driver, so the "shared" preload
+    # can't leak into the "independent" measurement
+    results = {"workers": args.workers, "models_dir": models_dir, "modes": {}}
+    for mode in args.modes:
+        queue = spawn.Queue()
+        driver = spawn.Process(target=_run_mode, args=(mode, args.workers, queue))
+        driver.start()
+        result = queue.get()
+        driver.join()
+        if "error" in result:
+            print(f"Error: {mode} run failed: {result['error']}")
+            sys.exit(1)
+        results["modes"][mode] = result
+
+    print(f"{'mode':<12} {'worker':>6} {'rss MB':>8} {'pss MB':>8} {'shared MB':>10} {'private MB':>11}", file=sys.stderr)
+    for mode, result in results["modes"].items():
+        rows = [(str(i), w) for i, w in enumerate(result["workers"])]
+        if result["parent"] is not None:
+            rows.append(("parent", result["parent"]))
+        for name, w in rows:
+            print(
+                f"{mode:<12} {name:>6} {w['rss_mb']:>8.1f} {w['pss_mb']:>8.1f} "
+                f"{w['shared_mb']:>10.1f} {w['private_mb']:>11.1f}",
+                file=sys.stderr,
+            )
+        print(f"{mode:<12} {'total':>6} {'':>8} {result['total_pss_mb']:>8.1f}", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+End-to-end load benchmark for the backend API.
+
+Starts `backend.main:app` in-process (httpx ASGI transport, real lifespan)
+against a temporary SQLite database and temporary models directory holding
+small stub models generated on the fly: a tiny Keras CNN with the disease
+model's input/output shapes and a small random forest for yield. Then drives
+signup/login, disease, yield and history endpoints from concurrent virtual
+users and reports throughput and latency percentiles per endpoint.
+
+The numbers cover the whole request path (auth, decode, batching, model
+call, DB commit) with stub models, so they track regressions in the serving
+code rather than the cost of the real CNN.
+
+Usage:
+    python -m benchmarks.load_test [--concurrency 8] [--requests 200]
+        [--mix disease=4,yield=4,disease_history=1,yield_history=1]
+        [--image-size 1024] [--json out.json]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+DEFAULT_MIX = "disease=4,yield=4,disease_history=1,yield_history=1"
+NUM_CLASSES = 8
+
+
+def make_stub_models(models_dir: str, seed: int = 0, n_estimators: int = 50, n_samples: int = 500, max_depth=10):
+    """Write a tiny disease CNN and yield forest with the real models' interfaces."""
+    import joblib
+    from sklearn.ensemble import RandomForestRegressor
+    from tensorflow import keras
+
+    rng = np.random.default_rng(seed)
+
+    inputs = keras.Input((224, 224, 3))
+    x = keras.layers.Conv2D(8, 3, strides=4, activation="relu")(inputs)
+    x = keras.layers.GlobalAveragePooling2D()(x)
+    outputs = keras.layers.Dense(NUM_CLASSES, activation="softmax")(x)
+    keras.Model(inputs, outputs).save(os.path.join(models_dir, "disease_model.h5"))
+
+    features = rng.random((n_samples, 10)) * [2, 40, 300, 100, 400, 100, 300, 9, 3, 3]
+    target = 10 + rng.random(n_samples) * 10
+    forest = RandomForestRegressor(
+        n_estimators=n_estimators, max_depth=max_depth, random_state=seed, n_jobs=-1
+    ).fit(features, target)
+    joblib.dump(forest, os.path.join(models_dir, "yield_model.joblib"))
+
+
+def make_jpeg(size: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    base = np.stack([
+        60 + 40 * np.sin(x / 37.0 + seed),
+        140 + 60 * np.cos(y / 23.0),
+        50 + 30 * np.sin((x + y) / 41.0),
+    ], axis=-1) + rng.normal(0, 6, (size, size, 3))
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def yield_payload(rng: random.Random) -> dict:
+    return {
+        "season": rng.choice(["Kharif", "Rabi", "Zayad"]),
+        "temperature": rng.uniform(15, 35),
+        "rainfall": rng.uniform(50, 300),
+        "humidity": rng.uniform(40, 90),
+        "nitrogen": rng.uniform(100, 300),
+        "phosphorus": rng.uniform(20, 90),
+        "potassium": rng.uniform(100, 250),
+        "ph": rng.uniform(5.5, 8.0),
+        "organic_carbon": rng.uniform(0.3, 2.0),
+        "variety": rng.choice(["Desi", "Hybrid", "Cherry", "Beefsteak"]),
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def summarize(latencies_ms: list, errors: int, elapsed: float) -> dict:
+    ordered = np.sort(np.asarray(latencies_ms, dtype=np.float64))
+    count = len(ordered)
+
+    def pct(p):
+        return round(float(np.percentile(ordered, p)), 2) if count else None
+
+    return {
+        "requests": count + errors,
+        "errors": errors,
+        "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(float(ordered.mean()), 2) if count else None,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(float(ordered[-1]), 2) if count else None,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, name: str, request, expected=(200, 201)):
+        start = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code in expected
+        except Exception:
+            response, ok = None, False
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        if ok:
+            self.latencies.setdefault(name, []).append(elapsed_ms)
+        else:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response if ok else None
+
+
+async def run(concurrency: int, requests: int, mix: str, image_size: int, seed: int) -> dict:
+    import httpx
+    from backend.main import app
+    from backend.database import init_db
+    from backend.ml_service import ml_service
+
+    init_db()
+    weights = parse_mix(mix)
+    unknown = set(weights) - {"disease", "yield", "disease_history", "yield_history"}
+    if unknown:
+        raise ValueError(f"Unknown endpoints in --mix: {sorted(unknown)}")
+    images = [make_jpeg(image_size, seed + i) for i in range(16)]
+    recorder = Recorder()
+
+    async with app.router.lifespan_context(app):
+        startup = time.perf_counter()
+        await asyncio.to_thread(ml_service.ready.wait)
+        ready_seconds = time.perf_counter() - startup
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+
+            async def user(index: int, quota: int):
+                rng = random.Random(seed + index)
+                creds = {"username": f"bench{index}", "password": "bench-password"}
+                await recorder.call("signup", client.post(
+                    "/api/auth/signup", json={**creds, "email": f"bench{index}@example.com"}
+                ))
+                response = await recorder.call("login", client.post("/api/auth/login", json=creds))
+                if response is None:
+                    return
+                headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+                names, probs = zip(*weights.items())
+                for _ in range(quota):
+                    name = rng.choices(names, probs)[0]
+                    if name == "disease":
+                        files = {"image": ("leaf.jpg", rng.choice(images), "image/jpeg")}
+                        request = client.post("/api/disease/predict", files=files, headers=headers)
+                    elif name == "yield":
+                        request = client.post("/api/yield/predict", json=yield_payload(rng), headers=headers)
+                    elif name == "disease_history":
+                        request = client.get("/api/disease/history", headers=headers)
+                    else:
+                        request = client.get("/api/yield/history", headers=headers)
+                    await recorder.call(name, request)
+
+            quotas = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+            start = time.perf_counter()
+            await asyncio.gather(*[user(i, quota) for i, quota in enumerate(quotas)])
+            elapsed = time.perf_counter() - start
+
+    endpoints = sorted(set(recorder.latencies) | set(recorder.errors))
+    all_latencies = [ms for values in recorder.latencies.values() for ms in values]
+    return {
+        "config": {
+            "concurrency": concurrency,
+            "requests": requests,
+            "mix": weights,
+            "image_size": image_size,
+            "seed": seed,
+        },
+        "ready_seconds": round(ready_seconds, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "overall": summarize(all_latencies, sum(recorder.errors.values()), elapsed),
+        "endpoints": {
+            name: summarize(recorder.latencies.get(name, []), recorder.errors.get(name, 0), elapsed)
+            for name in endpoints
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the backend API in-process with stub models")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=200, help="Total requests after signup/login")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. disease=4,yield=4")
+    parser.add_argument("--image-size", type=int, default=1024, help="Side of the uploaded JPEGs in pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    # Isolated database and models; must be set before the backend is imported
+    workdir = tempfile.mkdtemp(prefix="tomato-bench-")
+    models_dir = os.path.join(workdir, "models")
+    os.makedirs(models_dir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["MODELS_DIR"] = models_dir
+    os.environ["EMBEDDING_STORE_DIR"] = os.path.join(workdir, "embeddings")
+    os.environ.setdefault("JOB_WORKERS", "0")
+    os.environ.setdefault("MODEL_WATCH_INTERVAL", "0")
+    make_stub_models(models_dir, args.seed)
+
+    results = asyncio.run(run(args.concurrency, args.requests, args.mix, args.image_size, args.seed))
+
+    print(f"ready in {results['ready_seconds']}s, {results['elapsed_seconds']}s under load", file=sys.stderr)
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}", file=sys.stderr)
+    for name, r in {**results["endpoints"], "overall": results["overall"]}.items():
+        print(
+            f"{name:<16} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']:>8.1f} "
+            f"{r['p50_ms'] or 0:>8.1f} {r['p95_ms'] or 0:>8.1f} {r['p99_ms'] or 0:>8.1f}",
+            file=sys.stderr,
+        )
+    print(json.dumps(results, indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from pathlib import Path
 
 import numpy as np
 
+from backend.plant_gate import GATE_ARTIFACT
+from backend.preprocessing import preprocess_array
+from model_cache import ModelCache
+
 
 DEFAULT_CLASSES = [
     "Early_blight",
@@ -46,14 +51,53 @@ def _load_keras_model(model_path: Path):
     return load_model(str(model_path))
 
 
+def _load_plant_gate(_: Path | None):
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2  # type: ignore
+
+    return MobileNetV2(weights="imagenet")
+
+
+def _load_gated_model(model_path: Path):
+    from backend.plant_gate import build_gated_model
+
+    return build_gated_model(_load_keras_model(model_path))
+
+
+def _load_embedding_gate(gate_path: Path):
+    from backend.plant_gate import PlantGate
+
+    return PlantGate.load(gate_path)
+
+
+# Loaded models are shared by every Streamlit session in this process.
+MODEL_CACHE = ModelCache(max_models=int(os.getenv("MODEL_CACHE_SIZE", "4")))
+MODEL_CACHE.register("keras", _load_keras_model)
+MODEL_CACHE.register("plant_gate", _load_plant_gate)
+MODEL_CACHE.register("keras_gated", _load_gated_model)
+MODEL_CACHE.register("embedding_gate", _load_embedding_gate)
+
+
+def preload_models(model_path: str | Path = "models/disease_model.h5") -> None:
+    """Warm the cache with the disease model (if present) and its plant gate."""
+    model_path = Path(model_path)
+    if not model_path.exists():
+        MODEL_CACHE.preload(None, "plant_gate")
+    elif model_path.with_name(GATE_ARTIFACT).exists():
+        MODEL_CACHE.preload(model_path, "keras_gated")
+        MODEL_CACHE.preload(model_path.with_name(GATE_ARTIFACT), "embedding_gate")
+    else:
+        MODEL_CACHE.preload(model_path, "keras")
+        MODEL_CACHE.preload(None, "plant_gate")
+
+
 def is_plant_image(image_rgb: np.ndarray) -> bool:
     """Check if the image likely contains a plant or leaf using ImageNet classification."""
     try:
         import cv2
-        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input, decode_predictions
+        from tensorflow.keras.applications.mobilenet_v2 import preprocess_input, decode_predictions
         
-        # Load small ImageNet model (cached by Keras)
-        model = MobileNetV2(weights='imagenet')
+        # Small ImageNet model, loaded once per process
+        model = MODEL_CACHE.get(None, "plant_gate")
         
         # Preprocess
         img = cv2.resize(image_rgb, (224, 224))
@@ -112,16 +156,23 @@ def predict_leaf_disease(
             model_type=model_type,
         )
 
-    # Basic preprocessing: resize + scale to [0,1]
-    import cv2
+    # Basic preprocessing: resize + scale to [0,1] (shared with the API)
+    x = np.empty((1, input_size[1], input_size[0], 3), dtype=np.float32)
+    preprocess_array(image_rgb, input_size, out=x[0])
 
-    img = cv2.resize(image_rgb, input_size, interpolation=cv2.INTER_AREA)
-    img = img.astype("float32") / 255.0
-    x = np.expand_dims(img, axis=0)
+    gate_path = model_path.with_name(GATE_ARTIFACT)
+    is_leaf: bool | None = None
 
     try:
-        model = _load_keras_model(model_path)
-        probs = model.predict(x, verbose=0)[0]
+        if gate_path.exists():
+            # One backbone pass gives both the diagnosis and the leaf check
+            model = MODEL_CACHE.get(model_path, "keras_gated")
+            probs, embedding = model.predict(x, verbose=0)
+            probs = probs[0]
+            is_leaf = bool(MODEL_CACHE.get(gate_path, "embedding_gate").is_leaf(embedding)[0])
+        else:
+            model = MODEL_CACHE.get(model_path, "keras")
+            probs = model.predict(x, verbose=0)[0]
     except Exception as e:
         return DiseasePrediction(
             label="Error Loading Model",
@@ -134,9 +185,12 @@ def predict_leaf_disease(
     conf = float(probs[idx])
     
     # --- Robust Validation Guard ---
-    # 1. ImageNet-based plant check
+    # 1. Plant check: embedding gate when fitted, else the ImageNet classifier
     # 2. Confidence check
-    if not is_plant_image(image_rgb):
+    if is_leaf is None:
+        is_leaf = is_plant_image(image_rgb)
+
+    if not is_leaf:
         label = "Unrecognized Image"
         remedy = REMEDIES["Unrecognized Image"]
     elif conf < 0.4:
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+
+
+CacheKey = tuple[str, int | None, str]
+
+
+@dataclass
+class CachedModel:
+    model: Any
+    load_seconds: float
+    size_bytes: int | None = None
+    loaded_at: float = field(default_factory=time.time)
+
+
+@dataclass
+class _PendingLoad:
+    done: threading.Event = field(default_factory=threading.Event)
+    entry: CachedModel | None = None
+    error: BaseException | None = None
+
+
+class ModelCache:
+    """
+    Process-wide, thread-safe LRU cache of loaded models.
+
+    Entries are keyed by (path, mtime, kind), so replacing a model file on
+    disk is picked up on the next lookup. Concurrent lookups of the same key
+    share a single load ("single-flight"); at most `max_models` models stay
+    resident and the least recently used one is dropped first.
+    """
+
+    def __init__(self, max_models: int = 4):
+        self.max_models = max(1, max_models)
+        self._loaders: dict[str, Callable[[Path | None], Any]] = {}
+        self._sizers: dict[str, Callable[[Any], int | None]] = {}
+        self._entries: OrderedDict[CacheKey, CachedModel] = OrderedDict()
+        self._pending: dict[CacheKey, _PendingLoad] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(
+        self,
+        kind: str,
+        loader: Callable[[Path | None], Any],
+        sizer: Callable[[Any], int | None] | None = None,
+    ) -> None:
+        """
+        Register how to load models of `kind`; the loader receives the path.
+
+        `sizer`, if given, reports a loaded model's size in bytes for `stats()`.
+        """
+        self._loaders[kind] = loader
+        if sizer is not None:
+            self._sizers[kind] = sizer
+
+    @staticmethod
+    def key_for(path: str | Path | None, kind: str) -> CacheKey:
+        # Built-in models (e.g. ImageNet weights fetched by Keras) have no path.
+        if path is None:
+            return ("", None, kind)
+        resolved = Path(path).resolve()
+        return (str(resolved), resolved.stat().st_mtime_ns, kind)
+
+    def get(self, path: str | Path | None, kind: str) -> Any:
+        """Return the cached model, loading it (once) if needed."""
+        return self._get_entry(path, kind).model
+
+    def preload(self, path: str | Path | None, kind: str) -> float:
+        """Load a model ahead of first use; returns its load time in seconds."""
+        return self._get_entry(path, kind).load_seconds
+
+    def peek(self, path: str | Path | None, kind: str) -> CachedModel | None:
+        """The resident entry for this model file, without loading it or counting a hit."""
+        try:
+            key = self.key_for(path, kind)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            return self._entries.get(key)
+
+    def clear(self) -> None:
+        """Drop every resident model."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "resident": len(self._entries),
+                "max_models": self.max_models,
+                "hits": self.hits,
+                "misses": self.misses,
+                "models": [
+                    {
+                        "path": p,
+                        "kind": k,
+                        "load_seconds": round(e.load_seconds, 3),
+                        "size_mb": None if e.size_bytes is None else round(e.size_bytes / 1e6, 2),
+                    }
+                    for (p, _, k), e in self._entries.items()
+                ],
+            }
+
+    def _get_entry(self, path: str | Path | None, kind: str) -> CachedModel:
+        if kind not in self._loaders:
+            raise KeyError(f"No loader registered for model kind {kind!r}")
+        key = self.key_for(path, kind)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _PendingLoad()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.entry  # type: ignore[return-value]
+
+        try:
+            start = time.perf_counter()
+            model = self._loaders[kind](None if path is None else Path(path))
+            load_seconds = time.perf_counter() - start
+            sizer = self._sizers.get(kind)
+            entry = CachedModel(model=model, load_seconds=load_seconds, size_bytes=sizer(model) if sizer else None)
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.error = e
+            pending.done.set()
+            raise
+
+        with self._lock:
+            self._insert(key, entry)
+            del self._pending[key]
+        pending.entry = entry
+        pending.done.set()
+        return entry
+
+    def _insert(self, key: CacheKey, entry: CachedModel) -> None:
+        # An older mtime of the same file is stale; drop it straight away.
+        for stale in [k for k in self._entries if k[0] == key[0] and k[2] == key[2]]:
+            del self._entries[stale]
+        self._entries[key] = entry
+        while len(self._entries) > self.max_models:
+            self._entries.popitem(last=False)
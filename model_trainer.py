@@ -3,6 +3,7 @@ import tensorflow as tf
 from tensorflow.keras import layers, models, optimizers, callbacks
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 import argparse
+import numpy as np
 
 # Configuration
 IMG_SIZE = (224, 224)
@@ -40,6 +41,82 @@ def build_cnn():
                   metrics=["accuracy"])
     return model, base_model
 
+def build_student():
+    """
+    Build the small cascade student: MobileNetV2 at width 0.35 with a linear head.
+
+    Same input size and scaling as the full model, so both share preprocessing.
+    """
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=(*IMG_SIZE, 3), include_top=False, weights="imagenet", alpha=0.35
+    )
+    base_model.trainable = False
+
+    model = models.Sequential([
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        layers.Dropout(0.2),
+        layers.Dense(NUM_CLASSES, activation="softmax")
+    ])
+    model.compile(optimizer=optimizers.Adam(learning_rate=1e-3),
+                  loss="categorical_crossentropy",
+                  metrics=["accuracy"])
+    return model, base_model
+
+def _distilled(generator, teacher, hard_weight):
+    """Yield (images, targets) mixing true labels with the full model's probabilities."""
+    while True:
+        images, labels = next(generator)
+        soft = teacher.predict(images, verbose=0)
+        yield images, hard_weight * labels + (1.0 - hard_weight) * soft
+
+def train_student(teacher_path=None, output_path=None, hard_weight=0.5):
+    """
+    Train the cascade student, distilled from the full model.
+
+    Targets blend the true labels with the full model's probabilities, so the
+    student's confidence tracks where the full model is confident.
+    """
+    teacher_path = teacher_path or os.path.join(MODELS_DIR, "disease_model.h5")
+    output_path = output_path or os.path.join(MODELS_DIR, "disease_student.h5")
+    print("\n--- Training cascade student ---")
+
+    if not os.path.exists(TRAIN_DIR):
+        print(f"Error: Training directory not found at {TRAIN_DIR}")
+        return None
+
+    teacher = tf.keras.models.load_model(teacher_path)
+    train_generator = ImageDataGenerator(
+        rescale=1./255, rotation_range=30, zoom_range=0.2, horizontal_flip=True
+    ).flow_from_directory(TRAIN_DIR, target_size=IMG_SIZE, batch_size=BATCH_SIZE, class_mode="categorical")
+    val_generator = ImageDataGenerator(rescale=1./255).flow_from_directory(
+        VAL_DIR, target_size=IMG_SIZE, batch_size=BATCH_SIZE, class_mode="categorical"
+    )
+
+    model, base_model = build_student()
+    checkpoint = callbacks.ModelCheckpoint(
+        output_path, monitor='val_accuracy', save_best_only=True, mode='max', verbose=1
+    )
+    steps = len(train_generator)
+
+    print("\n[Phase 1] Training head...")
+    model.fit(_distilled(train_generator, teacher, hard_weight), steps_per_epoch=steps,
+              epochs=INITIAL_EPOCHS, validation_data=val_generator, callbacks=[checkpoint])
+
+    print("\n[Phase 2] Fine-tuning...")
+    base_model.trainable = True
+    for layer in base_model.layers[:-30]:
+        layer.trainable = False
+    model.compile(optimizer=optimizers.Adam(learning_rate=1e-5),
+                  loss="categorical_crossentropy", metrics=["accuracy"])
+    model.fit(_distilled(train_generator, teacher, hard_weight), steps_per_epoch=steps,
+              epochs=FINE_TUNE_EPOCHS // 2, validation_data=val_generator,
+              callbacks=[checkpoint, callbacks.EarlyStopping(monitor='val_loss', patience=4, restore_best_weights=True)])
+
+    print(f"\nSaved cascade student to {output_path}")
+    print("Pick a threshold with: python -m backend.cascade --samples " + VAL_DIR)
+    return output_path
+
 def train_model():
     print(f"\n--- Starting Advanced Training (CNN) ---")
     
@@ -116,6 +193,129 @@ def train_model():
 
     print(f"\nTraining Complete. Best model saved to {save_path}")
 
+def _representative_dataset(num_samples=100):
+    """Yield training images for int8 calibration."""
+    datagen = ImageDataGenerator(rescale=1./255)
+    generator = datagen.flow_from_directory(
+        TRAIN_DIR, target_size=IMG_SIZE, batch_size=1, class_mode=None, shuffle=True
+    )
+    for _ in range(min(num_samples, generator.samples)):
+        yield [next(generator).astype("float32")]
+
+def export_tflite(quantization="float16", model_path=None, output_path=None):
+    """
+    Export the trained Keras model to a quantized TFLite flatbuffer.
+
+    quantization:
+        "float16" - half-precision weights (about half the size, near-identical accuracy)
+        "int8"    - full integer quantization calibrated on training images
+        "dynamic" - int8 weights with float activations
+    """
+    model_path = model_path or os.path.join(MODELS_DIR, "disease_model.h5")
+    output_path = output_path or os.path.join(MODELS_DIR, "disease_model.tflite")
+    print(f"\n--- Exporting TFLite ({quantization}) ---")
+
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if quantization == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not os.path.exists(TRAIN_DIR):
+            print(f"Error: int8 calibration needs training images at {TRAIN_DIR}")
+            return None
+        converter.representative_dataset = _representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif quantization != "dynamic":
+        raise ValueError(f"Unknown quantization '{quantization}'")
+
+    tflite_model = converter.convert()
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+
+    print(f"Saved {len(tflite_model) / 1e6:.1f} MB TFLite model to {output_path}")
+    return output_path
+
+def export_onnx(model_path=None, output_path=None):
+    """Export the trained Keras model to ONNX (requires tf2onnx)."""
+    try:
+        import tf2onnx
+    except ImportError:
+        print("Error: ONNX export requires tf2onnx (pip install tf2onnx onnxruntime)")
+        return None
+
+    model_path = model_path or os.path.join(MODELS_DIR, "disease_model.h5")
+    output_path = output_path or os.path.join(MODELS_DIR, "disease_model.onnx")
+    print("\n--- Exporting ONNX ---")
+
+    model = tf.keras.models.load_model(model_path)
+    spec = (tf.TensorSpec((None, *IMG_SIZE, 3), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=output_path)
+
+    print(f"Saved ONNX model to {output_path}")
+    return output_path
+
+def build_plant_gate(model_path=None, output_path=None, quantile=0.99):
+    """
+    Fit the embedding-distance plant gate on the training images.
+
+    The gate reuses the disease model's own backbone features, so the
+    separate ImageNet MobileNetV2 check is no longer needed at inference.
+    """
+    from backend.plant_gate import PlantGate, build_gated_model, GATE_ARTIFACT
+
+    model_path = model_path or os.path.join(MODELS_DIR, "disease_model.h5")
+    output_path = output_path or os.path.join(MODELS_DIR, GATE_ARTIFACT)
+    print("\n--- Building plant gate ---")
+
+    if not os.path.exists(TRAIN_DIR):
+        print(f"Error: Training directory not found at {TRAIN_DIR}")
+        return None
+
+    gated = build_gated_model(tf.keras.models.load_model(model_path))
+    generator = ImageDataGenerator(rescale=1./255).flow_from_directory(
+        TRAIN_DIR, target_size=IMG_SIZE, batch_size=BATCH_SIZE, class_mode="sparse", shuffle=False
+    )
+
+    embeddings, labels = [], []
+    for _ in range(len(generator)):
+        images, batch_labels = next(generator)
+        _, batch_embeddings = gated.predict(images, verbose=0)
+        embeddings.append(batch_embeddings)
+        labels.append(batch_labels.astype(int))
+
+    gate = PlantGate.fit(np.concatenate(embeddings), np.concatenate(labels), NUM_CLASSES, quantile)
+    gate.save(output_path)
+    print(f"Saved plant gate ({quantile:.0%} of training images accepted per class) to {output_path}")
+    return output_path
+
 if __name__ == "__main__":
-    # Removed argument parser since we only support CNN now
-    train_model()
+    parser = argparse.ArgumentParser(description="Train or export the disease CNN")
+    parser.add_argument("--export", choices=["tflite", "onnx"],
+                        help="Export models/disease_model.h5 instead of training")
+    parser.add_argument("--quantize", choices=["float16", "int8", "dynamic"], default="float16",
+                        help="TFLite quantization mode (default: float16)")
+    parser.add_argument("--train-student", action="store_true",
+                        help="Distill the small cascade student from models/disease_model.h5")
+    parser.add_argument("--student", action="store_true",
+                        help="With --export, export models/disease_student.h5 instead")
+    parser.add_argument("--build-gate", action="store_true",
+                        help="Fit the shared-backbone plant gate for models/disease_model.h5")
+    args = parser.parse_args()
+
+    name = "disease_student" if args.student else "disease_model"
+    if args.build_gate:
+        build_plant_gate()
+    elif args.train_student:
+        train_student()
+    elif args.export == "tflite":
+        export_tflite(args.quantize, os.path.join(MODELS_DIR, f"{name}.h5"), os.path.join(MODELS_DIR, f"{name}.tflite"))
+    elif args.export == "onnx":
+        export_onnx(os.path.join(MODELS_DIR, f"{name}.h5"), os.path.join(MODELS_DIR, f"{name}.onnx"))
+    else:
+        train_model()
+        build_plant_gate()
+
+    if args.export:
+        print("Check parity with: python -m backend.parity --backends keras " + args.export)
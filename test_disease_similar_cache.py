@@ -0,0 +1,81 @@
+import asyncio
+import io
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.auth import get_current_user
+from backend.database import get_db
+from backend.embedding_store import EmbeddingStore
+from backend.ml_service import DISEASE_CLASSES, ml_service
+from backend.models import Base, User
+from backend.prediction_cache import PredictionCache
+from backend.routers import disease
+
+
+def _jpeg(quality):
+    y, x = np.mgrid[0:256, 0:256]
+    pixels = np.stack([x, y, (x + y) // 2], axis=-1).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_cached_predictions_share_the_embedding_for_similar_search(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(User(id=1, username="farmer", email="f@example.com", hashed_password="x", role="farmer"))
+        db.commit()
+
+    def session():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(disease.router, prefix="/api/disease")
+    app.dependency_overrides[get_db] = session
+    app.dependency_overrides[get_current_user] = lambda: User(id=1, role="farmer")
+
+    calls = []
+
+    async def fake_cnn(image):
+        calls.append(image)
+        embedding = np.random.default_rng(len(calls)).random(16).astype(np.float16)
+        probs = {name: 1.0 / len(DISEASE_CLASSES) for name in DISEASE_CLASSES}
+        return {"disease": "Healthy", "confidence": 0.9, "all_predictions": probs,
+                "model_used": "CNN", "model_version": "v1", "embedding": embedding}
+
+    monkeypatch.setattr(ml_service, "predict_disease_async", fake_cnn)
+    monkeypatch.setattr(ml_service, "prediction_cache", PredictionCache(persist=False, perceptual=True))
+    monkeypatch.setattr(disease, "embedding_store", EmbeddingStore(str(tmp_path / "embeddings")))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # The model, an exact repeat, and a re-encoded copy (perceptual hit)
+            uploads = [_jpeg(95), _jpeg(95), _jpeg(80)]
+            cached = []
+            for data in uploads:
+                response = await client.post("/api/disease/predict", files={"image": ("leaf.jpg", data, "image/jpeg")})
+                assert response.status_code == 200
+                assert "embedding_source_id" not in response.json()
+                cached.append(response.json()["cached"])
+            assert cached == [False, True, True] and len(calls) == 1
+
+            for prediction_id in (1, 2, 3):
+                response = await client.get(f"/api/disease/similar/{prediction_id}?k=5")
+                assert response.status_code == 200
+                results = response.json()["results"]
+                assert {r["id"] for r in results} == {1, 2, 3} - {prediction_id}
+                assert all(r["similarity"] > 0.99 for r in results)
+
+    asyncio.run(run())
@@ -0,0 +1,48 @@
+import numpy as np
+
+from backend.fertilizer_optimizer import DOSE_FEATURES, DOSES, limed_ph, optimize_doses
+
+BASE = np.array([0, 25, 150, 60, 100, 20, 100, 5.5, 1.0, 1])
+
+
+def _quadratic_grid(base, axes):
+    """Yield peaking at N=220, P=60, K=180 and pH 6.5 (a smooth stand-in for the forest)."""
+    optimum = {4: 220.0, 5: 60.0, 6: 180.0, 7: 6.5}
+    scale = {4: 1e-4, 5: 1e-3, 6: 1e-4, 7: 1.0}
+    yields = np.full([len(values) for _, values in axes], 20.0)
+    for axis, (feature, values) in enumerate(axes):
+        shape = [1] * len(axes)
+        shape[axis] = len(values)
+        yields = yields - scale[feature] * (np.asarray(values).reshape(shape) - optimum[feature]) ** 2
+    return yields, "ml"
+
+
+def test_optimizer_finds_the_optimum_within_budget():
+    # Plenty of budget: doses top the soil up to the optimum
+    result = optimize_doses(_quadratic_grid, BASE, budget=1e6, deadline_ms=10_000)
+    assert abs(result["doses"]["nitrogen"] - 120) <= 2
+    assert abs(result["doses"]["phosphorus"] - 40) <= 1
+    assert abs(result["doses"]["potassium"] - 80) <= 2
+    assert abs(result["ph_after_lime"] - 6.5) <= 0.05
+    assert result["yield_gain"] > 0 and not result["search"]["deadline_hit"]
+
+    # A tight budget is never exceeded, and doing nothing is always allowed
+    prices = {"nitrogen": 10.0, "phosphorus": 50.0, "potassium": 20.0, "lime": 2000.0}
+    for budget in (0.0, 500.0, 2000.0):
+        result = optimize_doses(_quadratic_grid, BASE, budget=budget, prices=prices, deadline_ms=10_000)
+        cost = sum(prices[d] * result["doses"][d] for d in DOSES)  # doses are rounded to 0.1 kg
+        assert result["cost"] <= budget + 1e-6 and abs(cost - result["cost"]) < 5.0
+        assert result["predicted_yield"] >= result["baseline_yield"]
+
+
+def test_optimizer_profit_and_deadline():
+    # With a low crop price no dose pays for itself
+    result = optimize_doses(_quadratic_grid, BASE, budget=1e6, crop_price=1.0, deadline_ms=10_000)
+    assert result["doses"] == {d: 0.0 for d in DOSES} and result["profit_gain"] == 0.0
+
+    # An impossible deadline still returns the first round's best point
+    result = optimize_doses(_quadratic_grid, BASE, budget=1e6, deadline_ms=1e-6)
+    assert result["search"]["rounds"] == 1 and result["search"]["deadline_hit"]
+
+    assert limed_ph(7.5, np.array([3.0]))[0] == 7.5
+    assert DOSE_FEATURES["lime"] == 7
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import (
+    ExtraTreesRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor,
+    RandomForestClassifier, RandomForestRegressor,
+)
+
+from backend.forest_compiler import FOREST_TREE_MAJOR_ROWS, compile_forest
+
+
+def _data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform([0, 15, 0, 30, 100, 20, 80, 5.0, 0.2, 0], [3, 40, 400, 95, 400, 120, 300, 8.5, 1.5, 4], (n, 10))
+    X[:, [0, 9]] = np.floor(X[:, [0, 9]])
+    y = 15 * (1.2 - 0.2 * X[:, 0]) * (1 - 0.02 * np.abs(X[:, 1] - 24)) + rng.normal(0, 0.5, n)
+    return X, y
+
+
+@pytest.mark.parametrize("model", [
+    RandomForestRegressor(n_estimators=40, max_depth=12, min_samples_leaf=2, max_features="sqrt", random_state=0),
+    RandomForestRegressor(n_estimators=10, random_state=1),  # unlimited depth, uneven trees
+    ExtraTreesRegressor(n_estimators=20, random_state=2),
+])
+def test_compiled_forest_matches_sklearn(model):
+    X_train, y_train = _data(3000)
+    model.fit(X_train, y_train)
+    compiled = compile_forest(model)
+
+    X, _ = _data(FOREST_TREE_MAJOR_ROWS + 500, seed=1)
+    # Both walk orders: a single row, a small batch and a large batch
+    for batch in (X[:1], X[:64], X):
+        np.testing.assert_allclose(compiled.predict(batch), model.predict(batch), rtol=0, atol=1e-12)
+
+
+def test_compiled_forest_matches_sklearn_at_thresholds():
+    X_train, y_train = _data(2000)
+    model = RandomForestRegressor(n_estimators=15, random_state=0).fit(X_train, y_train)
+    compiled = compile_forest(model)
+
+    # Inputs sitting exactly on (and one float32 step either side of) split
+    # thresholds, where float32 rounding would change a decision
+    rng = np.random.default_rng(3)
+    tree = model.estimators_[0].tree_
+    splits = np.flatnonzero(tree.children_left != -1)
+    X = np.repeat(_data(1, seed=4)[0], 3 * len(splits), axis=0).astype(np.float32)
+    on = tree.threshold[splits].astype(np.float32)
+    values = np.concatenate([on, np.nextafter(on, np.float32(-np.inf)), np.nextafter(on, np.float32(np.inf))])
+    X[np.arange(len(X)), np.tile(tree.feature[splits], 3)] = values
+    X = X[rng.permutation(len(X))]
+
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=0, atol=1e-12)
+
+
+def test_compile_forest_rejects_unsupported_models():
+    X, y = _data(200)
+    with pytest.raises(ValueError):
+        compile_forest(RandomForestClassifier(n_estimators=3).fit(X, y > y.mean()))
+    with pytest.raises(ValueError):
+        compile_forest(RandomForestRegressor(n_estimators=3))  # not fitted
+    for boosted in (GradientBoostingRegressor(n_estimators=3), HistGradientBoostingRegressor(max_iter=3)):
+        with pytest.raises(ValueError, match="not a supported forest"):
+            compile_forest(boosted.fit(X, y))
+
+    compiled = compile_forest(RandomForestRegressor(n_estimators=3).fit(X, y))
+    with pytest.raises(ValueError):
+        compiled.predict(np.full((1, 10), np.nan))
+    with pytest.raises(ValueError):
+        compiled.predict(np.zeros((1, 9)))
+
+
+def test_compiled_forest_grid_matches_expanded_rows():
+    X_train, y_train = _data(3000)
+    model = RandomForestRegressor(n_estimators=20, max_depth=10, random_state=0).fit(X_train, y_train)
+    compiled = compile_forest(model)
+    base = _data(1, seed=5)[0][0]
+
+    # Unsorted and repeated values, a categorical axis and a split threshold
+    threshold = np.float32(model.estimators_[0].tree_.threshold[0])
+    axes = [
+        (1, np.array([30.0, 18.0, 24.0, 18.0, threshold])),
+        (0, np.array([2.0, 0.0, 1.0])),
+        (7, np.linspace(5.0, 8.5, 7)),
+    ]
+    grid = compiled.predict_grid(base, axes)
+    assert grid.shape == (5, 3, 7)
+
+    columns = np.meshgrid(*[values for _, values in axes], indexing="ij")
+    X = np.tile(base, (grid.size, 1))
+    for (feature, _), column in zip(axes, columns):
+        X[:, feature] = column.ravel()
+    np.testing.assert_allclose(grid.ravel(), model.predict(X), rtol=0, atol=1e-9)
+
+    with pytest.raises(ValueError):
+        compiled.predict_grid(base, [(1, [20.0]), (1, [25.0])])
+    with pytest.raises(ValueError):
+        compiled.predict_grid(base, [(1, [np.nan])])
@@ -0,0 +1,57 @@
+import numpy as np
+
+from yield_model import HEURISTIC_DEFAULTS, heuristic_yield, heuristic_yield_batch
+from backend.ml_service import MLService
+
+# Ordinary agronomic ranges plus values well outside them (negative, zero,
+# huge, non-finite), so every clipping branch is exercised
+SPECIAL_VALUES = np.array([0.0, -1.0, -1e6, 1e6, 0.5, np.inf, -np.inf, np.nan])
+
+
+def _random_column(rng, n, low, high):
+    column = rng.uniform(low, high, n)
+    special = rng.random(n) < 0.1
+    column[special] = rng.choice(SPECIAL_VALUES, special.sum())
+    return column
+
+
+def test_yield_model_heuristic_batch_matches_scalar():
+    rng = np.random.default_rng(0)
+    n = 5000
+    ranges = {
+        "temp_mean_c": (-10, 60), "rainfall_mm": (0, 600), "soil_ph": (3, 10), "soil_n": (0, 600),
+        "soil_p": (0, 80), "soil_k": (0, 600), "organic_carbon": (0, 4),
+    }
+    columns = {name: _random_column(rng, n, *bounds) for name, bounds in ranges.items()}
+    # Some rows leave features out, so the defaults are used
+    dropped = rng.choice(list(ranges), 2, replace=False)
+    partial = {name: values for name, values in columns.items() if name not in dropped}
+
+    for features in (columns, partial):
+        batch = heuristic_yield_batch(features)
+        scalar = [heuristic_yield({name: float(values[i]) for name, values in features.items()}) for i in range(n)]
+        np.testing.assert_array_equal(batch, scalar)
+
+    assert heuristic_yield_batch({}) == heuristic_yield({})
+    assert set(HEURISTIC_DEFAULTS) == set(ranges)
+
+
+def test_ml_service_heuristic_batch_matches_scalar():
+    rng = np.random.default_rng(1)
+    n = 5000
+    service = MLService()
+    season = rng.integers(0, 3, n)
+    columns = [
+        _random_column(rng, n, -10, 60),  # temperature
+        _random_column(rng, n, 0, 600),  # rainfall
+        _random_column(rng, n, 0, 600),  # nitrogen
+        _random_column(rng, n, 0, 150),  # phosphorus
+        _random_column(rng, n, 0, 400),  # potassium
+        _random_column(rng, n, 3, 10),  # ph
+    ]
+
+    with np.errstate(invalid="ignore"):  # inf - inf in the NPK sum, as in the scalar version
+        batch = service._heuristic_yield_batch(season, *columns)
+    scalar = [service._heuristic_yield(int(season[i]), *(float(c[i]) for c in columns)) for i in range(n)]
+    np.testing.assert_array_equal(batch, scalar)
+    assert ((batch >= 5.0) & (batch <= 25.0)).all()
@@ -1,19 +1,72 @@
+"""
+Train the yield RandomForest on synthetic data.
+
+    python train_yield_model.py
+
+trains the production forest and saves it to models/yield_model.joblib.
+
+    python train_yield_model.py --search [--workers 4] [--json leaderboard.json] [--save]
+
+instead runs a hyperparameter search over RandomForest and gradient-boosting
+candidates and prints a leaderboard of accuracy against inference latency
+and model size. Candidates are fitted in a process pool; the dataset is
+cached as .npy files (data/yield_cache/) that every worker memory-maps
+read-only, so it is generated once and never copied into the workers.
+Latency is then timed one model at a time in this process, with the engine
+the backend serves (the compiled forest where the model supports it).
+"""
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor, HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import mean_absolute_error, r2_score
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import joblib
 import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
 
-def train_yield_model():
-    print("--- Starting Yield Model Training (High Accuracy) ---")
-    
-    # 1. Generate High-Volume Synthetic Data (10,000 samples)
-    np.random.seed(42)
-    n_samples = 10000  # Increased from 1,000 for better generalization
-    
-    print(f"Generating {n_samples} synthetic samples...")
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+CACHE_DIR = os.path.join(BASE_DIR, "data", "yield_cache")
+
+# Bump when generate_dataset changes, so stale caches aren't reused
+DATASET_VERSION = 1
+
+FEATURES = [
+    'season', 'temperature', 'rainfall', 'humidity', 'nitrogen',
+    'phosphorus', 'potassium', 'ph', 'organic_carbon', 'variety'
+]
+
+# Search space: (family, parameters). n_jobs stays 1; the pool runs candidates in parallel
+CANDIDATES = [
+    ("rf", dict(n_estimators=100, max_depth=10, min_samples_leaf=2, max_features='sqrt')),
+    ("rf", dict(n_estimators=100, max_depth=15, min_samples_leaf=2, max_features='sqrt')),
+    ("rf", dict(n_estimators=300, max_depth=15, min_samples_split=4, min_samples_leaf=2, max_features='sqrt')),
+    ("rf", dict(n_estimators=100, max_depth=15, min_samples_leaf=2, max_features=1.0)),
+    ("rf", dict(n_estimators=300, max_depth=None, min_samples_leaf=1, max_features=0.5)),
+    ("gb", dict(n_estimators=200, learning_rate=0.1, max_depth=3)),
+    ("gb", dict(n_estimators=500, learning_rate=0.05, max_depth=4, subsample=0.8)),
+    ("hgb", dict(max_iter=300, learning_rate=0.1, max_leaf_nodes=31)),
+    ("hgb", dict(max_iter=600, learning_rate=0.05, max_leaf_nodes=63)),
+]
+
+ESTIMATORS = {
+    "rf": RandomForestRegressor,
+    "gb": GradientBoostingRegressor,
+    "hgb": HistGradientBoostingRegressor,
+}
+
+SPLITS = ("X_train", "X_test", "y_train", "y_test")
+
+
+def generate_dataset(n_samples=10000, seed=42):
+    """Synthetic (features, yield): an (n, 10) matrix in FEATURES order and the targets."""
+    np.random.seed(seed)
 
     # Season encoding: Kharif=0, Rabi=1, Zayad=2
     season = np.random.choice([0, 1, 2], n_samples)
@@ -71,25 +124,60 @@ def train_yield_model():
     # Clip to realistic range (5-25 tons/ha)
     yield_val = np.clip(yield_val, 5, 30)
 
-    # Create DataFrame
-    df = pd.DataFrame({
-        'season': season,
-        'temperature': temperature,
-        'rainfall': rainfall,
-        'humidity': humidity,
-        'nitrogen': nitrogen,
-        'phosphorus': phosphorus,
-        'potassium': potassium,
-        'ph': ph,
-        'organic_carbon': organic_carbon,
-        'variety': variety,
-        'yield': yield_val
-    })
+    X = np.column_stack([
+        season, temperature, rainfall, humidity, nitrogen,
+        phosphorus, potassium, ph, organic_carbon, variety
+    ])
+    return X, yield_val
+
+
+def cached_dataset(n_samples=10000, seed=42, cache_dir=CACHE_DIR):
+    """
+    Paths of the cached train/test split (.npy), generating it on first use.
+
+    X is stored as float32, the dtype the tree models train on, so workers
+    can fit straight from the read-only memory map without converting it.
+    """
+    directory = os.path.join(cache_dir, f"v{DATASET_VERSION}_n{n_samples}_seed{seed}")
+    paths = {name: os.path.join(directory, f"{name}.npy") for name in SPLITS}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+
+    X, y = generate_dataset(n_samples, seed)
+    arrays = dict(zip(SPLITS, train_test_split(X, y, test_size=0.2, random_state=42)))
+    arrays["X_train"] = arrays["X_train"].astype(np.float32)
+    arrays["X_test"] = arrays["X_test"].astype(np.float32)
+    # Written to a scratch directory and renamed, so a half-written cache is never used
+    os.makedirs(cache_dir, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=cache_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(scratch, f"{name}.npy"), np.ascontiguousarray(array))
+    try:
+        os.rename(scratch, directory)
+    except OSError:
+        shutil.rmtree(scratch)  # another run cached it first
+    return paths
+
+
+def load_dataset(paths):
+    """The cached split, memory-mapped read-only."""
+    return {name: np.load(path, mmap_mode="r") for name, path in paths.items()}
+
+
+def train_yield_model():
+    print("--- Starting Yield Model Training (High Accuracy) ---")
+    
+    # 1. High-Volume Synthetic Data (10,000 samples), cached after the first run
+    n_samples = 10000  # Increased from 1,000 for better generalization
+    print(f"Loading {n_samples} synthetic samples...")
+    data = load_dataset(cached_dataset(n_samples))
 
     # 2. Data Splitting
-    X = df.drop('yield', axis=1)
-    y = df['yield']
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train = pd.DataFrame(data["X_train"], columns=FEATURES)
+    X_test = pd.DataFrame(data["X_test"], columns=FEATURES)
+    y_train, y_test = np.asarray(data["y_train"]), np.asarray(data["y_test"])
+    X = pd.concat([X_train, X_test], ignore_index=True)
+    y = np.concatenate([y_train, y_test])
 
     # 3. Model Training (Optimized Hyperparameters)
     print("\nTraining RandomForest (Optimized)...")
@@ -124,13 +212,165 @@ def train_yield_model():
         print("[INFO] Accuracy is decent but could be improved.")
 
     # 5. Save Model
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    MODELS_DIR = os.path.join(BASE_DIR, "models")
     os.makedirs(MODELS_DIR, exist_ok=True)
     
     model_path = os.path.join(MODELS_DIR, "yield_model.joblib")
     joblib.dump(model, model_path)
     print(f"\nModel saved to: {model_path}")
 
+
+# -- Hyperparameter search -------------------------------------------------------
+
+_worker_data = None
+
+
+def _init_search_worker(paths):
+    """Pool initializer: map the cached dataset once per worker (shared page cache, no copy)."""
+    global _worker_data
+    _worker_data = load_dataset(paths)
+
+
+def candidate_name(family, params):
+    return family + "(" + ", ".join(f"{key}={value}" for key, value in params.items()) + ")"
+
+
+def _fit_candidate(family, params, out_dir, seed=42):
+    """Fit one candidate on the mapped training split; returns its test scores and saved path."""
+    data = _worker_data
+    model = ESTIMATORS[family](random_state=seed, **params)
+    started = time.perf_counter()
+    model.fit(data["X_train"], data["y_train"])
+    fit_seconds = time.perf_counter() - started
+
+    y_pred = model.predict(data["X_test"])
+    path = os.path.join(out_dir, f"{family}-{os.getpid()}-{time.monotonic_ns()}.joblib")
+    joblib.dump(model, path)
+    return {
+        "model": candidate_name(family, params),
+        "family": family,
+        "params": params,
+        "r2": float(r2_score(data["y_test"], y_pred)),
+        "mae": float(mean_absolute_error(data["y_test"], y_pred)),
+        "fit_s": round(fit_seconds, 2),
+        "path": path,
+    }
+
+
+def time_inference(model, X, repeats=50):
+    """
+    (engine, median ms for one row, ms per 1,000-row batch) with the
+    engine the backend would serve this model with.
+    """
+    engine = "sklearn"
+    try:
+        from backend.forest_compiler import compile_forest
+        model = compile_forest(model)
+        engine = "compiled"
+    except (ImportError, ValueError):
+        pass  # not a forest the compiler supports
+
+    row = np.ascontiguousarray(X[:1])
+    model.predict(row)  # warm up
+    single = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict(row)
+        single.append(time.perf_counter() - started)
+    batch = np.ascontiguousarray(X[:1000])
+    started = time.perf_counter()
+    model.predict(batch)
+    batch_seconds = time.perf_counter() - started
+    return engine, float(np.median(single)) * 1000, batch_seconds * 1000 * 1000 / len(batch)
+
+
+def pareto_front(rows):
+    """Names of rows no other row beats on accuracy, latency and size at once."""
+    front = set()
+    for row in rows:
+        dominated = any(
+            other["r2"] >= row["r2"] and other["latency_ms"] <= row["latency_ms"] and other["size_mb"] <= row["size_mb"]
+            and (other["r2"], other["latency_ms"], other["size_mb"]) != (row["r2"], row["latency_ms"], row["size_mb"])
+            for other in rows
+        )
+        if not dominated:
+            front.add(row["model"])
+    return front
+
+
+def search(candidates=CANDIDATES, workers=None, n_samples=10000, seed=42, cache_dir=CACHE_DIR, keep_best=None):
+    """
+    Fit every candidate in a process pool and rank them.
+
+    Returns leaderboard rows sorted by test R², best first. With `keep_best`
+    set to a path, the best model is saved there.
+    """
+    paths = cached_dataset(n_samples, seed, cache_dir)
+    workers = workers or os.cpu_count() or 1
+    out_dir = tempfile.mkdtemp(prefix="yield-search-")
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker, initargs=(paths,)) as pool:
+            futures = [pool.submit(_fit_candidate, family, params, out_dir, seed) for family, params in candidates]
+            for future in as_completed(futures):
+                row = future.result()
+                print(f"  fitted {row['model']}: R² {row['r2']:.4f} in {row['fit_s']:.1f}s", file=sys.stderr)
+                rows.append(row)
+
+        # Timed here, one model at a time, so candidates don't compete for the CPU
+        X_test = load_dataset(paths)["X_test"]
+        for row in rows:
+            row["size_mb"] = round(os.path.getsize(row["path"]) / 1e6, 2)
+            row["engine"], row["latency_ms"], row["batch_ms_per_1k"] = time_inference(joblib.load(row["path"]), X_test)
+
+        rows.sort(key=lambda row: -row["r2"])
+        front = pareto_front(rows)
+        for row in rows:
+            row["pareto"] = row["model"] in front
+        if keep_best and rows:
+            os.makedirs(os.path.dirname(os.path.abspath(keep_best)), exist_ok=True)
+            shutil.copyfile(rows[0]["path"], keep_best)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    for row in rows:
+        del row["path"]
+    return rows
+
+
+def print_leaderboard(rows):
+    print(f"{'#':>2} {'R²':>7} {'MAE':>6} {'1-row ms':>9} {'1k-row ms':>10} {'MB':>7} {'fit s':>6}  model")
+    for rank, row in enumerate(rows, 1):
+        print(
+            f"{rank:>2} {row['r2']:>7.4f} {row['mae']:>6.3f} {row['latency_ms']:>9.3f} {row['batch_ms_per_1k']:>10.1f} "
+            f"{row['size_mb']:>7.2f} {row['fit_s']:>6.1f}  {row['model']} [{row['engine']}]{' *' if row['pareto'] else ''}"
+        )
+    print("* not beaten on accuracy, latency and size at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the yield model, or search hyperparameters")
+    parser.add_argument("--search", action="store_true", help="Rank CANDIDATES instead of training the production forest")
+    parser.add_argument("--workers", type=int, default=None, help="Search processes (default: CPU count)")
+    parser.add_argument("--samples", type=int, default=10000)
+    parser.add_argument("--families", nargs="+", choices=sorted(ESTIMATORS), help="Only search these model families")
+    parser.add_argument("--json", help="Also write the leaderboard to this file")
+    parser.add_argument("--save", action="store_true", help="Save the best candidate to models/yield_model.joblib")
+    args = parser.parse_args()
+
+    if not args.search:
+        train_yield_model()
+        return
+
+    candidates = [(family, params) for family, params in CANDIDATES if not args.families or family in args.families]
+    print(f"Searching {len(candidates)} candidates on {args.samples} samples...", file=sys.stderr)
+    best_path = os.path.join(MODELS_DIR, "yield_model.joblib") if args.save else None
+    rows = search(candidates, workers=args.workers, n_samples=args.samples, keep_best=best_path)
+    print_leaderboard(rows)
+    if best_path:
+        print(f"\nBest model saved to: {best_path}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
 if __name__ == "__main__":
-    train_yield_model()
+    main()
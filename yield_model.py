@@ -1,11 +1,16 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 import joblib
 import numpy as np
 
+from backend.forest_compiler import CompiledForest, compile_forest, load_compiled, save_compiled
+from model_cache import ModelCache
+
 
 @dataclass(frozen=True)
 class YieldPrediction:
@@ -15,6 +20,78 @@ class YieldPrediction:
     note: str | None
 
 
+# Memory-map the compiled forest so every process (Streamlit, its workers)
+# shares one copy of the node arrays
+YIELD_MODEL_MMAP = os.getenv("YIELD_MODEL_MMAP", "true").lower() == "true"
+
+
+def _compiled_path(model_path: Path) -> Path:
+    return model_path.with_name(model_path.stem + ".compiled.joblib")
+
+
+def _load_yield_model(model_path: Path) -> Any:
+    """
+    Load the yield model, as a compiled forest when possible.
+
+    The compiled arrays are saved next to the model (`*.compiled.joblib`)
+    the first time, and later loads map that file instead of unpickling the
+    forest. It is rebuilt whenever the model file changes.
+    """
+    stat = model_path.stat()
+    source = (stat.st_size, stat.st_mtime_ns)
+    compiled_path = _compiled_path(model_path)
+    mmap_mode = "r" if YIELD_MODEL_MMAP else None
+    if compiled_path.exists():
+        try:
+            forest = load_compiled(str(compiled_path), mmap_mode=mmap_mode)
+            if forest.source == source:
+                return forest
+        except Exception:
+            pass  # unreadable or from another version; rebuilt below
+
+    model = joblib.load(model_path)
+    try:
+        forest = compile_forest(model)
+    except ValueError:
+        return model  # not a forest; use it as is
+    forest.source = source
+    try:
+        save_compiled(forest, str(compiled_path))
+        return load_compiled(str(compiled_path), mmap_mode=mmap_mode)
+    except OSError:
+        return forest  # read-only models directory: keep it in memory
+
+
+def _model_size(model: Any) -> int | None:
+    return model.nbytes if isinstance(model, CompiledForest) else None
+
+
+# Loaded once per process and reused until the model file changes
+MODEL_CACHE = ModelCache(max_models=2)
+MODEL_CACHE.register("yield", _load_yield_model, sizer=_model_size)
+
+
+def preload_yield_model(model_path: str | Path = "models/yield_model.joblib") -> float | None:
+    """Load the yield model ahead of the first prediction; returns the load time, or None without a model."""
+    model_path = Path(model_path)
+    if not model_path.exists():
+        return None
+    return MODEL_CACHE.preload(model_path, "yield")
+
+
+def yield_model_report(model_path: str | Path = "models/yield_model.joblib") -> dict[str, Any] | None:
+    """Load time, size and memory-mapping of the cached yield model; None if it isn't loaded."""
+    entry = MODEL_CACHE.peek(model_path, "yield")
+    if entry is None:
+        return None
+    return {
+        "load_seconds": round(entry.load_seconds, 3),
+        "size_mb": None if entry.size_bytes is None else round(entry.size_bytes / 1e6, 2),
+        "compiled": isinstance(entry.model, CompiledForest),
+        "memory_mapped": bool(getattr(entry.model, "memory_mapped", False)),
+    }
+
+
 def _bucketize(yield_value: float) -> str:
     # Simple default buckets; tune once you have real data.
     if yield_value < 8:
@@ -24,6 +101,64 @@ def _bucketize(yield_value: float) -> str:
     return "High"
 
 
+# Heuristic inputs and the values assumed when a feature is missing
+HEURISTIC_DEFAULTS = {
+    "temp_mean_c": 28.0,
+    "rainfall_mm": 100.0,
+    "soil_ph": 6.8,
+    "soil_n": 200.0,
+    "soil_p": 15.0,
+    "soil_k": 200.0,
+    "organic_carbon": 0.7,
+}
+
+
+def heuristic_yield(features: dict[str, float]) -> float:
+    """Explainable baseline yield for one set of features (see `predict_yield`)."""
+    temp = features.get("temp_mean_c", HEURISTIC_DEFAULTS["temp_mean_c"])
+    rain = features.get("rainfall_mm", HEURISTIC_DEFAULTS["rainfall_mm"])
+    ph = features.get("soil_ph", HEURISTIC_DEFAULTS["soil_ph"])
+    n = features.get("soil_n", HEURISTIC_DEFAULTS["soil_n"])
+    p = features.get("soil_p", HEURISTIC_DEFAULTS["soil_p"])
+    k = features.get("soil_k", HEURISTIC_DEFAULTS["soil_k"])
+    oc = features.get("organic_carbon", HEURISTIC_DEFAULTS["organic_carbon"])
+
+    # Penalize extreme rainfall, reward balanced NPK + near-neutral pH
+    score = 0.0
+    score += max(0.0, 1.0 - abs(temp - 26.0) / 12.0) * 0.25
+    score += max(0.0, 1.0 - abs(rain - 120.0) / 200.0) * 0.25
+    score += max(0.0, 1.0 - abs(ph - 6.8) / 2.0) * 0.2
+    score += max(0.0, 1.0 - abs(n - 220.0) / 220.0) * 0.1
+    score += max(0.0, 1.0 - abs(p - 18.0) / 18.0) * 0.1
+    score += max(0.0, 1.0 - abs(k - 220.0) / 220.0) * 0.05
+    score += max(0.0, min(1.0, oc / 1.2)) * 0.05
+
+    # Map [0,1] score to a pseudo numeric yield (e.g., tons/acre placeholder)
+    return float(5.0 + score * 15.0)
+
+
+def heuristic_yield_batch(features: dict[str, np.ndarray]) -> np.ndarray:
+    """
+    `heuristic_yield` for arrays of features, row for row.
+
+    Each value is an array (or scalar, broadcast); missing features take
+    their `HEURISTIC_DEFAULTS`. fmax/fmin clip NaN the way the scalar
+    max/min calls do.
+    """
+    cols = {name: np.asarray(features.get(name, default), dtype=np.float64) for name, default in HEURISTIC_DEFAULTS.items()}
+
+    score = np.zeros(np.broadcast(*cols.values()).shape)
+    score += np.fmax(0.0, 1.0 - np.abs(cols["temp_mean_c"] - 26.0) / 12.0) * 0.25
+    score += np.fmax(0.0, 1.0 - np.abs(cols["rainfall_mm"] - 120.0) / 200.0) * 0.25
+    score += np.fmax(0.0, 1.0 - np.abs(cols["soil_ph"] - 6.8) / 2.0) * 0.2
+    score += np.fmax(0.0, 1.0 - np.abs(cols["soil_n"] - 220.0) / 220.0) * 0.1
+    score += np.fmax(0.0, 1.0 - np.abs(cols["soil_p"] - 18.0) / 18.0) * 0.1
+    score += np.fmax(0.0, 1.0 - np.abs(cols["soil_k"] - 220.0) / 220.0) * 0.05
+    score += np.fmax(0.0, np.fmin(1.0, cols["organic_carbon"] / 1.2)) * 0.05
+
+    return 5.0 + score * 15.0
+
+
 def predict_yield(
     *,
     features: dict[str, float],
@@ -55,33 +190,14 @@ def predict_yield(
     )
 
     if model_path.exists():
-        model = joblib.load(model_path)
+        model = MODEL_CACHE.get(model_path, "yield")
         y = model.predict(x)[0]
         y = float(y)
         if output == "numeric":
             return YieldPrediction(label="Predicted yield", value=y, units="tons/acre", note=None)
         return YieldPrediction(label=_bucketize(y), value=y, units="tons/acre", note=None)
 
-    # Heuristic baseline: penalize extreme rainfall, reward balanced NPK + near-neutral pH
-    temp = features.get("temp_mean_c", 28.0)
-    rain = features.get("rainfall_mm", 100.0)
-    ph = features.get("soil_ph", 6.8)
-    n = features.get("soil_n", 200.0)
-    p = features.get("soil_p", 15.0)
-    k = features.get("soil_k", 200.0)
-    oc = features.get("organic_carbon", 0.7)
-
-    score = 0.0
-    score += max(0.0, 1.0 - abs(temp - 26.0) / 12.0) * 0.25
-    score += max(0.0, 1.0 - abs(rain - 120.0) / 200.0) * 0.25
-    score += max(0.0, 1.0 - abs(ph - 6.8) / 2.0) * 0.2
-    score += max(0.0, 1.0 - abs(n - 220.0) / 220.0) * 0.1
-    score += max(0.0, 1.0 - abs(p - 18.0) / 18.0) * 0.1
-    score += max(0.0, 1.0 - abs(k - 220.0) / 220.0) * 0.05
-    score += max(0.0, min(1.0, oc / 1.2)) * 0.05
-
-    # Map [0,1] score to a pseudo numeric yield (e.g., tons/acre placeholder)
-    pseudo_yield = 5.0 + score * 15.0
+    pseudo_yield = heuristic_yield(features)
     label = _bucketize(pseudo_yield) if output != "numeric" else "Heuristic yield"
 
     return YieldPrediction(